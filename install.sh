@@ -1,10 +1,7 @@
 #!/bin/bash
 
-# Install mujoco binaries in the home directory
-wget https://mujoco.org/download/mujoco210-linux-x86_64.tar.gz && tar -xvzf mujoco210-linux-x86_64.tar.gz
-mkdir -p ~/.mujoco && mv mujoco210 ~/.mujoco/mujoco210
-rm -r mujoco210-linux-x86_64.tar.gz
+# Install the python packages (the mujoco bindings include the MuJoCo library)
+pip install -r requirements.txt
 
-# Install necessaury packages for mujoco-py installation:
-sudo apt install libosmesa6-dev libgl1-mesa-glx libglfw3
-sudo apt install patchelf
+# Install the packages for the interactive viewer and offscreen rendering:
+sudo apt install libglfw3 libgl1 libosmesa6-dev
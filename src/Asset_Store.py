@@ -0,0 +1,231 @@
+import os
+import json
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from termcolor import colored
+from src.utils import file_hash, bytes_to_mb, link_or_copy_atomic, is_tmp_file
+
+@dataclass
+class Asset_Store:
+    # Neccesary inputs
+    # /
+
+    # Optional inputs
+    store_dir:  str = "cache/assets/"   # Should be on the same file system as the asset and output folders (otherwise files are copied)
+
+    # Public variables, not to be set by user
+    n_unchanged:    int = field(init=False, default=0) # Files that already were the stored file (or identical to it)
+    n_linked:       int = field(init=False, default=0)
+    n_cloned:       int = field(init=False, default=0)
+    n_copied:       int = field(init=False, default=0)
+    copied_bytes:   int = field(init=False, default=0) # Bytes actually written in this run
+
+    # Internal variables
+    _index:     Dict[str, Dict] = field(init=False, default_factory=dict) # Absolute path -> size, modification time, inode and content hash
+
+    def __post_init__(self):
+        os.makedirs(os.path.join(self.store_dir, "blobs"), exist_ok=True)
+
+        if os.path.isfile(self._index_path):
+            with open(self._index_path, 'r') as index_file:
+                self._index = json.load(index_file)
+
+    @property
+    def _index_path(self) -> str:
+        '''
+        The path of the store index file.
+        '''
+        return os.path.join(self.store_dir, "index.json")
+
+    def blob_path(self, content_hash: str) -> str:
+        '''
+        Get the path of a stored file.
+
+        Args:
+            content_hash (str): The content hash of the file.
+
+        Returns:
+            str: The path of the blob.
+        '''
+        return os.path.join(self.store_dir, "blobs", content_hash[:2], content_hash)
+
+    def file_hash(self, filepath: str) -> str:
+        '''
+        Get the content hash of a file, reusing the stored hash if its size, modification time and inode did not change.
+
+        Args:
+            filepath (str): The path to the file.
+
+        Returns:
+            str: The content hash.
+        '''
+        filepath = os.path.abspath(filepath)
+        file_stat = os.stat(filepath)
+        entry = self._index.get(filepath)
+        if entry is None or (entry["size"], entry["mtime_ns"], entry["ino"]) != (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino):
+            entry = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "ino": file_stat.st_ino, "hash": file_hash(filepath)}
+            self._index[filepath] = entry
+        return entry["hash"]
+
+    def add(self, filepath: str, deduplicate: bool = True) -> str:
+        '''
+        Add a file to the store. The blob is a hard link to the file, so no data is copied and the file itself is left as it is
+        (its permissions are shared with the blob, so they are not changed).
+
+        Args:
+            filepath (str):     The path to the file.
+            deduplicate (bool): Replace the file by a link to the blob if the store already holds its content under another inode.
+
+        Returns:
+            str: The content hash of the file.
+        '''
+        content_hash = self.file_hash(filepath)
+        blob = self.blob_path(content_hash)
+        if not os.path.isfile(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(filepath, blob)
+            except OSError:
+                return content_hash # The store is on another file system, files are copied instead
+        elif deduplicate and not os.path.samefile(filepath, blob):
+            self._place(blob, filepath, content_hash)
+        return content_hash
+
+    def add_folder(self, folder: str, extensions: Tuple[str, ...] = (".stl", ".msh")) -> int:
+        '''
+        Add all files of a folder (e.g. an export folder) to the store and replace duplicates by links into it.
+        This rewrites the files of the folder, so it is only done on request (see the command at the end of this file).
+
+        Args:
+            folder (str):               The folder.
+            extensions (Tuple[str]):    The (lower case) extensions of the files to add.
+
+        Returns:
+            int: The number of files in the folder that are stored.
+        '''
+        n_files = 0
+        for root, _, files in os.walk(folder):
+            for file in files:
+                if file.lower().endswith(extensions) and not is_tmp_file(file):
+                    self.add(os.path.join(root, file))
+                    n_files += 1
+        return n_files
+
+    def copy_files(self, files: List[Tuple[str, str]]) -> Dict[str, int]:
+        '''
+        Copy files by linking the destinations to the stored content of the sources. Destinations that already hold
+        the same content are skipped, so that only new content is ever written.
+
+        Args:
+            files (List[Tuple[str, str]]): (source, destination) paths.
+
+        Returns:
+            Dict[str, int]: The number of destinations that were "unchanged", "linked", "cloned" (reflinked) or "copied".
+        '''
+        results = {"unchanged": 0, "linked": 0, "cloned": 0, "copied": 0}
+        for src, dst in files:
+            if os.path.isfile(dst) and os.path.samefile(src, dst):
+                result = "unchanged"
+            else:
+                content_hash = self.add(src, deduplicate=False) # The source folder is never rewritten
+                blob = self.blob_path(content_hash)
+                stored = os.path.isfile(blob) # False if the store is on another file system
+                if os.path.isfile(dst) and self.file_hash(dst) == content_hash and (not stored or os.path.samefile(dst, blob)):
+                    result = "unchanged"
+                else:
+                    result = self._place(blob if stored else src, dst, content_hash)
+            results[result] += 1
+        self.n_unchanged += results["unchanged"]
+        return results
+
+    def prune(self) -> int:
+        '''
+        Remove blobs that no file links to anymore (e.g. of deleted export folders or replaced meshes).
+
+        Returns:
+            int: The number of bytes freed.
+        '''
+        freed = 0
+        for blob in self._blobs():
+            blob_stat = os.stat(blob)
+            if blob_stat.st_nlink == 1:
+                os.remove(blob)
+                freed += blob_stat.st_size
+        return freed
+
+    def save(self):
+        '''
+        Remove unreferenced blobs and write the store index to disk.
+        '''
+        self.prune()
+        # Forget hashes of files that no longer exist
+        self._index = {filepath: entry for filepath, entry in self._index.items() if os.path.isfile(filepath)}
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=self.store_dir)
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump(self._index, index_file, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def usage(self) -> Tuple[int, int]:
+        '''
+        Get the disk usage of the stored files and the size all links to them would take as separate copies.
+
+        Returns:
+            Tuple[int, int]: The stored and the referenced size in bytes.
+        '''
+        stored = 0
+        referenced = 0
+        for blob in self._blobs():
+            blob_stat = os.stat(blob)
+            stored += blob_stat.st_size
+            referenced += blob_stat.st_size * (blob_stat.st_nlink - 1)
+        return stored, referenced
+
+    def print_summary(self):
+        '''
+        Print the files written in this run and the space saved by the store.
+        '''
+        stored, referenced = self.usage()
+        print(colored("Asset store", "cyan") + f": {self.n_unchanged} unchanged, {self.n_linked} linked, {self.n_cloned} cloned, {self.n_copied} copied ({bytes_to_mb(self.copied_bytes):.2f} MB written), "
+              f"{bytes_to_mb(stored):.2f} MB stored for {bytes_to_mb(referenced):.2f} MB of files ({self.store_dir})")
+
+    def _blobs(self) -> List[str]:
+        '''
+        The paths of all stored blobs.
+        '''
+        blob_dir = os.path.join(self.store_dir, "blobs")
+        return [os.path.join(root, file) for root, _, files in os.walk(blob_dir) for file in files]
+
+    def _place(self, src: str, dst: str, content_hash: str) -> str:
+        '''
+        Replace 'dst' by a hard link to 'src', a reflink or a plain copy (see 'link_or_copy_atomic') and count it.
+
+        Args:
+            src (str):          The file with the content (usually a blob).
+            dst (str):          The file to replace.
+            content_hash (str): The content hash of 'src' (stored for 'dst', so that it is not hashed again).
+
+        Returns:
+            str: "linked", "cloned" or "copied".
+        '''
+        result = link_or_copy_atomic(src, dst)
+        if result == "linked":
+            self.n_linked += 1
+        elif result == "cloned":
+            self.n_cloned += 1
+        else:
+            self.n_copied += 1
+            self.copied_bytes += os.path.getsize(dst)
+        dst_stat = os.stat(dst)
+        self._index[os.path.abspath(dst)] = {"size": dst_stat.st_size, "mtime_ns": dst_stat.st_mtime_ns, "ino": dst_stat.st_ino, "hash": content_hash}
+        return result
+
+if __name__ == "__main__":
+    # Deduplicate export folders explicitly, e.g. python -m src.Asset_Store assets/fusion_export_*
+    store = Asset_Store()
+    for folder in sys.argv[1:] if len(sys.argv) > 1 else ["assets/"]:
+        print(colored("Asset store", "cyan") + f": {store.add_folder(folder)} file(s) of {folder} stored")
+    store.save()
+    store.print_summary()
@@ -0,0 +1,444 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+import numpy as np
+import trimesh
+import mujoco
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+from contextlib import redirect_stdout, nullcontext
+from termcolor import colored
+from src.Fusion_Model import Fusion_Model
+from src.Fusion_to_Mujoco import Fusion_to_Mujoco
+from src.Mujoco_XML import Mujoco_XML
+from src.Asset_Store import Asset_Store
+from src.STL_Mesh import STL_Mesh
+from src.utils import reduce_mesh, find_latest_folder, file_hash, bytes_to_mb
+
+def time_function(function: Callable, n_repeats: int = 5, setup: Callable = None) -> Tuple[Dict[str, float], object]:
+    '''
+    Time a function over several runs.
+
+    Args:
+        function (Callable):    The function to time (without arguments).
+        n_repeats (int):        The number of timed runs.
+        setup (Callable):       Called before every run, outside of the timing (e.g. to create a fresh output folder).
+
+    Returns:
+        Tuple[Dict[str, float], object]: The 'median', 'min' and 'max' seconds and the number of runs 'n', and the result of the last run.
+    '''
+    times = []
+    result = None
+    for _ in range(n_repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {"median": float(np.median(times)), "min": float(np.min(times)), "max": float(np.max(times)), "n": n_repeats}, result
+
+def clear_mesh_cache():
+    '''
+    Clear Mujoco's in-process asset cache, so that the next compile processes all meshes again (Mujoco >= 3.2).
+    '''
+    if hasattr(mujoco, "mj_getCache"):
+        mujoco.mj_clearCache(mujoco.mj_getCache())
+
+def step_rate(model: mujoco.MjModel, n_steps: int = 2000, seed: int = 0) -> Dict[str, float]:
+    '''
+    Measure the physics steps per second of a model under random controls (uniform in the control ranges, seeded).
+
+    Args:
+        model (mujoco.MjModel): The compiled model.
+        n_steps (int):          The number of timed steps (after 10% warm-up steps).
+        seed (int):             The seed of the controls.
+
+    Returns:
+        Dict[str, float]: 'steps_per_second', 'mean_contacts' and 'triangles' (of all meshes).
+    '''
+    data = mujoco.MjData(model)
+    rng = np.random.default_rng(seed)
+    low, high = model.actuator_ctrlrange[:, 0], model.actuator_ctrlrange[:, 1]
+    controls = rng.uniform(low, high, size=(n_steps // 10 + n_steps, model.nu))
+    for ctrl in controls[:n_steps // 10]:
+        data.ctrl[:] = ctrl
+        mujoco.mj_step(model, data)
+
+    n_contacts = 0
+    start = time.perf_counter()
+    for ctrl in controls[n_steps // 10:]:
+        data.ctrl[:] = ctrl
+        mujoco.mj_step(model, data)
+        n_contacts += data.ncon
+    elapsed = time.perf_counter() - start
+    return {"steps_per_second": n_steps / elapsed, "mean_contacts": n_contacts / n_steps, "triangles": int(model.mesh_facenum.sum())}
+
+def make_synthetic_export(folder: str, n_bodies: int, chain_length: int = 3, subdivisions: int = 4, timestamp: str = "2000-01-01_00-00-00") -> str:
+    '''
+    Write a synthetic Fusion export (fusion_info.json and one STL file per component, in the format of the Fusion script):
+    a base with fingers of 'chain_length' hinged links, each link an icosphere.
+
+    Args:
+        folder (str):       The asset folder the export folder is created in.
+        n_bodies (int):     The number of bodies (the base and the links).
+        chain_length (int): The number of links per finger.
+        subdivisions (int): The icosphere subdivisions of every mesh (4 -> 5120 triangles, 256 kB).
+        timestamp (str):    The time stamp in the name of the export folder.
+
+    Returns:
+        str: The path to the export folder.
+    '''
+    export_folder = os.path.join(folder, f"fusion_export_{timestamp}")
+    os.makedirs(export_folder, exist_ok=True)
+    sphere = trimesh.creation.icosphere(subdivisions=subdivisions, radius=8.0) # STL files are in mm
+
+    identity = [1.0, 0.0, 0.0, 0.0]
+    components = [{"component": {"name": "Base", "id": "b0000000"}, "parent": {"id": "Root"}, "transformation": {"quaternion": identity, "translation": [0.0, 0.0, 0.0]},
+                   "stl_file": "Base.stl", "is_base_component": True}]
+    joints = []
+    positions = {"b0000000": np.zeros(3)} # Absolute positions in m (joint origins are absolute)
+    n_fingers = int(np.ceil((n_bodies - 1) / chain_length))
+    for index in range(1, n_bodies):
+        finger, link = divmod(index - 1, chain_length)
+        component_id = f"{index:08x}"
+        parent_id = "b0000000" if link == 0 else f"{index - 1:08x}"
+        # Fingers are spread along x, links are stacked along z (relative to the parent)
+        translation = np.array([0.02 * (finger - (n_fingers - 1) / 2), 0.0, 0.02]) if link == 0 else np.array([0.0, 0.0, 0.02])
+        positions[component_id] = positions[parent_id] + translation
+        name = f"F{finger}-L{link}"
+        components.append({"component": {"name": name, "id": component_id}, "parent": {"id": parent_id}, "transformation": {"quaternion": identity, "translation": translation.tolist()},
+                           "stl_file": f"{name}.stl"})
+        joints.append({"component_base": {"id": parent_id, "name": "Base" if link == 0 else f"F{finger}-L{link - 1}"}, "component_rotating": {"id": component_id, "name": name},
+                       "transformation": {"joint_origin": (positions[component_id] - [0.0, 0.0, 0.01]).tolist(), "joint_axis": [1.0, 0.0, 0.0], "joint_range": [-0.5, 1.2]}})
+
+    for component in components:
+        sphere.export(os.path.join(export_folder, component["stl_file"]))
+    with open(os.path.join(export_folder, "fusion_info.json"), 'w') as json_file:
+        json.dump({"components": components, "joints": joints, "desired_component_names": [component["component"]["name"] for component in components]}, json_file)
+    return export_folder
+
+@dataclass
+class Benchmark_Suite:
+    # Neccesary inputs
+    # /
+
+    # Optional inputs
+    asset_folder:           str         = "assets/"                         # The bundled exports ('fusion_export_*' folders) are benchmarked one by one
+    model_xml:              str         = "output/DexterousDynamos.xml"     # The generated hand, stepped at every mesh-reduction level (skipped if missing)
+    synthetic_bodies:       List[int]   = field(default_factory=lambda: [16, 64, 256]) # Number of bodies of the synthetic assemblies
+    synthetic_subdivisions: int         = 4                                 # Icosphere subdivisions of the synthetic meshes
+    mesh_sizes:             List[int]   = field(default_factory=lambda: [2, 3, 4, 5, 6]) # Icosphere subdivisions for 'reduce_mesh' on synthetic meshes (320 to 81920 triangles)
+    reduction_levels:       List[float] = field(default_factory=lambda: [None, 5e5, 1e5]) # 'max_stl_size' (bytes) of the step-rate runs, None = unreduced
+    reduction_factor:       float       = 0.25  # Factor of the 'reduce_mesh' timings
+    n_repeats:              int         = 5     # Timed runs of the fast stages (the median is reported)
+    n_steps:                int         = 2000  # Physics steps per step-rate measurement
+    seed:                   int         = 0
+    verbose:                bool        = False # Show the output of the pipeline (otherwise only the benchmark results are printed)
+
+    # Public variables, not to be set by user
+    results:        Dict = field(init=False, default_factory=dict) # See 'run'
+
+    # Internal variables
+    _workspace:     str = field(init=False, default=None) # Temporary folder of all generated files
+
+    def run(self, output_path: str = None) -> Dict:
+        '''
+        Run all benchmarks in a temporary workspace (the asset folder is never changed).
+
+        Args:
+            output_path (str): The JSON file the results are written to (optional).
+
+        Returns:
+            Dict: 'meta' (versions, machine), 'settings', 'cases' (per bundled export, synthetic assembly and the generated hand: sizes,
+                  stage timings, step rates per reduction level, the 'budget_restore' triangle counts and errors) and 'reduce_mesh' (timings per mesh).
+        '''
+        self.results = {"meta": self._meta(), "settings": {name: getattr(self, name) for name in ["synthetic_bodies", "synthetic_subdivisions", "mesh_sizes", "reduction_levels",
+                                                                                                  "reduction_factor", "n_repeats", "n_steps", "seed"]},
+                        "cases": {}, "reduce_mesh": []}
+        self._workspace = tempfile.mkdtemp(prefix="benchmark_")
+        try:
+            stl_files = {} # Content hash -> STL file, so that meshes shared by several exports are reduced once
+            if os.path.isdir(self.asset_folder):
+                for export_name in sorted(os.listdir(self.asset_folder)):
+                    export_folder = os.path.join(self.asset_folder, export_name)
+                    if not (os.path.isdir(export_folder) and export_name.startswith("fusion_export_")):
+                        continue
+                    case_folder = os.path.join(self._workspace, export_name, "assets")
+                    # Real copies, not links: nothing done in the workspace (e.g. read-only store blobs) may change the bundled files
+                    shutil.copytree(export_folder, os.path.join(case_folder, export_name))
+                    self._run_case(export_name, case_folder, "bundled", reduction_levels=[None])
+                    for file in sorted(os.listdir(export_folder)):
+                        if file.lower().endswith(".stl"):
+                            stl_files.setdefault(file_hash(os.path.join(export_folder, file)), os.path.join(export_folder, file))
+
+            for n_bodies in self.synthetic_bodies:
+                case_folder = os.path.join(self._workspace, f"synthetic_{n_bodies}", "assets")
+                make_synthetic_export(case_folder, n_bodies, subdivisions=self.synthetic_subdivisions)
+                self._run_case(f"synthetic_{n_bodies}", case_folder, "synthetic", reduction_levels=self.reduction_levels)
+
+            if os.path.isfile(self.model_xml):
+                self._run_model_case("hand", self.model_xml)
+
+            for subdivisions in self.mesh_sizes:
+                stl_path = os.path.join(self._workspace, "meshes", f"icosphere_{subdivisions}.stl")
+                os.makedirs(os.path.dirname(stl_path), exist_ok=True)
+                trimesh.creation.icosphere(subdivisions=subdivisions, radius=8.0).export(stl_path)
+                self._time_reduce_mesh(stl_path, "synthetic")
+            for stl_path in sorted(stl_files.values(), key=os.path.getsize):
+                self._time_reduce_mesh(stl_path, "bundled")
+        finally:
+            shutil.rmtree(self._workspace, ignore_errors=True)
+            self._workspace = None
+
+        if output_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            with open(output_path, 'w') as json_file:
+                json.dump(self.results, json_file, indent=1)
+            print(colored("Benchmark", "cyan") + f": results written to {output_path}")
+        return self.results
+
+    def _meta(self) -> Dict:
+        '''
+        The versions and machine the benchmark runs on.
+        '''
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit, "python": platform.python_version(), "mujoco": mujoco.__version__,
+                "numpy": np.__version__, "trimesh": trimesh.__version__, "platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count()}
+
+    def _quiet(self):
+        '''
+        Context that hides the output of the pipeline (unless 'verbose').
+        '''
+        return nullcontext() if self.verbose else redirect_stdout(io.StringIO())
+
+    def _converter(self, case_folder: str, output_dir: str, **kwargs) -> Fusion_to_Mujoco:
+        '''
+        Convert an export without any of the caches, so that every stage does its full work.
+        '''
+        with self._quiet():
+            return Fusion_to_Mujoco(asset_folder=case_folder, output_dir=output_dir, use_mesh_cache=False, use_model_cache=False, use_asset_store=False, **kwargs)
+
+    def _run_case(self, name: str, case_folder: str, source: str, reduction_levels: List[float]):
+        '''
+        Benchmark the pipeline stages of one export, and the step rate of the model at the given reduction levels.
+        '''
+        case = {"source": source, "stages": {}, "step": [], "errors": {}}
+        self.results["cases"][name] = case
+        stages = case["stages"]
+        export_folder = find_latest_folder(case_folder)
+        json_path = os.path.join(export_folder, "fusion_info.json")
+
+        stages["parse"], fusion_model = time_function(lambda: Fusion_Model(json_file_path=json_path), self.n_repeats)
+        stages["transforms"], _ = time_function(fusion_model._calculate_transforms, self.n_repeats)
+
+        output_dir = os.path.join(os.path.dirname(case_folder), "output")
+        stages["convert"], converter = time_function(lambda: self._converter(case_folder, output_dir), 1)
+        def build_xml() -> str:
+            converter._env = Mujoco_XML(model_name=converter.model_name)
+            converter._add_assets()
+            converter._recursive_add_component(converter._fusion_data.joint_components[0])
+            return converter._env.model_str
+        stages["xml_build"], model_str = time_function(build_xml, self.n_repeats)
+
+        stl_paths = [os.path.join(export_folder, file) for file in os.listdir(export_folder) if file.lower().endswith(".stl")]
+        case.update({"n_components": len(fusion_model.components) - 1, "n_bodies": len(fusion_model.joint_components), "n_joints": len(fusion_model._json_data["joints"]),
+                     "n_meshes": len(stl_paths), "mesh_bytes": sum(os.path.getsize(path) for path in stl_paths), "triangles": sum(STL_Mesh(path).n_triangles for path in stl_paths),
+                     "xml_bytes": len(model_str.encode())})
+
+        # Copying the assets: plain copies (the pipeline without store) and links via the asset store ('use_asset_store'), always to a new folder
+        copy_folders = []
+        def new_copy_folder():
+            copy_folders.append(os.path.join(output_dir, f"copy_{len(copy_folders)}"))
+        with self._quiet():
+            stages["copy_assets"], _ = time_function(lambda: converter.copy_assets(output_folder=copy_folders[-1]), self.n_repeats, new_copy_folder)
+            converter._asset_store = Asset_Store(store_dir=os.path.join(output_dir, "store"))
+            stages["copy_assets_store"], _ = time_function(lambda: converter.copy_assets(output_folder=copy_folders[-1]), self.n_repeats, new_copy_folder)
+            converter._asset_store = None
+
+        # Compiling: cold (Mujoco's mesh cache cleared, all meshes are processed) and warm (meshes from the cache)
+        assets, _ = converter._env.asset_dict()
+        compile_model = lambda: mujoco.MjModel.from_xml_string(model_str, assets)
+        try:
+            stages["compile_cold"], model = time_function(compile_model, self.n_repeats, clear_mesh_cache)
+            stages["compile_warm"], model = time_function(compile_model, self.n_repeats)
+        except Exception as error:
+            case["errors"]["compile"] = str(error).strip()
+            return
+        case["n_geoms"] = model.ngeom
+
+        for level in reduction_levels:
+            if level is None:
+                case["step"].append({"max_stl_size": None, "convert_seconds": stages["convert"]["median"], **step_rate(model, self.n_steps, self.seed)})
+                continue
+            level_folder = os.path.join(self._workspace, f"{name}_{int(level)}", "assets")
+            shutil.copytree(case_folder, level_folder)
+            try:
+                start = time.perf_counter()
+                level_converter = self._converter(level_folder, os.path.join(os.path.dirname(level_folder), "output"), reduce_stls=True, max_stl_size=level)
+                convert_seconds = time.perf_counter() - start
+                case["step"].append({"max_stl_size": level, "convert_seconds": convert_seconds, **step_rate(level_converter._env.compile_model(), self.n_steps, self.seed)})
+            except Exception as error:
+                case["errors"][f"step_{int(level)}"] = str(error).strip()
+
+        try:
+            self._check_budget_restore(name, case_folder, int(model.mesh_facenum.sum()))
+        except Exception as error:
+            case["errors"]["budget_restore"] = str(error).strip()
+
+    def _check_budget_restore(self, name: str, case_folder: str, n_triangles: int):
+        '''
+        Check that a larger triangle budget restores the meshes of a reduced model: convert with half of the triangles, then again into the same
+        output folder with a budget above all triangles, and compare the triangles of the exported model with the unreduced one ('n_triangles').
+        '''
+        case = self.results["cases"][name]
+        check_folder = os.path.join(self._workspace, f"{name}_restore", "assets")
+        shutil.copytree(case_folder, check_folder)
+        output_dir = os.path.join(os.path.dirname(check_folder), "output")
+        triangles = []
+        for budget in [n_triangles // 2, 2 * n_triangles]:
+            converter = self._converter(check_folder, output_dir, reduce_stls=True, triangle_budget=budget)
+            with self._quiet():
+                converter.copy_assets()
+                converter.export_xml()
+            triangles.append(int(mujoco.MjModel.from_xml_path(os.path.join(output_dir, converter.model_name + ".xml")).mesh_facenum.sum()))
+        case["budget_restore"] = {"original": n_triangles, "reduced": triangles[0], "restored": triangles[1]}
+        if triangles[1] != n_triangles:
+            case["errors"]["budget_restore"] = f"A larger triangle budget left {triangles[1]} of {n_triangles} triangles after a reduction to {triangles[0]}"
+
+    def _run_model_case(self, name: str, xml_path: str):
+        '''
+        Benchmark compiling and stepping an exported model, with its meshes reduced to every reduction level.
+        '''
+        case = {"source": os.path.relpath(xml_path), "stages": {}, "step": [], "errors": {}}
+        self.results["cases"][name] = case
+        xml_dir = os.path.dirname(os.path.abspath(xml_path))
+
+        for level in self.reduction_levels:
+            # Reduce copies of the meshes like 'Fusion_to_Mujoco._reduce_stls' (every file above 'max_stl_size'), the copied XML refers to them
+            level_dir = os.path.join(self._workspace, f"{name}_{'full' if level is None else int(level)}")
+            os.makedirs(level_dir)
+            root = ET.parse(xml_path).getroot()
+            for index, element in enumerate(root.iter("mesh")):
+                if element.get("file") is None:
+                    continue
+                src = os.path.join(xml_dir, element.get("file")) # Absolute paths stay absolute
+                dst = os.path.join(level_dir, f"{index}_{os.path.basename(src)}")
+                if level is not None and os.path.getsize(src) > level:
+                    reduce_mesh(src, dst, reduction_factor=level / os.path.getsize(src))
+                else:
+                    shutil.copyfile(src, dst)
+                element.set("file", os.path.basename(dst))
+            level_xml = os.path.join(level_dir, os.path.basename(xml_path))
+            ET.ElementTree(root).write(level_xml)
+            try:
+                if level is None:
+                    case["stages"]["compile_cold"], model = time_function(lambda: mujoco.MjModel.from_xml_path(level_xml), self.n_repeats, clear_mesh_cache)
+                    case["stages"]["compile_warm"], model = time_function(lambda: mujoco.MjModel.from_xml_path(level_xml), self.n_repeats)
+                    case.update({"n_bodies": model.nbody - 1, "n_joints": model.njnt, "n_geoms": model.ngeom, "n_meshes": model.nmesh})
+                else:
+                    model = mujoco.MjModel.from_xml_path(level_xml)
+                case["step"].append({"max_stl_size": level, **step_rate(model, self.n_steps, self.seed)})
+            except Exception as error:
+                case["errors"]["compile" if level is None else f"step_{int(level)}"] = str(error).strip()
+
+    def _time_reduce_mesh(self, stl_path: str, source: str):
+        '''
+        Time 'reduce_mesh' on one STL file (once, as it is slow for large meshes).
+        '''
+        output_path = os.path.join(self._workspace, "reduced.stl")
+        stages, _ = time_function(lambda: reduce_mesh(stl_path, output_path, reduction_factor=self.reduction_factor), 1)
+        self.results["reduce_mesh"].append({"file": os.path.basename(stl_path), "source": source, "bytes": os.path.getsize(stl_path), "triangles": STL_Mesh(stl_path).n_triangles,
+                                            "reduced_triangles": STL_Mesh(output_path).n_triangles, "seconds": stages["median"]})
+
+    def print_summary(self):
+        '''
+        Print the stage timings and step rates of all cases, and the 'reduce_mesh' timings.
+        '''
+        stage_names = ["parse", "transforms", "xml_build", "copy_assets", "copy_assets_store", "compile_cold", "compile_warm"]
+        print(colored("Benchmark", "cyan") + f": median of {self.n_repeats} run(s) in ms (mujoco {self.results['meta']['mujoco']}, {self.results['meta']['cpu_count']} CPU(s))")
+        print(f"  {'case':<36}{'bodies':>7}" + "".join(f"{name:>19}" for name in stage_names))
+        for name, case in self.results["cases"].items():
+            timings = "".join(f"{1000 * case['stages'][stage]['median']:>19.2f}" if stage in case["stages"] else f"{'-':>19}" for stage in stage_names)
+            print(f"  {name:<36}{case.get('n_bodies', '-'):>7}" + timings)
+        for name, case in self.results["cases"].items():
+            for step in case["step"]:
+                level = "unreduced" if step["max_stl_size"] is None else f"max {bytes_to_mb(step['max_stl_size']):.2f} MB"
+                print(f"  {name} ({level}): {step['steps_per_second']:.0f} steps/s, {step['triangles']} triangles, {step['mean_contacts']:.1f} contacts")
+            for stage, error in case["errors"].items():
+                print(colored("WARNING", "yellow") + f": {name} {stage} failed: {error.splitlines()[0]}")
+        if len(self.results["reduce_mesh"]) > 0:
+            entries = sorted(self.results["reduce_mesh"], key=lambda entry: entry["triangles"])
+            per_triangle = np.median([entry["seconds"] / entry["triangles"] for entry in entries])
+            print(f"  reduce_mesh (factor {self.reduction_factor}): {len(entries)} meshes of {entries[0]['triangles']} to {entries[-1]['triangles']} triangles, "
+                  f"{1e6 * per_triangle:.2f} ms per 1000 triangles (median), {1000 * entries[-1]['seconds']:.0f} ms for the largest")
+
+def compare_results(results: Dict, previous: Dict, threshold: float = 0.1) -> List[str]:
+    '''
+    Compare benchmark results with an earlier run (e.g. of the last release) and print the changes.
+
+    Args:
+        results (Dict):     The results of 'Benchmark_Suite.run'.
+        previous (Dict):    The earlier results.
+        threshold (float):  Relative change above which a stage counts as a regression (slower, or fewer steps per second).
+
+    Returns:
+        List[str]: The regressions.
+    '''
+    regressions = []
+    print(colored("Comparison", "cyan") + f" with {previous['meta'].get('commit') or 'unknown commit'} ({previous['meta']['timestamp']}):")
+    for name, case in results["cases"].items():
+        previous_case = previous["cases"].get(name)
+        if previous_case is None:
+            continue
+        changes = [] # (label, relative slowdown)
+        for stage, timing in case["stages"].items():
+            if stage in previous_case["stages"] and previous_case["stages"][stage]["median"] > 0:
+                changes.append((stage, timing["median"] / previous_case["stages"][stage]["median"] - 1))
+        previous_steps = {step["max_stl_size"]: step["steps_per_second"] for step in previous_case["step"]}
+        for step in case["step"]:
+            if previous_steps.get(step["max_stl_size"], 0) > 0:
+                changes.append(("step " + ("unreduced" if step["max_stl_size"] is None else f"max_stl_size {step['max_stl_size']:.0f}"), previous_steps[step["max_stl_size"]] / step["steps_per_second"] - 1))
+        for label, slowdown in changes:
+            text = f"{name} {label}: {100 * slowdown:+.0f}%"
+            if slowdown > threshold:
+                regressions.append(text)
+                print("  " + colored(text + " (slower)", "yellow"))
+            elif slowdown < -threshold:
+                print("  " + colored(text + " (faster)", "green"))
+    if len(regressions) == 0:
+        print(f"  No regressions above {100 * threshold:.0f}%")
+    return regressions
+
+if __name__ == "__main__":
+    # E.g. python -m src.Benchmark_Suite --output benchmarks/results.json --compare benchmarks/last_release.json
+    parser = argparse.ArgumentParser(description="Benchmark the Fusion to Mujoco pipeline and the physics step rate.")
+    parser.add_argument("--output", default=f"benchmarks/benchmark_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json", help="JSON file of the results")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as regression")
+    parser.add_argument("--bodies", type=int, nargs="*", default=[16, 64, 256], help="Number of bodies of the synthetic assemblies")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    suite = Benchmark_Suite(synthetic_bodies=args.bodies, n_repeats=args.repeats, n_steps=args.steps, verbose=args.verbose)
+    results = suite.run(args.output)
+    suite.print_summary()
+    # Meshes that stay reduced after a larger budget are a regression without any earlier run
+    regressions = [name for name, case in results["cases"].items() if "budget_restore" in case["errors"]]
+    if args.compare is not None:
+        with open(args.compare, 'r') as json_file:
+            regressions += compare_results(results, json.load(json_file), args.threshold)
+    sys.exit(1 if len(regressions) > 0 else 0)
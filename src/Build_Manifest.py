@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List
+from termcolor import colored
+from src.utils import file_hash, link_or_copy_atomic
+
+@dataclass
+class Build_Manifest:
+    # Neccesary inputs
+    filepath:       str = field() # The JSON file the state of the last build is kept in
+
+    # Public variables, not to be set by user
+    previous:       Dict = field(init=False, default_factory=dict) # State of the last build (empty if there was none)
+    current:        Dict = field(init=False, default_factory=dict) # State of this build
+    changes:        Dict[str, Dict[str, List[str]]] = field(init=False, default_factory=dict) # 'stls'/'components'/'joints' -> 'changed'/'added'/'removed' -> names
+    n_reused:       int  = field(init=False, default=0)
+    n_rebuilt:      int  = field(init=False, default=0)
+
+    # Internal variables
+    _outputs_by_hash:   Dict[str, List[str]] = field(init=False, default_factory=dict) # Content hash -> recorded output files
+
+    def __post_init__(self):
+        if os.path.isfile(self.filepath):
+            with open(self.filepath, 'r') as manifest_file:
+                self.previous = json.load(manifest_file)
+        for section in ["stls", "components", "joints", "artifacts", "sources", "outputs"]:
+            self.previous.setdefault(section, {})
+        # Derived files of the last build stay valid (they are checked by content before they are reused)
+        self.current = {"asset_folder": None, "stls": {}, "components": {}, "joints": {},
+                        "artifacts": {kind: dict(entries) for kind, entries in self.previous["artifacts"].items()},
+                        "sources": dict(self.previous["sources"]), "outputs": dict(self.previous["outputs"])}
+        for filepath, entry in self.current["outputs"].items():
+            self._outputs_by_hash.setdefault(entry["hash"], []).append(filepath)
+
+    def scan_export(self, asset_folder: str, json_data: Dict, stl_files: Dict[str, str]):
+        '''
+        Hash the STL files and JSON entries of an export folder and compare them to the last build.
+
+        Args:
+            asset_folder (str):         The export folder.
+            json_data (Dict):           The content of the Fusion JSON file.
+            stl_files (Dict[str, str]): Mesh name -> path to the STL file in the export folder.
+        '''
+        self.current["asset_folder"] = os.path.abspath(asset_folder)
+        for name, stl_filepath in sorted(stl_files.items()):
+            stl_hash = file_hash(stl_filepath)
+            # Files that were already processed in place resolve to the file they were built from
+            self.current["stls"][name] = self.current["sources"].get(stl_hash, stl_hash)
+        for item in json_data.get("components", []):
+            self.current["components"][f"{item['component']['name']}_{item['component']['id']}"] = self._entry_hash(item)
+        for item in json_data.get("joints", []):
+            self.current["joints"][f"{item['component_rotating']['name']}_{item['component_rotating']['id']}"] = self._entry_hash(item)
+
+        for section in ["stls", "components", "joints"]:
+            previous, current = self.previous[section], self.current[section]
+            self.changes[section] = {
+                "changed": sorted(name for name in current if name in previous and previous[name] != current[name]),
+                "added": sorted(name for name in current if name not in previous),
+                "removed": sorted(name for name in previous if name not in current),
+            }
+
+    def reuse(self, kind: str, name: str, input_hash: str, params: Dict, output_file: str) -> bool:
+        '''
+        Reuse a derived file (e.g. a reduced mesh) of the last build, if it was built from the same input with the same parameters.
+
+        Args:
+            kind (str):         The kind of derived file, e.g. "reduced", "msh" or "hull".
+            name (str):         The mesh name.
+            input_hash (str):   The content hash of the input file.
+            params (Dict):      The parameters the file is built with.
+            output_file (str):  The path the derived file should be at.
+
+        Returns:
+            bool: Whether the file was reused (and recorded). Otherwise it has to be built and recorded with 'record'.
+        '''
+        entry = self.previous["artifacts"].get(kind, {}).get(name)
+        if entry is None or entry["input"] != input_hash or entry["params"] != self._params(params):
+            return False
+        output_file = os.path.abspath(output_file)
+        if not self._is_file(output_file, entry["output"]):
+            if not self._is_file(entry["file"], entry["output"]):
+                return False
+            link_or_copy_atomic(entry["file"], output_file, link=False)
+        self.current["artifacts"].setdefault(kind, {})[name] = dict(entry, file=output_file)
+        self.n_reused += 1
+        return True
+
+    def record(self, kind: str, name: str, input_hash: str, params: Dict, output_file: str):
+        '''
+        Record a derived file that was built in this build.
+
+        Args:
+            kind (str):         The kind of derived file, e.g. "reduced", "msh" or "hull".
+            name (str):         The mesh name.
+            input_hash (str):   The content hash of the input file.
+            params (Dict):      The parameters the file was built with.
+            output_file (str):  The path of the derived file.
+        '''
+        output_hash = file_hash(output_file)
+        self.current["artifacts"].setdefault(kind, {})[name] = {"input": input_hash, "params": self._params(params), "output": output_hash, "file": os.path.abspath(output_file)}
+        if kind == "reduced":
+            self.current["sources"][output_hash] = input_hash
+        self.n_rebuilt += 1
+
+    def copy_if_changed(self, src: str, dst: str) -> str:
+        '''
+        Copy a file, unless the destination was written by an earlier build from identical content and is still unchanged.
+        Destinations that do not exist yet are hard linked to an identical output of an earlier build if possible (e.g. for a new export folder).
+
+        Args:
+            src (str):  The source file.
+            dst (str):  The destination file.
+
+        Returns:
+            str: "unchanged", "linked" or "copied".
+        '''
+        dst = os.path.abspath(dst)
+        src_hash = file_hash(src)
+        if self._is_output(dst, src_hash):
+            return "unchanged"
+
+        identical = next((filepath for filepath in self._outputs_by_hash.get(src_hash, []) if filepath != dst and self._is_output(filepath, src_hash)), None)
+        if identical is not None:
+            result = "linked" if link_or_copy_atomic(identical, dst) == "linked" else "copied"
+        else:
+            link_or_copy_atomic(src, dst, link=False)
+            result = "copied"
+        stat = os.stat(dst)
+        self.current["outputs"][dst] = {"hash": src_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self._outputs_by_hash.setdefault(src_hash, []).append(dst)
+        return result
+
+    def save(self):
+        '''
+        Write the state of this build to the manifest file.
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(self.filepath)))
+        with os.fdopen(fd, 'w') as manifest_file:
+            json.dump(self.current, manifest_file, indent=1)
+        os.replace(tmp_path, self.filepath)
+
+    def print_summary(self):
+        '''
+        Print the changes of the export folder compared to the last build.
+        '''
+        def describe(section: str) -> str:
+            counts = [f"{len(self.changes[section][change])} {change}" for change in ["changed", "added", "removed"]]
+            names = self.changes[section]["changed"] + self.changes[section]["added"] + self.changes[section]["removed"]
+            details = f" ({', '.join(names[:5])}{', ...' if len(names) > 5 else ''})" if len(names) > 0 else ""
+            return ", ".join(counts) + details
+
+        previous_folder = os.path.basename(self.previous["asset_folder"]) if self.previous.get("asset_folder") else "none"
+        print(colored("Incremental build", "cyan") + f" (previous export: {previous_folder}):")
+        print(f"  STL files:  {describe('stls')}, {len(self.current['stls']) - len(self.changes['stls']['changed']) - len(self.changes['stls']['added'])} unchanged")
+        print(f"  Components: {describe('components')}")
+        print(f"  Joints:     {describe('joints')}")
+        print(f"  Meshes:     {self.n_reused} reused, {self.n_rebuilt} rebuilt")
+
+    @staticmethod
+    def _entry_hash(entry: Dict) -> str:
+        '''
+        Hash a JSON entry independently of its key order.
+        '''
+        return hashlib.sha256(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _params(params: Dict) -> Dict:
+        '''
+        Normalize parameters for comparison (as they are stored in JSON).
+        '''
+        return json.loads(json.dumps({name: round(value, 12) if isinstance(value, float) else value for name, value in params.items()}, sort_keys=True))
+
+    def _is_output(self, filepath: str, expected_hash: str) -> bool:
+        '''
+        Check whether a recorded output file still exists unchanged (by size and modification time) with the expected content.
+        '''
+        entry = self.current["outputs"].get(filepath)
+        if entry is None or entry["hash"] != expected_hash or not os.path.isfile(filepath):
+            return False
+        stat = os.stat(filepath)
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+    @staticmethod
+    def _is_file(filepath: str, expected_hash: str) -> bool:
+        '''
+        Check whether a file exists and has the expected content.
+        '''
+        return os.path.isfile(filepath) and file_hash(filepath) == expected_hash
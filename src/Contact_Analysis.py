@@ -0,0 +1,139 @@
+import numpy as np
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple
+from itertools import combinations
+from pyquaternion import Quaternion
+from scipy.spatial import cKDTree
+from termcolor import colored
+from src.Fusion_Model import Fusion_Model
+
+@dataclass
+class Contact_Analysis:
+    # Neccesary inputs
+    fusion_model:       Fusion_Model                            = field()
+    bounding_spheres:   Dict[str, Tuple[np.ndarray, float]]     = field() # Body name -> (center in the body frame, radius), in m. Missing bodies may touch anything
+
+    # Optional inputs
+    margin:             float   = 0.001     # Distance (m) below which two bodies count as touching
+    n_samples:          int     = 7         # Samples per joint range (the sampling error is added to the distance threshold)
+    max_bits:           int     = 31        # Available contype/conaffinity bits (bit 0 is reserved for geoms outside of the model, e.g. a floor)
+
+    # Public variables, not to be set by user
+    candidate_pairs:    List[Tuple[str, str]]   = field(init=False, default_factory=list) # All body pairs, except parent/child pairs (already excluded)
+    possible_pairs:     List[Tuple[str, str]]   = field(init=False, default_factory=list) # Pairs that can come within 'margin' in some joint configuration
+    pruned_pairs:       List[Tuple[str, str]]   = field(init=False, default_factory=list) # Pairs that can never touch
+    contact_bits:       Dict[str, int]          = field(init=False, default_factory=dict) # Body name -> contype bits (conaffinity additionally has bit 0). Empty if 'max_bits' is not enough
+    n_bits:             int                     = field(init=False, default=0)
+
+    # Internal variables
+    _components:        Dict[str, Fusion_Model.Component]   = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self._components = {component.name: component for component in self.fusion_model.joint_components}
+        for component1, component2 in combinations(self.fusion_model.joint_components, 2):
+            if component1.parent is component2 or component2.parent is component1:
+                continue
+            pair = (component1.name, component2.name)
+            self.candidate_pairs.append(pair)
+            if self._can_touch(component1, component2):
+                self.possible_pairs.append(pair)
+            else:
+                self.pruned_pairs.append(pair)
+        self._assign_contact_bits()
+
+    def _ancestors(self, component: Fusion_Model.Component) -> List[Fusion_Model.Component]:
+        '''
+        The chain from a component up to the root component (both included).
+        '''
+        chain = [component]
+        while chain[-1].parent is not None:
+            chain.append(chain[-1].parent)
+        return chain
+
+    def _sweep(self, component: Fusion_Model.Component, ancestor: Fusion_Model.Component) -> Tuple[np.ndarray, float]:
+        '''
+        Sweep the joints between a component and one of its ancestors and collect the positions of the component's bounding sphere center.
+
+        Args:
+            component (Fusion_Model.Component): The component whose bounding sphere is swept.
+            ancestor (Fusion_Model.Component):  The ancestor in whose frame the positions are given (its own joint is not swept).
+
+        Returns:
+            Tuple[np.ndarray, float]: The (n, 3) sampled center positions in the ancestor frame and the maximum distance of any
+                                      (unsampled) configuration to the nearest sample.
+        '''
+        points = np.array(self.bounding_spheres[component.name][0], dtype=np.float64).reshape(1, 3)
+        slack = 0.0
+        while component is not ancestor:
+            if component.joint is not None:
+                axis, pivot = np.asarray(component.joint.relative_transform[0], dtype=np.float64), np.asarray(component.joint.relative_transform[1], dtype=np.float64)
+                lower, upper = component.joint.range
+                n_samples = self.n_samples if upper > lower else 1
+                step = (upper - lower) / (n_samples - 1) if n_samples > 1 else 0.0
+                # A point at distance r from the pivot moves at most r * step / 2 to the nearest sample
+                slack += (np.linalg.norm(points - pivot, axis=1).max() + slack) * step / 2
+                rotated = [pivot + (points - pivot) @ Quaternion(axis=axis, angle=angle).rotation_matrix.T for angle in np.linspace(lower, upper, n_samples)]
+                points = np.concatenate(rotated)
+            quat, trans = component.relative_transform
+            points = points @ Quaternion(quat).rotation_matrix.T + np.asarray(trans, dtype=np.float64)
+            component = component.parent
+        return points, slack
+
+    def _can_touch(self, component1: Fusion_Model.Component, component2: Fusion_Model.Component) -> bool:
+        '''
+        Check whether the bounding spheres of two components can come within 'margin' of each other for any joint configuration.
+        '''
+        if component1.name not in self.bounding_spheres or component2.name not in self.bounding_spheres:
+            return True
+
+        chain2 = self._ancestors(component2)
+        ancestor = next(component for component in self._ancestors(component1) if component in chain2)
+        points1, slack1 = self._sweep(component1, ancestor)
+        points2, slack2 = self._sweep(component2, ancestor)
+
+        distance, _ = cKDTree(points2).query(points1, k=1)
+        threshold = self.bounding_spheres[component1.name][1] + self.bounding_spheres[component2.name][1] + self.margin + slack1 + slack2
+        return distance.min() <= threshold
+
+    def _assign_contact_bits(self):
+        '''
+        Encode the possible pairs in contype/conaffinity bits: every bit is a group of bodies that may all touch each other
+        (a greedy clique cover), so two bodies share a bit if and only if they can touch. Parent/child pairs may share a bit either way.
+        '''
+        allowed = {name: set() for name in self._components}
+        for name1, name2 in self.possible_pairs:
+            allowed[name1].add(name2)
+            allowed[name2].add(name1)
+        for component in self.fusion_model.joint_components:
+            if component.parent is not None:
+                allowed[component.name].add(component.parent.name)
+                allowed[component.parent.name].add(component.name)
+
+        uncovered = {frozenset(pair) for pair in self.possible_pairs}
+        groups = []
+        while uncovered:
+            group = set(min(uncovered, key=sorted))
+            candidates = set.intersection(*(allowed[name] for name in group)) - group
+            while candidates:
+                # Add the body that covers the most uncovered pairs (by name for reproducibility)
+                best = max(sorted(candidates), key=lambda name: sum(frozenset((name, member)) in uncovered for member in group))
+                group.add(best)
+                candidates &= allowed[best]
+            uncovered -= {frozenset(pair) for pair in combinations(group, 2)}
+            groups.append(group)
+
+        self.n_bits = len(groups)
+        if self.n_bits > self.max_bits:
+            self.contact_bits = {}
+            return
+        self.contact_bits = {name: 0 for name in self._components}
+        for bit, group in enumerate(groups, start=1):
+            for name in group:
+                self.contact_bits[name] |= 1 << bit
+
+    def print_summary(self):
+        '''
+        Print how many candidate pairs were pruned and how they are encoded.
+        '''
+        print(colored("Contact pruning", "cyan") + f": {len(self.pruned_pairs)}/{len(self.candidate_pairs)} candidate pairs can never touch, {len(self.possible_pairs)} remain " +
+              (f"(encoded in {self.n_bits} contype/conaffinity bits)" if self.contact_bits else colored(f"({self.n_bits} > {self.max_bits} bits needed, using <exclude> elements)", "yellow")))
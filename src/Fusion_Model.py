@@ -1,9 +1,10 @@
 import json
 import numpy as np
 from dataclasses import dataclass, field
-from typing import List, Dict, Tuple, Union
+from typing import List, Dict, Tuple, Union, Iterator
 from pyquaternion import Quaternion
 from termcolor import colored
+from src.utils import quaternion_multiply, quaternion_inverse, quaternion_rotate
 
 # TODO: Add equalities (pay attention to remove actuator for motion links)
 
@@ -15,13 +16,12 @@ class Fusion_Model:
     json_file_path: str = field()
 
     # Public variables, not to be set by user
-    components:             List['Fusion_Model.Component']  = field(init=False, default_factory=list) # Root component is always first
-    joint_components:       List['Fusion_Model.Component']  = field(init=False, default_factory=list) # Root joint component is always first
+    components:             'Fusion_Model.Tree'  = field(init=False, default=None) # Root component is always first
+    joint_components:       'Fusion_Model.Tree'  = field(init=False, default=None) # Root joint component is always first
 
     # Internal variables
     _json_data:                 Dict            = field(init=False, default_factory=dict)
-    _component_indices:         Dict[str, int]  = field(init=False, default_factory=dict) # Not necessary, but useful and faster than iterating through list
-    _joint_component_indices:   Dict[str, int]  = field(init=False, default_factory=dict) # Not necessary, but useful and faster than iterating through list
+    _component_indices:         Dict[str, int]  = field(init=False, default_factory=dict) # Component ID -> index in 'components' (joint components store their component index in 'Tree.component_indices')
 
     def __post_init__(self):
         # Read json data
@@ -39,23 +39,189 @@ class Fusion_Model:
         return ""
 
     @dataclass
+    class Tree:
+        '''
+        Structure-of-arrays storage of a component tree. Indexing returns (cached) 'Fusion_Model.Component' views on the arrays.
+        '''
+        # Neccesary inputs
+        ids:                List[str]       = field()
+        names:              List[str]       = field()
+        stlnames:           List[str]       = field()
+        parents:            np.ndarray      = field() # (n,) parent index, -1 for the root
+
+        # Optional inputs
+        local_quats:        np.ndarray      = field(default=None) # (n, 4) transform relative to the parent in the component tree (w, x, y, z)
+        local_trans:        np.ndarray      = field(default=None) # (n, 3)
+        component_indices:  np.ndarray      = field(default=None) # (n,) index of the equivalent component in the component tree
+        joint_names:        List[str]       = field(default=None) # None for nodes without joint
+        joint_axes:         np.ndarray      = field(default=None) # (n, 3) absolute joint axes
+        joint_positions:    np.ndarray      = field(default=None) # (n, 3) absolute joint positions
+        joint_ranges:       np.ndarray      = field(default=None) # (n, 2)
+
+        # Public variables, not to be set by user
+        child_offsets:      np.ndarray      = field(init=False) # (n + 1,) CSR offsets into 'child_indices'
+        child_indices:      np.ndarray      = field(init=False) # Children of node i are child_indices[child_offsets[i]:child_offsets[i + 1]]
+        absolute_quats:     np.ndarray      = field(init=False)
+        absolute_trans:     np.ndarray      = field(init=False)
+        relative_quats:     np.ndarray      = field(init=False) # Transform relative to the parent in this tree
+        relative_trans:     np.ndarray      = field(init=False)
+        joint_relative_axes:        np.ndarray  = field(init=False) # Joint axes in the node frame
+        joint_relative_positions:   np.ndarray  = field(init=False) # Joint positions in the node frame
+
+        # Internal variables
+        _views:             List['Fusion_Model.Component']  = field(init=False, repr=False)
+
+        def __post_init__(self):
+            n = len(self.ids)
+            self.parents = np.asarray(self.parents, dtype=np.int64).reshape(n)
+            identity_quats = np.tile(np.array([1.0, 0.0, 0.0, 0.0]), (n, 1))
+            if self.local_quats is None:
+                self.local_quats = identity_quats.copy()
+            if self.local_trans is None:
+                self.local_trans = np.zeros((n, 3))
+            if self.component_indices is None:
+                self.component_indices = np.arange(n, dtype=np.int64)
+            if self.joint_names is None:
+                self.joint_names = [None] * n
+            if self.joint_axes is None:
+                self.joint_axes = np.zeros((n, 3))
+            if self.joint_positions is None:
+                self.joint_positions = np.zeros((n, 3))
+            if self.joint_ranges is None:
+                self.joint_ranges = np.tile(np.array([-np.pi, np.pi]), (n, 1))
+
+            # Children in CSR format (stable, i.e. in index order)
+            children = np.flatnonzero(self.parents >= 0)
+            self.child_indices = children[np.argsort(self.parents[children], kind='stable')]
+            self.child_offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.parents[children], minlength=n), out=self.child_offsets[1:])
+
+            self.absolute_quats = identity_quats.copy()
+            self.absolute_trans = np.zeros((n, 3))
+            self.relative_quats = identity_quats.copy()
+            self.relative_trans = np.zeros((n, 3))
+            self.joint_relative_axes = np.zeros((n, 3))
+            self.joint_relative_positions = np.zeros((n, 3))
+            self._views = [None] * n
+
+        def __len__(self) -> int:
+            return len(self.ids)
+
+        def __getitem__(self, index: int) -> 'Fusion_Model.Component':
+            if isinstance(index, slice):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            index = int(index)
+            if index < 0:
+                index += len(self)
+            if self._views[index] is None:
+                self._views[index] = Fusion_Model.Component(self, index)
+            return self._views[index]
+
+        def __iter__(self) -> Iterator['Fusion_Model.Component']:
+            for index in range(len(self)):
+                yield self[index]
+
+        def levels(self, root: int = 0) -> Iterator[np.ndarray]:
+            '''
+            Iterate over the tree levels (breadth-first), so parents always come before their children.
+
+            Args:
+                root (int): The index of the root node. Defaults to 0.
+
+            Returns:
+                Iterator[np.ndarray]: The node indices of every level.
+            '''
+            level = np.array([root], dtype=np.int64)
+            while len(level) > 0:
+                yield level
+                starts = self.child_offsets[level]
+                counts = self.child_offsets[level + 1] - starts
+                # Concatenate the child ranges of all nodes of the level without a Python loop
+                positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                level = self.child_indices[positions]
+
     class Component:
-        id:                 int                             = field()
-        name:               str                             = field(default=None)
-        stlname:            str                             = field(default=None)
-        transform:          Tuple[Quaternion, np.ndarray]   = field(init=False, default_factory=lambda: (Quaternion(1, 0, 0, 0).normalised, np.zeros(3))) # (quaternion, translation)
-        absolute_transform: Tuple[Quaternion, np.ndarray]   = field(init=False, default_factory=lambda: (Quaternion(1, 0, 0, 0).normalised, np.zeros(3))) # (quaternion, translation)
-        relative_transform: Tuple[Quaternion, np.ndarray]   = field(init=False, default_factory=lambda: (Quaternion(1, 0, 0, 0).normalised, np.zeros(3))) # (quaternion, translation)
-        parent:             'Fusion_Model.Component'        = field(init=False, default=None)
-        children:           List['Fusion_Model.Component']  = field(init=False, default_factory=list)
-        joint:              'Fusion_Model.Joint'            = field(init=False, default=None)
+        '''
+        A lightweight view on one node of a 'Fusion_Model.Tree'.
+        '''
+        __slots__ = ('_tree', '_index')
+
+        def __init__(self, tree: 'Fusion_Model.Tree', index: int):
+            self._tree = tree
+            self._index = index
+
+        def __repr__(self) -> str:
+            return f"Component(id={self.id!r}, name={self.name!r}, stlname={self.stlname!r})"
+
+        @property
+        def index(self) -> int:
+            return self._index
+
+        @property
+        def id(self) -> str:
+            return self._tree.ids[self._index]
+
+        @property
+        def name(self) -> str:
+            return self._tree.names[self._index]
+
+        @property
+        def stlname(self) -> str:
+            return self._tree.stlnames[self._index]
+
+        @property
+        def transform(self) -> Tuple[Quaternion, np.ndarray]:
+            return (Quaternion(self._tree.local_quats[self._index]), self._tree.local_trans[self._index]) # (quaternion, translation)
+
+        @property
+        def absolute_transform(self) -> Tuple[Quaternion, np.ndarray]:
+            return (Quaternion(self._tree.absolute_quats[self._index]), self._tree.absolute_trans[self._index]) # (quaternion, translation)
+
+        @property
+        def relative_transform(self) -> Tuple[Quaternion, np.ndarray]:
+            return (Quaternion(self._tree.relative_quats[self._index]), self._tree.relative_trans[self._index]) # (quaternion, translation)
+
+        @property
+        def parent(self) -> 'Fusion_Model.Component':
+            parent = self._tree.parents[self._index]
+            return self._tree[parent] if parent >= 0 else None
+
+        @property
+        def children(self) -> List['Fusion_Model.Component']:
+            return [self._tree[child] for child in self._tree.child_indices[self._tree.child_offsets[self._index]:self._tree.child_offsets[self._index + 1]]]
+
+        @property
+        def joint(self) -> 'Fusion_Model.Joint':
+            return Fusion_Model.Joint(self._tree, self._index) if self._tree.joint_names[self._index] is not None else None
 
-    @dataclass
     class Joint:
-        joint_name:         str                             = field()
-        transform:          Tuple[np.ndarray, np.ndarray]   = field(default_factory=lambda: (np.zeros(3), np.zeros(3))) # (axis, pos) - Same as "absolute_transform"
-        relative_transform: Tuple[np.ndarray, np.ndarray]   = field(default_factory=lambda: (np.zeros(3), np.zeros(3))) # (axis, pos)
-        range:               List[float]                    = field(default_factory=lambda: [-np.pi, np.pi])
+        '''
+        A lightweight view on the joint of one node of a 'Fusion_Model.Tree'.
+        '''
+        __slots__ = ('_tree', '_index')
+
+        def __init__(self, tree: 'Fusion_Model.Tree', index: int):
+            self._tree = tree
+            self._index = index
+
+        def __repr__(self) -> str:
+            return f"Joint(joint_name={self.joint_name!r}, range={self.range})"
+
+        @property
+        def joint_name(self) -> str:
+            return self._tree.joint_names[self._index]
+
+        @property
+        def transform(self) -> Tuple[np.ndarray, np.ndarray]:
+            return (self._tree.joint_axes[self._index], self._tree.joint_positions[self._index]) # (axis, pos) - Same as "absolute_transform"
+
+        @property
+        def relative_transform(self) -> Tuple[np.ndarray, np.ndarray]:
+            return (self._tree.joint_relative_axes[self._index], self._tree.joint_relative_positions[self._index]) # (axis, pos)
+
+        @property
+        def range(self) -> List[float]:
+            return self._tree.joint_ranges[self._index].tolist()
 
     def _build_component_tree(self):
         '''
@@ -64,32 +230,23 @@ class Fusion_Model:
         # data = self._json_data["Components"]
         data = self._json_data["components"]
 
-        # Add components to tree
-        self.root_component = Fusion_Model.Component(id="Root", name="Root", stlname=None)
-        self.components.append(self.root_component)
-        self._component_indices["Root"] = 0
-        for item in data:
-            id = item["component"]["id"]
-            name = item["component"]["name"]
-            stlname = item["stl_file"]
-            self.components.append(Fusion_Model.Component(id=id, name=f"{name}_{id}", stlname=stlname))
-            self._component_indices[id] = len(self._component_indices)
-
-        # Remap parent to child
-        for item in data:
-            component_index = self._component_indices[item["component"]["id"]]
-            parent_index = self._component_indices[item["parent"]["id"]]
-
-            # Add parent to child
-            self.components[component_index].parent = self.components[parent_index]
+        ids = ["Root"] + [item["component"]["id"] for item in data]
+        self._component_indices = {id: index for index, id in enumerate(ids)}
+        names = ["Root"] + [f"{item['component']['name']}_{item['component']['id']}" for item in data]
+        stlnames = [None] + [item["stl_file"] for item in data]
+        parents = [-1] + [self._component_indices[item["parent"]["id"]] for item in data]
 
-            # Add child to parent
-            self.components[parent_index].children.append(self.components[component_index])
+        # Add transformations
+        local_quats = np.tile(np.array([1.0, 0.0, 0.0, 0.0]), (len(ids), 1))
+        local_trans = np.zeros((len(ids), 3))
+        if len(data) > 0:
+            quats = np.array([item["transformation"]["quaternion"] for item in data], dtype=np.float64)
+            # Like 'Quaternion.normalised': quaternions that are already unit (to 1e-14) stay untouched
+            sum_of_squares = np.sum(quats ** 2, axis=1, keepdims=True)
+            local_quats[1:] = np.where(np.abs(1.0 - sum_of_squares) < 1e-14, quats, quats / np.sqrt(sum_of_squares))
+            local_trans[1:] = np.array([item["transformation"]["translation"] for item in data], dtype=np.float64) # / 100 # Convert from dm to mm?
 
-            # Add transformation
-            quat = Quaternion(item["transformation"]["quaternion"]).normalised
-            trans = np.array(item["transformation"]["translation"]) # / 100 # Convert from dm to mm?
-            self.components[component_index].transform = (quat, trans)
+        self.components = Fusion_Model.Tree(ids=ids, names=names, stlnames=stlnames, parents=parents, local_quats=local_quats, local_trans=local_trans)
 
     def _build_joint_tree(self):
         '''
@@ -98,150 +255,68 @@ class Fusion_Model:
         # data = self._json_data["Joints"]
         data = self._json_data["joints"]
 
-        # Add joints components to tree with transformation
+        # Rotating components (first joint counts), the root is the only base component that never rotates
+        rotating = {}
         for item in data:
-            base_component_id = item["component_base"]["id"]
-            rotating_component_id = item["component_rotating"]["id"]
-            rotating_component_name = item["component_rotating"]["name"]
-
-            if rotating_component_id not in self._joint_component_indices:
-                stlname = self.components[self._component_indices[rotating_component_id]].stlname.split(".stl")[0]
-                self.joint_components.append(Fusion_Model.Component(id=rotating_component_id, name=f"{rotating_component_name}_{rotating_component_id}", stlname=stlname))
-                self.joint_components[-1].parent = base_component_id # 'str' for now, later becomes 'Fusion_Model.Component'
-
-                axis = np.array(item["transformation"]["joint_axis"])
-                pos = np.array(item["transformation"]["joint_origin"]) # / 100 # Convert from dm to mm?
-                range = item["transformation"]["joint_range"]
-                # TODO: Make joint names more intuitive ('name(id)_p-name(p-id)' or similar)
-                self.joint_components[-1].joint = Fusion_Model.Joint(joint_name=f"{rotating_component_name}_{rotating_component_id}_joint", transform=(axis, pos), range=range)
-
-                self._joint_component_indices[rotating_component_id] = len(self._joint_component_indices) + 1
-
-        # Add base
-        root_added = False
+            rotating.setdefault(item["component_rotating"]["id"], item)
+        roots = {}
         for item in data:
-            base_component_id = item["component_base"]["id"]
-            base_component_name = item["component_base"]["name"]
-
-            if base_component_id not in self._joint_component_indices:
-                if not root_added:
-                    stlname = self.components[self._component_indices[base_component_id]].stlname.split(".stl")[0]
-                    self.joint_components.insert(0, Fusion_Model.Component(id=base_component_id, name=f"{base_component_name}_{base_component_id}", stlname=stlname))
-                    self._joint_component_indices[base_component_id] = 0
-                    root_added = True
-                else:
-                    raise ValueError("Multiple root components found in joint data. This sort of model is not supported - all joints must lead to a single root component.")
-
-        # Remap parent to child
-        for joint_component in self.joint_components:
-            if joint_component.parent is not None:
-                # Add parent to child
-                joint_component.parent = self.joint_components[self._joint_component_indices[joint_component.parent]]
-
-                # Add child to parent
-                joint_component.parent.children.append(joint_component)
+            if item["component_base"]["id"] not in rotating:
+                roots.setdefault(item["component_base"]["id"], item)
+        if len(roots) > 1:
+            raise ValueError("Multiple root components found in joint data. This sort of model is not supported - all joints must lead to a single root component.")
+
+        ids = list(roots) + list(rotating)
+        joint_indices = {id: index for index, id in enumerate(ids)}
+        component_indices = np.array([self._component_indices[id] for id in ids], dtype=np.int64)
+        stlnames = [self.components.stlnames[index].split(".stl")[0] for index in component_indices]
+        names = [f"{item['component_base']['name']}_{id}" for id, item in roots.items()]
+        names += [f"{item['component_rotating']['name']}_{id}" for id, item in rotating.items()]
+        parents = [-1] * len(roots) + [joint_indices[item["component_base"]["id"]] for item in rotating.values()]
+
+        # TODO: Make joint names more intuitive ('name(id)_p-name(p-id)' or similar)
+        joint_names = [None] * len(roots) + [f"{item['component_rotating']['name']}_{id}_joint" for id, item in rotating.items()]
+        joint_axes = np.zeros((len(ids), 3))
+        joint_positions = np.zeros((len(ids), 3))
+        joint_ranges = np.tile(np.array([-np.pi, np.pi]), (len(ids), 1))
+        if len(rotating) > 0:
+            joint_axes[len(roots):] = np.array([item["transformation"]["joint_axis"] for item in rotating.values()], dtype=np.float64)
+            joint_positions[len(roots):] = np.array([item["transformation"]["joint_origin"] for item in rotating.values()], dtype=np.float64) # / 100 # Convert from dm to mm?
+            joint_ranges[len(roots):] = np.array([item["transformation"]["joint_range"] for item in rotating.values()], dtype=np.float64)
+
+        self.joint_components = Fusion_Model.Tree(ids=ids, names=names, stlnames=stlnames, parents=parents, component_indices=component_indices,
+                                                  joint_names=joint_names, joint_axes=joint_axes, joint_positions=joint_positions, joint_ranges=joint_ranges)
 
     def _calculate_transforms(self):
         '''
         Calculate the relative (and absolute) transforms of all components and joints in the Fusion Model.
+        All transforms are calculated with batched quaternion operations, one tree level at a time.
         '''
-        def get_relative_transform(parent_pos: np.ndarray, parent_quat: Union[np.ndarray, Quaternion], child_pos: np.ndarray, child_quat: Union[np.ndarray, Quaternion]) -> Tuple[np.ndarray, Union[np.ndarray, Quaternion]]:
-            """
-            Calculate the relative position and quaternion of a child body relative to its parent.
-            
-            Args:
-                parent_pos (np.ndarray):                  Position of the parent body as a numpy array.
-                parent_quat (np.ndarray | Quaternion):    Quaternion of the parent body as a numpy array (w, x, y, z).
-                child_pos (np.ndarray):                   Position of the child body as a numpy array.
-                child_quat (np.ndarray | Quaternion):     Quaternion of the child body as a numpy array (w, x, y, z).
-            
-            Returns:
-                (Tuple[np.ndarray, np.ndarray | Quaternion]): The relative position and quaternion of the child body.
-            """
-            if isinstance(parent_quat, np.ndarray):
-                parent_quat = Quaternion(parent_quat).normalised
-                parent_is_np = True
-            else:
-                if not np.isclose(parent_quat.norm, 1):
-                    parent_quat = parent_quat.normalised
-                parent_is_np = False
-
-            if isinstance(child_quat, np.ndarray):
-                child_quat = Quaternion(child_quat).normalised
-                child_is_np = True
-            else:
-                if not np.isclose(child_quat.norm, 1):
-                    child_quat = child_quat.normalised
-                child_is_np = False
-
-            # Step 1: Calculate relative position in the parent's frame
-            relative_pos = parent_quat.inverse.rotate(child_pos - parent_pos)
-
-            # Step 2: Calculate relative orientation (quaternion)
-            relative_quat = parent_quat.inverse * child_quat
-
-            if parent_is_np and child_is_np:
-                relative_quat = relative_quat.normalised.elements
-            
-            return relative_pos, relative_quat
-        
-        def recursive_calculate_quat(component: Fusion_Model.Component) -> Quaternion:
-            '''
-            Recursively calculates the total quaternion of the component.
-
-            Args:
-                component (Fusion_Model.Component): The component to calculate the quaternion of.
-
-            Returns:
-                Quaternion: The total quaternion of the component.
-            '''
-            if component.id == "Root":
-                return component.transform[0]
-            return recursive_calculate_quat(component.parent) * component.transform[0]
-        
-        def recursive_calculate_trans(component: Fusion_Model.Component, component_translation: np.ndarray) -> np.ndarray:
-            '''
-            Recursively calculates the total translation of the component.
-
-            Args:
-                component (Fusion_Model.Component): The component to calculate the translation of.
-                component_translation (np.ndarray): The translation of the component.
-
-            Returns:
-                np.ndarray: The total translation of the component.
-            '''
-            if component.id == "Root":
-                return component_translation
-            return recursive_calculate_trans(component.parent, component.parent.transform[0].rotate(component_translation) + component.parent.transform[1])
-        
-        # Calculate absolute transforms
-        for component in self.components:
-            quat = recursive_calculate_quat(component)
-            trans = recursive_calculate_trans(component, component.transform[1])
-
-            joint_component = self.joint_components[self._joint_component_indices[component.id]] if component.id in self._joint_component_indices else None
-            if joint_component is not None: # Not subassembly
-                joint_component.absolute_transform = (quat, trans)
-            
-            component.absolute_transform = (quat, trans) # Should be useless, as only transforms of joint components are later used
+        # Calculate absolute transforms (the root's absolute transform is its own transform)
+        components = self.components
+        components.absolute_quats[:] = components.local_quats
+        components.absolute_trans[:] = components.local_trans
+        for level in list(components.levels())[1:]:
+            parent = components.parents[level]
+            components.absolute_quats[level] = quaternion_multiply(components.absolute_quats[parent], components.local_quats[level])
+            components.absolute_trans[level] = quaternion_rotate(components.absolute_quats[parent], components.local_trans[level]) + components.absolute_trans[parent]
+
+        joint_components = self.joint_components
+        joint_components.absolute_quats[:] = components.absolute_quats[joint_components.component_indices]
+        joint_components.absolute_trans[:] = components.absolute_trans[joint_components.component_indices]
 
         # Calculate relative transforms
-        for component in self.joint_components:
-            if component.parent is None:
-                continue
-
-            relative_trans, relative_quat = get_relative_transform(component.parent.absolute_transform[1], component.parent.absolute_transform[0], component.absolute_transform[1], component.absolute_transform[0])
-            component.relative_transform = (relative_quat, relative_trans)
+        children = np.flatnonzero(joint_components.parents >= 0)
+        parents = joint_components.parents[children]
+        inverse_parent_quats = quaternion_inverse(joint_components.absolute_quats[parents])
+        joint_components.relative_trans[children] = quaternion_rotate(inverse_parent_quats, joint_components.absolute_trans[children] - joint_components.absolute_trans[parents])
+        joint_components.relative_quats[children] = quaternion_multiply(inverse_parent_quats, joint_components.absolute_quats[children])
 
         # Calculate joint transforms
-        for component in self.joint_components:
-            if component.joint is None: # Base component
-                continue
-
-            relative_axis = component.absolute_transform[0].inverse.rotate(component.joint.transform[0])
-            relative_pos = component.absolute_transform[0].inverse.rotate(component.joint.transform[1] - component.absolute_transform[1])
-            component.joint.relative_transform = (relative_axis, relative_pos)
-        pass
+        jointed = np.array([index for index, joint_name in enumerate(joint_components.joint_names) if joint_name is not None], dtype=np.int64) # Not the base component
+        inverse_quats = quaternion_inverse(joint_components.absolute_quats[jointed])
+        joint_components.joint_relative_axes[jointed] = quaternion_rotate(inverse_quats, joint_components.joint_axes[jointed])
+        joint_components.joint_relative_positions[jointed] = quaternion_rotate(inverse_quats, joint_components.joint_positions[jointed] - joint_components.absolute_trans[jointed])
 
     def detailed_name(self, component: 'Fusion_Model.Component', level: int = None) -> str:
         '''
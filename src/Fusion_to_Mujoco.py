@@ -1,15 +1,36 @@
 from src.Mujoco_XML import Mujoco_XML
 from src.Fusion_Model import Fusion_Model
+from src.Mesh_Cache import Mesh_Cache
+from src.Model_Cache import Model_Cache
+from src.Build_Manifest import Build_Manifest
+from src.Asset_Store import Asset_Store
+from src.STL_Mesh import STL_Mesh
+from src.Contact_Analysis import Contact_Analysis
+from src.Vector_Env import Vector_Env
+from src.Trajectory_Renderer import Trajectory_Renderer, Camera
+from src.Stage_Profiler import Stage_Profiler
+from src.Simulation_Report import Simulation_Report
 import numpy as np
+import mujoco
 from pyquaternion import Quaternion
 import os
-from typing import Dict, List, Tuple
+import shutil
+from typing import Callable, Dict, List, Tuple, Union
 from dataclasses import dataclass, field
 import re
 import datetime
-from src.utils import reduce_mesh, find_latest_folder, bytes_to_mb
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from src.utils import reduce_mesh, compute_convex_hull, fit_primitive, bounding_sphere, convert_stl_to_msh, find_latest_folder, bytes_to_mb, file_hash, is_tmp_file
 from termcolor import colored
 
+def _reduce_mesh_job(job: Tuple[str, str, Dict]) -> None:
+    '''
+    Run 'reduce_mesh' for an (input file, output file, reduction parameters) job. Defined on module level, so that it can be used in a process pool.
+    '''
+    input_file, output_file, params = job
+    reduce_mesh(input_file, output_file, **params)
+
 @dataclass
 class Fusion_to_Mujoco:
     # Neccesary inputs
@@ -24,69 +45,654 @@ class Fusion_to_Mujoco:
     json_filename:          str     = "fusion_info.json"
 
     use_rel_stlpath:        bool    = False    # Use relative paths for the STL files in the XML file
+    mesh_format:            str     = "stl"     # "stl" (raw STL files, scaled via mesh default) or "msh" (indexed Mujoco binary meshes, pre-scaled to metres, written to the output folder)
     reduce_stls:            bool    = False    # Reduce the size of the STL files. If files are too big, mujoco will not result in an error
     max_stl_size:           int     = 5e6       # Bytes
+    triangle_budget:        int     = None      # Total number of triangles of all meshes in the model (used instead of 'max_stl_size' if given)
+    triangle_weights:       Dict[str, float] = None # Body name pattern (regex) -> weight of its meshes in the triangle budget (first match counts, default 1)
+    n_workers:              int     = 1         # Number of processes used to reduce the STL files (None = number of CPU cores)
+    use_mesh_cache:         bool    = True      # Cache reduced and converted meshes (and their originals) outside the asset folder
+    mesh_cache_dir:         str     = "cache/meshes/"
+    mesh_cache_size:        int     = 1e9       # Bytes of reduced meshes (originals are always kept)
+    collision_hulls:        bool    = False     # Collide with vertex-limited convex hulls (separate geoms) instead of the visual meshes
+    hull_max_vertices:      int     = 64
+    fit_primitives:         bool    = False     # Collide with fitted primitives (box, cylinder or capsule) for bodies whose fit is good enough
+    primitive_max_error:    float   = 0.2       # Maximum relative fit error of a primitive (see 'fit_primitive'), otherwise the mesh (or hull) is used
+    lod_ratios:             List[float] = None  # Triangle ratios of a level-of-detail pyramid generated (and cached) for every body mesh, e.g. [1.0, 0.25, 0.05] (None = no pyramid)
+    lod_visual:             int     = 0         # Pyramid level of the visual meshes (index into 'lod_ratios')
+    lod_collision:          int     = None      # Pyramid level of the collision meshes (None = same as visual, collision hulls and primitives take precedence)
+    lod_bodies:             Dict[str, Union[int, Tuple[int, int]]] = None # Body name pattern (regex) -> level, or (visual, collision) levels (first match counts)
+    prune_contacts:         bool    = False     # Disable contacts between bodies that can never touch within their joint ranges (see 'Contact_Analysis')
+    contact_margin:         float   = 0.001     # m
+    contact_samples:        int     = 7         # Samples per joint range for the contact analysis
+    incremental:            bool    = False     # Reuse the meshes of the last build for unchanged STL files and only copy/write changed assets and XML files (see 'Build_Manifest')
+    use_asset_store:        bool    = False     # Copy assets as hard links into a content-addressed store, so unchanged meshes are never written again (see 'Asset_Store').
+                                                # Export folders are only deduplicated on request: python -m src.Asset_Store assets/
+    asset_store_dir:        str     = "cache/assets/"
+    use_model_cache:        bool    = True      # Cache compiled models (.mjb) for 'load_model' and 'run_interactive'
+    model_cache_dir:        str     = "cache/models/"
+    model_cache_size:       int     = 2e9       # Bytes
+    xml_precision:          int     = None      # Significant digits of pos/quat/axis/range values in the XML file (None = full precision)
+    xml_epsilon:            float   = 0.0       # Values closer than this to 0 (or to +-1 for quaternions/axes) are snapped in the XML file
+    profile:                bool    = False     # Record wall time, CPU time, peak memory and item counts of every stage and mesh (see 'profiler')
+    profile_path:           str     = None      # Chrome trace (JSON) of the profile, rewritten after every stage
+    profile_hooks:          List[Callable[[Dict], None]] = None # Called with every finished profile record, e.g. to forward it to a metrics system
 
     # Public variables, not to be set by user
-    # /
+    profiler:   Stage_Profiler = field(init=False, default=None) # Only if 'profile' (or 'profile_path'/'profile_hooks' is given)
 
     # Internal variables
     _env: Mujoco_XML = field(init=False)
     _fusion_data: Fusion_Model = field(init=False)
+    _mesh_cache: Mesh_Cache = field(init=False, default=None)
+    _asset_subfolder: str = field(init=False) # Path of the export below the output folder (its relative path, or '<parent>/<export>' outside of the working directory)
+    _mesh_folder: str = field(init=False) # Folder of the meshes generated from the export ('output_dir'/'_asset_subfolder', where 'copy_assets' puts the meshes)
+    _mesh_files: Dict[str, str] = field(init=False, default_factory=dict) # Mesh name -> STL file the model uses (the original in the export folder, or a reduced one in the mesh folder)
+    _asset_files: List[str] = field(init=False, default_factory=list) # Mesh files added as assets
+    _n_triangles: Dict[str, int] = field(init=False, default_factory=dict) # Mesh name -> number of triangles
+    _hull_files: Dict[str, str] = field(init=False, default_factory=dict) # Mesh name -> STL file of its collision hull (in the mesh folder)
+    _lod_files: Dict[str, str] = field(init=False, default_factory=dict) # Mesh name of a pyramid level -> its STL file
+    _primitives: Dict[str, Dict] = field(init=False, default_factory=dict) # Mesh name -> accepted primitive fit
+    _manifest: Build_Manifest = field(init=False, default=None) # State of the last build (only in incremental mode)
+    _asset_store: Asset_Store = field(init=False, default=None)
 
     def __post_init__(self):
+        if self.mesh_format not in ["stl", "msh"]:
+            raise ValueError(f"Unknown mesh format '{self.mesh_format}'. Use 'stl' or 'msh'.")
+        if self.profile or self.profile_path is not None or self.profile_hooks:
+            self.profiler = Stage_Profiler(trace_path=self.profile_path, hooks=list(self.profile_hooks or []))
+
+        if self.lod_ratios is not None and not (all(0 < ratio <= 1 for ratio in self.lod_ratios) and self.lod_ratios == sorted(self.lod_ratios, reverse=True)):
+            raise ValueError(f"LOD ratios must be in (0, 1] and must not increase from one level to the next, not {self.lod_ratios}.")
+        self._check_lod_levels()
+
         # Initialize the Mujoco XML environment
-        self._env = Mujoco_XML(model_name=self.model_name)
+        self._env = self._create_env(Model_Cache(cache_dir=self.model_cache_dir, max_size=self.model_cache_size) if self.use_model_cache else None)
+
+        if self.use_asset_store:
+            # Copied assets share one file on disk with identical meshes (the export folders are left as they are)
+            self._asset_store = Asset_Store(store_dir=self.asset_store_dir)
 
-        # Add assets to the Mujoco XML environment
-        latest_folder = find_latest_folder(self.asset_folder)
+        with self._stage("find_latest_folder"):
+            latest_folder = find_latest_folder(self.asset_folder)
         self.asset_folder = os.path.relpath(latest_folder) # os.path.abspath(latest_folder)
-        self._add_assets()
+        self._asset_subfolder = self.asset_folder if not self.asset_folder.startswith(os.pardir) else os.path.relpath(latest_folder, os.path.dirname(os.path.dirname(os.path.abspath(latest_folder))))
+        self._mesh_folder = os.path.join(self.output_dir, self._asset_subfolder)
+        if os.path.realpath(self._mesh_folder) == os.path.realpath(self.asset_folder) and (self.reduce_stls or self.collision_hulls or self.lod_ratios is not None or self.mesh_format == "msh"):
+            raise ValueError(f"Generated meshes would overwrite the export in {self.asset_folder}, use another 'output_dir'.")
+
+        # Read the Fusion JSON file (before reducing the STL files, as the LOD selection and the triangle budget depend on the bodies)
+        with self._stage("fusion_model") as counts:
+            self._fusion_data = Fusion_Model(json_file_path=os.path.join(self.asset_folder, self.json_filename))
+            counts["components"] = len(self._fusion_data.components) - 1
+            counts["bodies"] = len(self._fusion_data.joint_components)
+
+        with self._stage("find_meshes") as counts:
+            self._find_meshes()
+            counts["meshes"] = len(self._mesh_files)
+
+        if self.incremental:
+            # Compare the export with the last build
+            with self._stage("scan_export") as counts:
+                self._manifest = Build_Manifest(filepath=os.path.join(self.output_dir, f"{self.model_name}_build.json"))
+                self._manifest.scan_export(self.asset_folder, self._fusion_data._json_data, self._mesh_files)
+                counts["files"] = len(self._mesh_files)
+
+        if self.use_mesh_cache and (self.reduce_stls or self.collision_hulls or self.lod_ratios is not None or self.mesh_format == "msh"):
+            self._mesh_cache = Mesh_Cache(cache_dir=self.mesh_cache_dir, max_size=self.mesh_cache_size)
         if self.reduce_stls:
-            self._reduce_stls()
+            with self._stage("reduce_stls"):
+                self._reduce_stls()
+        if self.collision_hulls:
+            with self._stage("collision_hulls"):
+                self._add_collision_hulls()
+        if self.lod_ratios is not None:
+            with self._stage("lod_pyramid"):
+                self._build_lod_pyramid()
+        if self.fit_primitives:
+            with self._stage("fit_primitives") as counts:
+                self._fit_primitives()
+                counts["primitives"] = len(self._primitives)
+        if self.mesh_format == "msh":
+            with self._stage("convert_meshes"):
+                self._convert_meshes()
 
-        # Read the Fusion JSON file
-        self._fusion_data = Fusion_Model(json_file_path=os.path.join(self.asset_folder, self.json_filename))
+        # Add the meshes (after all of them are generated) and components to the Mujoco XML environment
+        with self._stage("add_assets") as counts:
+            self._add_assets()
+            counts["meshes"] = len(self._asset_files)
+            counts["triangles"] = sum(self._n_triangles.values())
+        with self._stage("add_components") as counts:
+            self._recursive_add_component(self._fusion_data.joint_components[0])
+            counts["bodies"] = len(self._fusion_data.joint_components)
+        if self.prune_contacts:
+            with self._stage("prune_contacts"):
+                self._prune_contacts()
+        if self._manifest is not None:
+            self._manifest.save()
+            self._manifest.print_summary()
 
-        # Add components to the Mujoco XML environment
-        self._recursive_add_component(self._fusion_data.joint_components[0])
+    def _create_env(self, model_cache: Model_Cache = None) -> Mujoco_XML:
+        '''
+        Create an empty Mujoco XML environment with the settings of the model (.msh files are already scaled to metres).
+        '''
+        collision_classes = self.collision_hulls or self.fit_primitives or any(visual != collision for visual, collision in self._lod_selections())
+        return Mujoco_XML(model_name=self.model_name, precision=self.xml_precision, epsilon=self.xml_epsilon, mesh_scale=1 if self.mesh_format == "msh" else 0.001, collision_classes=collision_classes,
+                          model_cache=model_cache)
+
+    def _stage(self, name: str, category: str = "stage", **counts):
+        '''
+        Measure a stage or mesh with the profiler (see 'Stage_Profiler.stage'), or do nothing if profiling is off.
+        The context yields the item counts of the record either way.
+        '''
+        return self.profiler.stage(name, category=category, **counts) if self.profiler is not None else nullcontext({})
+
+    def _count(self, **counts):
+        '''
+        Set item counts of the innermost running profiler stage (if profiling is on).
+        '''
+        if self.profiler is not None:
+            self.profiler.count(**counts)
 
     def _reduce_stls(self):
         '''
-        Reduce the size of the STL files in the asset folder.
+        Reduce the STL files of the export, either to 'max_stl_size' per file or to the model-wide 'triangle_budget'.
+        Reduced meshes are written to the mesh folder and used instead of the originals, the export folder is left as it is.
         '''
-        n_reduced_stls = 0
-        for root, _, files in os.walk(self.asset_folder):
-            for file in files:
-                if file.lower().endswith(".stl"):
-                    full_filepath = os.path.abspath(os.path.join(root, file))
-                    if os.path.getsize(full_filepath) > self.max_stl_size:
-                        filesize = os.path.getsize(full_filepath)
-                        factor = self.max_stl_size / filesize
-                        reduce_mesh(full_filepath, full_filepath, factor, verbose=False)
-                        print(colored("WARNING", "yellow") + f": File {full_filepath} was reduced from {bytes_to_mb(filesize):.2f} MB to {bytes_to_mb(os.path.getsize(full_filepath)):.2f} MB")
-                        n_reduced_stls += 1
-        if n_reduced_stls == 1:
-            print("Reduced 1 STL file in the latest asset folder.")
-        elif n_reduced_stls > 1:
-            print(f"Reduced {n_reduced_stls} STL files in the latest asset folder.")
+        # Collect the originals of all STL files first (sorted, for a deterministic report)
+        stl_files = [] # (mesh name, file size, source hash, path of the original)
+        for name, stl_filepath in sorted(self._mesh_files.items()):
+            if self._mesh_cache is not None:
+                # Size of the original, also if the export folder was reduced in place by an older version
+                source_hash, filesize = self._mesh_cache.resolve(stl_filepath)
+                stl_files.append((name, filesize, source_hash, self._mesh_cache.original_path(source_hash)))
+            else:
+                stl_files.append((name, os.path.getsize(stl_filepath), None, stl_filepath))
+
+        # Reduction parameters of the files that need to be reduced
+        candidates = [] # (mesh name, file size, source hash, path of the original, reduction parameters)
+        if self.triangle_budget is not None:
+            face_counts = self._allocate_triangle_budget({name: original_filepath for name, _, _, original_filepath in stl_files})
+            for name, filesize, source_hash, original_filepath in stl_files:
+                face_count = face_counts.get(name)
+                if face_count is not None and face_count < STL_Mesh(original_filepath).n_triangles:
+                    candidates.append((name, filesize, source_hash, original_filepath, {"face_count": face_count}))
+        else:
+            for name, filesize, source_hash, original_filepath in stl_files:
+                if filesize > self.max_stl_size:
+                    # As a face count (the file size scales with the number of faces)
+                    candidates.append((name, filesize, source_hash, original_filepath, {"face_count": max(4, int(STL_Mesh(original_filepath).n_triangles * self.max_stl_size / filesize))}))
+
+        # Look up cached meshes - only the remaining ones are reduced
+        output_files = {name: os.path.join(self._mesh_folder, self._mesh_relpath(self._mesh_files[name])) for name, _, _, _, _ in candidates}
+        keys = []
+        jobs = [] # (input file, output file, reduction parameters)
+        job_names = [] # Mesh name per job
+        reused = set() # Meshes reused from the last build (incremental mode)
+        for name, filesize, source_hash, original_filepath, params in candidates:
+            if self._manifest is not None and self._manifest.reuse("reduced", name, self._manifest.current["stls"][name], params, output_files[name]):
+                reused.add(name)
+                keys.append(None)
+                continue
+            if self._mesh_cache is None:
+                keys.append(None)
+                jobs.append((original_filepath, output_files[name], params))
+                job_names.append(name)
+                continue
+            key = self._mesh_cache.key(source_hash, **params)
+            keys.append(key)
+            if self._mesh_cache.get(key) is None:
+                jobs.append((original_filepath, self._mesh_cache.reduced_path(key), params))
+                job_names.append(name)
+
+        n_workers = min(self.n_workers if self.n_workers is not None else os.cpu_count(), len(jobs))
+        if len(jobs) > 0:
+            with (ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else nullcontext()) as executor:
+                if self.profiler is not None:
+                    self.profiler.map(_reduce_mesh_job, jobs, job_names, executor)
+                else:
+                    mapper = executor.map if executor is not None else map
+                    list(mapper(_reduce_mesh_job, jobs))
+
+        reduced_bytes = 0
+        reduced_files = {output_file for _, output_file, _ in jobs}
+        for (name, filesize, source_hash, original_filepath, params), key in zip(candidates, keys):
+            output_filepath = output_files[name]
+            cached = key is not None and self._mesh_cache.reduced_path(key) not in reduced_files
+            if self._mesh_cache is not None and name not in reused:
+                if not cached:
+                    self._mesh_cache.put(key, source_hash, **params)
+                self._mesh_cache.export(key, output_filepath)
+            if self._manifest is not None and name not in reused:
+                self._manifest.record("reduced", name, self._manifest.current["stls"][name], params, output_filepath)
+            triangle_str = f" ({STL_Mesh(original_filepath).n_triangles} to {STL_Mesh(output_filepath).n_triangles} triangles)" if "face_count" in params else ""
+            print(colored("WARNING", "yellow") + f": File {self._mesh_files[name]} was reduced from {bytes_to_mb(filesize):.2f} MB to {bytes_to_mb(os.path.getsize(output_filepath)):.2f} MB" + triangle_str + (" (cached)" if cached else " (reused)" if name in reused else ""))
+            reduced_bytes += os.path.getsize(output_filepath)
+            self._mesh_files[name] = output_filepath
+        if self._mesh_cache is not None:
+            self._mesh_cache.save()
+        self._count(files=len(stl_files), reduced=len(candidates), computed=len(jobs), reduced_mb=bytes_to_mb(reduced_bytes),
+                    original_mb=bytes_to_mb(sum(filesize for _, filesize, _, _, _ in candidates)))
+        if len(candidates) == 1:
+            print(f"Reduced 1 STL file of the latest asset folder into {self._mesh_folder}.")
+        elif len(candidates) > 1:
+            print(f"Reduced {len(candidates)} STL files of the latest asset folder into {self._mesh_folder}.")
         else:
             print(colored("No STL files were reduced in size.", "cyan"))
+        if self._mesh_cache is not None:
+            self._mesh_cache.print_summary()
 
-    def _add_assets(self):
+    def _allocate_triangle_budget(self, stl_files: Dict[str, str]) -> Dict[str, int]:
         '''
-        Add assets to the Mujoco XML environment.
+        Split 'triangle_budget' across the meshes used by the bodies of the model.
+
+        Every mesh gets a share proportional to its surface area times the weight of the bodies using it (see 'triangle_weights'),
+        and meshes used by several bodies are counted once per body. Meshes that have fewer triangles than their share keep all of them,
+        the rest of their share is redistributed over the other meshes.
+
+        Args:
+            stl_files (Dict[str, str]): Mesh name -> path to the original STL file.
+
+        Returns:
+            Dict[str, int]: Mesh name -> number of triangles. Meshes that are not used by any body are left out.
         '''
+        def body_weight(body_name: str) -> float:
+            for pattern, weight in (self.triangle_weights or {}).items():
+                if re.search(pattern, body_name):
+                    return weight
+            return 1.0
+
+        # Number of uses and weight of every mesh
+        uses = {}
+        weights = {}
+        for component in self._fusion_data.joint_components:
+            if component.stlname in stl_files:
+                uses[component.stlname] = uses.get(component.stlname, 0) + 1
+                weights[component.stlname] = max(weights.get(component.stlname, 0.0), body_weight(component.name))
+
+        n_triangles = {}
+        for name in uses.keys():
+            stl_mesh = STL_Mesh(stl_files[name])
+            n_triangles[name] = stl_mesh.n_triangles
+            weights[name] *= stl_mesh.surface_area()
+
+        # Water-filling: cap meshes at their triangle count and redistribute the remaining budget
+        allocation = {}
+        remaining = self.triangle_budget
+        active = sorted(uses.keys())
+        while len(active) > 0:
+            total_weight = sum(uses[name] * weights[name] for name in active)
+            share = {name: remaining * weights[name] / total_weight if total_weight > 0 else remaining / sum(uses[name] for name in active) for name in active}
+            capped = [name for name in active if share[name] >= n_triangles[name]]
+            if len(capped) == 0:
+                for name in active:
+                    allocation[name] = max(4, int(share[name])) # At least a tetrahedron
+                break
+            for name in capped:
+                allocation[name] = n_triangles[name]
+                remaining -= uses[name] * n_triangles[name]
+                active.remove(name)
+
+        total = sum(uses[name] * allocation[name] for name in allocation.keys())
+        print(colored("Triangle budget", "cyan") + f": {total} of {self.triangle_budget} triangles allocated to {len(allocation)} meshes ({sum(uses[name] * n_triangles[name] for name in uses.keys())} before reduction)")
+        return allocation
+
+    def _convert_meshes(self):
+        '''
+        Convert the STL files the model uses to Mujoco binary meshes (.msh) in the mesh folder. Conversions are keyed by the content of the STL file,
+        they are taken from the mesh cache or the last build if possible (without either, every file is converted again).
+        '''
+        params = {"msh_scale": 0.001}
+        n_converted = 0
+        n_cached = 0
+        n_reused = 0
+        stl_bytes = 0
+        msh_bytes = 0
+        for stl_filepath in sorted(set(self._mesh_files.values()) | set(self._hull_files.values()) | set(self._lod_files.values())):
+            msh_filepath = self._msh_path(stl_filepath)
+            name = os.path.splitext(self._mesh_relpath(stl_filepath))[0]
+            stl_hash = file_hash(stl_filepath) if self._mesh_cache is not None or self._manifest is not None else None
+            reused = self._manifest is not None and self._manifest.reuse("msh", name, stl_hash, params, msh_filepath)
+            if reused:
+                n_reused += 1
+            elif self._mesh_cache is None:
+                with self._stage(name, category="mesh"):
+                    convert_stl_to_msh(stl_filepath, msh_filepath, scale=params["msh_scale"])
+                n_converted += 1
+            else:
+                key = self._mesh_cache.key(stl_hash, **params)
+                if self._mesh_cache.get(key) is None:
+                    with self._stage(name, category="mesh"):
+                        convert_stl_to_msh(stl_filepath, self._mesh_cache.reduced_path(key, ".msh"), scale=params["msh_scale"])
+                    self._mesh_cache.put(key, stl_hash, extension=".msh", **params)
+                    n_converted += 1
+                else:
+                    n_cached += 1
+                self._mesh_cache.export(key, msh_filepath)
+            if self._manifest is not None and not reused:
+                self._manifest.record("msh", name, stl_hash, params, msh_filepath)
+            stl_bytes += os.path.getsize(stl_filepath)
+            msh_bytes += os.path.getsize(msh_filepath)
+        if self._mesh_cache is not None:
+            self._mesh_cache.save()
+        self._count(converted=n_converted, cached=n_cached, reused=n_reused, msh_mb=bytes_to_mb(msh_bytes), stl_mb=bytes_to_mb(stl_bytes))
+        print(colored("Mesh conversion", "cyan") + f": {n_converted} STL file(s) converted to .msh, {n_cached} cached" + (f", {n_reused} reused" if self._manifest is not None else "") +
+              f", meshes take {bytes_to_mb(msh_bytes):.2f} MB instead of {bytes_to_mb(stl_bytes):.2f} MB")
+
+    def _add_collision_hulls(self):
+        '''
+        Compute (or load from the mesh cache) the convex hulls of all meshes used by bodies (from the mesh the body uses, reduced or original).
+        '''
+        n_computed = 0
+        n_cached = 0
+        n_reused = 0
+        for stlname in sorted({component.stlname for component in self._fusion_data.joint_components}):
+            stl_filepath = self._body_mesh_file(stlname)
+            if stl_filepath is None:
+                continue
+            hull_filepath = os.path.join(self._mesh_folder, "hulls", stlname + ".stl")
+            stl_hash = file_hash(stl_filepath) if self._mesh_cache is not None or self._manifest is not None else None
+            reused = self._manifest is not None and self._manifest.reuse("hull", stlname, stl_hash, {"convex_hull": self.hull_max_vertices}, hull_filepath)
+            if reused:
+                n_reused += 1
+            elif self._mesh_cache is None:
+                with self._stage(stlname, category="mesh"):
+                    compute_convex_hull(stl_filepath, hull_filepath, max_vertices=self.hull_max_vertices)
+                n_computed += 1
+            else:
+                key = self._mesh_cache.key(stl_hash, convex_hull=self.hull_max_vertices)
+                if self._mesh_cache.get(key) is None:
+                    with self._stage(stlname, category="mesh"):
+                        compute_convex_hull(stl_filepath, self._mesh_cache.reduced_path(key), max_vertices=self.hull_max_vertices)
+                    self._mesh_cache.put(key, stl_hash, convex_hull=self.hull_max_vertices)
+                    n_computed += 1
+                else:
+                    n_cached += 1
+                self._mesh_cache.export(key, hull_filepath)
+            if self._manifest is not None and not reused:
+                self._manifest.record("hull", stlname, stl_hash, {"convex_hull": self.hull_max_vertices}, hull_filepath)
+            self._hull_files[stlname] = hull_filepath
+        if self._mesh_cache is not None:
+            self._mesh_cache.save()
+        self._count(computed=n_computed, cached=n_cached, reused=n_reused)
+        print(colored("Collision hulls", "cyan") + f": {n_computed} computed, {n_cached} cached" + (f", {n_reused} reused" if self._manifest is not None else "") + f" (max. {self.hull_max_vertices} vertices)")
+
+    def _hull_mesh_name(self, stlname: str) -> str:
+        '''
+        Get the mesh name of the collision hull of a mesh ('/' is never part of an STL file name, so no part of the export can have it).
+        '''
+        return f"{stlname}/hull"
+
+    def _lod_selections(self) -> List[Tuple[int, int]]:
+        '''
+        All (visual, collision) pyramid levels the LOD selection can assign to a body.
+        '''
+        if self.lod_ratios is None:
+            return [(0, 0)]
+        default = (self.lod_visual, self.lod_visual if self.lod_collision is None else self.lod_collision)
+        return [default] + [tuple(levels) if isinstance(levels, (tuple, list)) else (levels, levels) for levels in (self.lod_bodies or {}).values()]
+
+    def _check_lod_levels(self):
+        '''
+        Check that the LOD selection only uses levels of the pyramid.
+        '''
+        if self.lod_ratios is None:
+            if self.lod_visual != 0 or self.lod_collision is not None or self.lod_bodies:
+                raise ValueError("Selecting LOD levels requires a LOD pyramid (see 'lod_ratios').")
+            return
+        n_levels = len(self.lod_ratios)
+        for levels in self._lod_selections():
+            if len(levels) != 2 or not all(0 <= level < n_levels for level in levels):
+                raise ValueError(f"LOD levels {levels} do not exist, the pyramid has {n_levels} level(s) (see 'lod_ratios').")
+
+    def _lod_levels(self, body_name: str) -> Tuple[int, int]:
+        '''
+        Get the (visual, collision) pyramid levels of a body (see 'lod_visual', 'lod_collision' and 'lod_bodies').
+        '''
+        if self.lod_ratios is None:
+            return 0, 0
+        for pattern, levels in (self.lod_bodies or {}).items():
+            if re.search(pattern, body_name):
+                return tuple(levels) if isinstance(levels, (tuple, list)) else (levels, levels)
+        return self.lod_visual, self.lod_visual if self.lod_collision is None else self.lod_collision
+
+    def _lod_mesh_name(self, stlname: str, level: int) -> str:
+        '''
+        Get the mesh name of a pyramid level (levels with a ratio of 1 are the mesh itself, '/' keeps the other names apart from the parts of the export).
+        '''
+        if self.lod_ratios is None or self.lod_ratios[level] >= 1:
+            return stlname
+        return f"{stlname}/lod{level}"
+
+    def _build_lod_pyramid(self):
+        '''
+        Generate the pyramid levels of all meshes used by bodies as 'lod<level>/<mesh>.stl' in the mesh folder. Every level is decimated from the mesh
+        the body uses (i.e. after 'reduce_stls' or 'triangle_budget'), which is the level with a ratio of 1, so the number of triangles
+        never increases from one level to the next. Levels are taken from the mesh cache or the last build if possible.
+        All levels are kept in the mesh folder, so that switching levels (see 'set_lod') only changes the XML file.
+        '''
+        jobs = [] # (input file, output file, reduction parameters)
+        job_names = [] # Mesh name per job
+        exports = [] # (mesh name, cache key, source hash, reduction parameters, output file) of every level
+        n_cached = 0
+        n_reused = 0
+        for stlname in sorted({component.stlname for component in self._fusion_data.joint_components}):
+            stl_filepath = self._body_mesh_file(stlname)
+            if stl_filepath is None:
+                continue
+            source_hash = file_hash(stl_filepath) if self._mesh_cache is not None or self._manifest is not None else None
+            n_triangles = STL_Mesh(stl_filepath).n_triangles
+
+            for level, ratio in enumerate(self.lod_ratios):
+                if ratio >= 1:
+                    continue
+                lod_name = self._lod_mesh_name(stlname, level)
+                lod_filepath = os.path.join(self._mesh_folder, f"lod{level}", stlname + ".stl")
+                params = {"face_count": max(4, int(n_triangles * ratio))}
+                if self._manifest is not None and self._manifest.reuse("lod", lod_name, source_hash, params, lod_filepath):
+                    n_reused += 1
+                    self._lod_files[lod_name] = lod_filepath
+                    continue
+                key = self._mesh_cache.key(source_hash, **params) if self._mesh_cache is not None else None
+                if key is None:
+                    jobs.append((stl_filepath, lod_filepath, params))
+                    job_names.append(lod_name)
+                elif self._mesh_cache.get(key) is None:
+                    jobs.append((stl_filepath, self._mesh_cache.reduced_path(key), params))
+                    job_names.append(lod_name)
+                else:
+                    n_cached += 1
+                exports.append((lod_name, key, source_hash, params, lod_filepath))
+                self._lod_files[lod_name] = lod_filepath
+
+        n_workers = min(self.n_workers if self.n_workers is not None else os.cpu_count(), len(jobs))
+        if len(jobs) > 0:
+            with (ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else nullcontext()) as executor:
+                if self.profiler is not None:
+                    self.profiler.map(_reduce_mesh_job, jobs, job_names, executor)
+                else:
+                    mapper = executor.map if executor is not None else map
+                    list(mapper(_reduce_mesh_job, jobs))
+
+        reduced_files = {output_file for _, output_file, _ in jobs}
+        for lod_name, key, source_hash, params, lod_filepath in exports:
+            if key is not None:
+                if self._mesh_cache.reduced_path(key) in reduced_files:
+                    self._mesh_cache.put(key, source_hash, **params)
+                self._mesh_cache.export(key, lod_filepath)
+            if self._manifest is not None:
+                self._manifest.record("lod", lod_name, source_hash, params, lod_filepath)
+        if self._mesh_cache is not None:
+            self._mesh_cache.save()
+        self._count(computed=len(jobs), cached=n_cached, reused=n_reused)
+        print(colored("LOD pyramid", "cyan") + f": ratios {self.lod_ratios}, {len(jobs)} level(s) computed, {n_cached} cached" + (f", {n_reused} reused" if self._manifest is not None else ""))
+
+    def _lod_mesh_names(self) -> set:
+        '''
+        Get the names of the meshes the current LOD selection uses for bodies (the levels with a ratio of 1 are the meshes themselves).
+        '''
+        lod_names = set()
+        for component in self._fusion_data.joint_components:
+            for level in set(self._lod_levels(component.name)):
+                lod_names.add(self._lod_mesh_name(component.stlname, level))
+        return lod_names
+
+    def _add_lod_assets(self):
+        '''
+        Add the pyramid levels selected for the bodies as assets.
+        '''
+        for lod_name in sorted(self._lod_mesh_names()):
+            if lod_name in self._lod_files:
+                self._add_mesh_asset(lod_name, self._lod_files[lod_name])
+
+    def set_lod(self, visual: int = 0, collision: int = None, bodies: Dict[str, Union[int, Tuple[int, int]]] = None):
+        '''
+        Select other pyramid levels and rebuild the Mujoco XML environment. The levels already exist (see '_build_lod_pyramid'), so no mesh is decimated again.
+
+        Args:
+            visual (int):                                       The level of the visual meshes.
+            collision (int):                                    The level of the collision meshes (None = same as visual).
+            bodies (Dict[str, Union[int, Tuple[int, int]]]):    Body name pattern (regex) -> level, or (visual, collision) levels (first match counts).
+        '''
+        if self.lod_ratios is None:
+            raise ValueError("There is no LOD pyramid, set 'lod_ratios' when creating the model.")
+        self.lod_visual, self.lod_collision, self.lod_bodies = visual, collision, bodies
+        self._check_lod_levels()
+
+        with self._stage("set_lod"):
+            self._env = self._create_env(self._env.model_cache)
+            self._add_assets()
+            self._recursive_add_component(self._fusion_data.joint_components[0])
+            if self.prune_contacts:
+                self._prune_contacts()
+
+    def _fit_primitives(self):
+        '''
+        Fit a primitive to the mesh of every body and keep the fits with an error below 'primitive_max_error'.
+        '''
+        fits = {}
+        print(colored("Primitive fits", "cyan") + f" (max. error {self.primitive_max_error}):")
+        for component in self._fusion_data.joint_components:
+            stl_filepath = self._body_mesh_file(component.stlname)
+            if stl_filepath is None:
+                continue
+            if component.stlname not in fits:
+                # STL files are in mm, the body frame is in m (also for pre-scaled .msh files)
+                fits[component.stlname] = fit_primitive(stl_filepath, scale=0.001)
+            fit = fits[component.stlname]
+            accepted = fit["error"] <= self.primitive_max_error
+            if accepted:
+                self._primitives[component.stlname] = fit
+            print(f"  {component.name}: {fit['type']}, error {fit['error']:.3f} " + (colored("(used)", "green") if accepted else colored("(mesh)", "yellow")))
+        print(f"  {len(self._primitives)}/{len(fits)} meshes replaced by primitives for collisions")
+
+    def _prune_contacts(self):
+        '''
+        Find the body pairs that can never touch and disable their contacts, via contype/conaffinity bits if possible,
+        otherwise via <exclude> elements.
+        '''
+        bounding_spheres = {}
+        for component in self._fusion_data.joint_components:
+            stl_filepath = self._body_mesh_file(component.stlname)
+            if stl_filepath is None:
+                continue
+            center, radius = bounding_sphere(stl_filepath, scale=0.001)
+            if component.stlname in self._primitives:
+                # Fitted primitives enclose the mesh, but may reach beyond its bounding sphere
+                primitive = self._primitives[component.stlname]
+                size = primitive["size"]
+                primitive_radius = np.linalg.norm(size) if primitive["type"] != "capsule" else size[0] + size[1]
+                radius = max(radius, np.linalg.norm(primitive["pos"] - center) + primitive_radius)
+            bounding_spheres[component.name] = (center, radius)
+
+        analysis = Contact_Analysis(fusion_model=self._fusion_data, bounding_spheres=bounding_spheres, margin=self.contact_margin, n_samples=self.contact_samples)
+        if analysis.contact_bits:
+            for name, bits in analysis.contact_bits.items():
+                # Bit 0 stays in conaffinity, so geoms outside of the model (contype 1) still collide with all bodies
+                self._env.set_contact_bits(name, bits, bits | 1)
+        else:
+            for name1, name2 in analysis.pruned_pairs:
+                self._env.exclude_contact(name1, name2)
+        analysis.print_summary()
+
+    def _mesh_name(self, filepath: str) -> str:
+        '''
+        Get the mesh name of a mesh file (its file name without extension).
+        '''
+        return os.path.splitext(os.path.basename(filepath))[0]
+
+    def _mesh_relpath(self, filepath: str) -> str:
+        '''
+        Get the path of a mesh file relative to the mesh folder if it was generated there, otherwise relative to the export folder.
+        This is the layout of the meshes next to the exported XML file (see 'copy_assets').
+        '''
+        if os.path.abspath(filepath).startswith(os.path.abspath(self._mesh_folder) + os.sep):
+            return os.path.relpath(filepath, self._mesh_folder)
+        return os.path.relpath(filepath, self.asset_folder)
+
+    def _msh_path(self, stl_filepath: str) -> str:
+        '''
+        Get the path of the .msh file converted from an STL file the model uses (in the mesh folder, see '_convert_meshes').
+        '''
+        return os.path.join(self._mesh_folder, os.path.splitext(self._mesh_relpath(stl_filepath))[0] + ".msh")
+
+    def _find_meshes(self):
+        '''
+        Find the STL files of the export. The model uses them as they are, unless they are reduced into the mesh folder (see '_reduce_stls').
+        '''
+        self._mesh_files = {}
         for root, _, files in os.walk(self.asset_folder):
             for file in files:
-                if file.lower().endswith(".stl"):
-                    full_filepath = os.path.join(root, file)
-                    if self.use_rel_stlpath:
-                        full_filepath = os.path.relpath(full_filepath)
-                    else:
-                        full_filepath = os.path.abspath(full_filepath)
-                    base_name = os.path.splitext(file)[0]
-                    self._env.add_asset(base_name, full_filepath)
+                if file.lower().endswith(".stl") and not is_tmp_file(file):
+                    self._mesh_files[self._mesh_name(file)] = os.path.join(root, file)
+
+    def _body_mesh_file(self, stlname: str) -> str:
+        '''
+        Get the STL file the model uses for the mesh of a body, None if there is none or it contains no triangles.
+        '''
+        stl_filepath = self._mesh_files.get(stlname)
+        if stl_filepath is None or STL_Mesh(stl_filepath).n_triangles == 0:
+            return None
+        return stl_filepath
+
+    def _add_assets(self):
+        '''
+        Add the meshes the model uses to the Mujoco XML environment: the body meshes, the collision hulls and the selected pyramid levels.
+        With a LOD pyramid, body meshes that no body uses at the selected levels are left out.
+        '''
+        self._n_triangles = {}
+        self._asset_files = []
+        unused_names = set()
+        if self.lod_ratios is not None:
+            unused_names = {component.stlname for component in self._fusion_data.joint_components} - self._lod_mesh_names()
+        for name, stl_filepath in self._mesh_files.items():
+            if name not in unused_names:
+                self._add_mesh_asset(name, stl_filepath)
+        for stlname, hull_filepath in self._hull_files.items():
+            self._add_mesh_asset(self._hull_mesh_name(stlname), hull_filepath)
+        if self.lod_ratios is not None:
+            self._add_lod_assets()
+
+    def _add_mesh_asset(self, name: str, stl_filepath: str):
+        '''
+        Add a single mesh asset to the Mujoco XML environment.
+
+        Args:
+            name (str):         The name of the mesh.
+            stl_filepath (str): The path to the STL file (in the export folder or the mesh folder). In "msh" mode the asset refers to the .msh file converted from it.
+        '''
+        mesh_filepath = self._msh_path(stl_filepath) if self.mesh_format == "msh" else stl_filepath
+        if self.use_rel_stlpath:
+            # Relative to the exported XML file, next to which 'copy_assets' puts the meshes
+            xml_filepath = os.path.join(self._asset_subfolder, self._mesh_relpath(mesh_filepath))
+        else:
+            xml_filepath = os.path.abspath(mesh_filepath)
+        # Only the header of (binary) STL files is read here
+        self._n_triangles[name] = STL_Mesh(stl_filepath).n_triangles
+        if self._n_triangles[name] == 0:
+            print(colored("WARNING", "yellow") + f": File {stl_filepath} contains no triangles, Mujoco will not be able to load it")
+        self._env.add_asset(name, xml_filepath, mesh_filepath)
+        self._asset_files.append(mesh_filepath)
 
     def _recursive_add_component(self, component: Fusion_Model.Component) -> None:
         '''
@@ -99,7 +705,19 @@ class Fusion_to_Mujoco:
         # parent_name = component.parent.id if component.parent is not None else ''
         parent_name = component.parent.name if component.parent is not None else 'root' # New
         # TODO: Add better 
-        self._env.add_body(component.name, component.stlname, trans, quat, parent_name, exclude_contact=True)
+        visual_level, collision_level = self._lod_levels(component.name)
+        if component.stlname in self._primitives:
+            collision_mesh_name = None
+        elif self.collision_hulls:
+            collision_mesh_name = self._hull_mesh_name(component.stlname)
+        elif self.fit_primitives or collision_level != visual_level:
+            collision_mesh_name = self._lod_mesh_name(component.stlname, collision_level)
+        else:
+            collision_mesh_name = ''
+        self._env.add_body(component.name, self._lod_mesh_name(component.stlname, visual_level), trans, quat, parent_name, exclude_contact=True, collision_mesh_name=collision_mesh_name)
+        if component.stlname in self._primitives:
+            primitive = self._primitives[component.stlname]
+            self._env.add_collision_geom(component.name, primitive["type"], primitive["size"], primitive["pos"], primitive["quat"])
         if component.joint is not None:
             self._env.add_joint(body_name=component.name, joint_name=component.joint.joint_name, pos=component.joint.relative_transform[1], axis=component.joint.relative_transform[0], range=component.joint.range)
             
@@ -117,31 +735,58 @@ class Fusion_to_Mujoco:
         Copy the assets from the specified folder to the asset folder of the model.
 
         Args:
-            asset_folder (str): The path to the folder containing the assets. Defaults to the latest asset folder.
+            asset_folder (str): The path to the folder containing the assets. Defaults to the meshes the model uses (from the latest asset folder and the mesh folder).
             output_folder (str): The path to the folder where the assets should be copied to. Defaults to the output folder of the model.
         '''
-        if asset_folder is None:
-            asset_folder = self.asset_folder
         if output_folder is None:
-            output_folder = os.path.join(self.output_dir, self.asset_folder)
+            output_folder = self._mesh_folder
 
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-            
-        for root, _, files in os.walk(asset_folder):
-            for file in files:
-                if file.lower().endswith(".stl"):
-                    full_filepath = os.path.abspath(os.path.join(root, file))
-                    output_filepath = os.path.join(output_folder, file)
-                    os.system(f"cp {full_filepath} {output_filepath}")
+        with self._stage("copy_assets") as counts:
+            if not os.path.exists(output_folder):
+                os.makedirs(output_folder)
+
+            files = []
+            if asset_folder is None:
+                for mesh_filepath in self._asset_files:
+                    files.append((os.path.abspath(mesh_filepath), os.path.join(output_folder, self._mesh_relpath(mesh_filepath))))
+            else:
+                for root, _, filenames in os.walk(asset_folder):
+                    for file in filenames:
+                        if file.lower().endswith("." + self.mesh_format) and not is_tmp_file(file):
+                            files.append((os.path.abspath(os.path.join(root, file)), os.path.join(output_folder, file)))
+            # Meshes generated into the mesh folder already are in place
+            files = [(src, dst) for src, dst in files if src != os.path.abspath(dst)]
+
+            if self._asset_store is not None:
+                self._asset_store.copy_files(files)
+                self._asset_store.save()
+                self._asset_store.print_summary()
+            elif self._manifest is not None:
+                results = {"copied": 0, "linked": 0, "unchanged": 0}
+                for full_filepath, output_filepath in files:
+                    results[self._manifest.copy_if_changed(full_filepath, output_filepath)] += 1
+                self._manifest.save()
+                print(colored("Assets", "cyan") + f": {results['copied']} copied, {results['linked']} linked to identical files of the last build, {results['unchanged']} unchanged ({output_folder})")
+            else:
+                for full_filepath, output_filepath in files:
+                    if os.path.isfile(output_filepath):
+                        os.remove(output_filepath) # Never write through a hard link of an earlier copy
+                    os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
+                    shutil.copyfile(full_filepath, output_filepath)
+            counts["files"] = len(files)
+            counts["mb"] = bytes_to_mb(sum(os.path.getsize(src) for src, _ in files))
 
-    def export_xml(self, filename: str = None):
+    def export_xml(self, filename: str = None, lod: Dict = None):
         '''
         Export the Mujoco XML environment to a file.
 
         Args:
             filename (str): The name of the file to export to.
+            lod (Dict):     Pyramid levels to export with, as arguments of 'set_lod' (e.g. {"visual": 0, "collision": 2}). Defaults to the current selection.
         '''
+        if lod is not None:
+            self.set_lod(**lod)
+
         def check_dir(dir: str) -> str:
             if not dir.endswith("/"):
                 dir += "/"
@@ -173,13 +818,118 @@ class Fusion_to_Mujoco:
             output_name = check_filename(filename)
 
         filename = output_dir + output_name
-        self._env.export_xml(filename)
+        with self._stage("export_xml") as counts:
+            if self._manifest is not None:
+                written = self._env.export_xml(filename, only_if_changed=True)
+                print(colored("XML", "cyan") + f": {filename} " + ("written" if written else "unchanged, not rewritten"))
+            else:
+                self._env.export_xml(filename)
+            counts["kb"] = os.path.getsize(filename) / 1024
+
+    def load_model(self) -> mujoco.MjModel:
+        '''
+        Load the compiled Mujoco model of the exported XML file (through the model cache if 'use_model_cache').
+
+        Returns:
+            mujoco.MjModel: The compiled model.
+        '''
+        with self._stage("load_model"):
+            model = self._env.load_model()
+        if self._env.model_cache is not None:
+            self._env.model_cache.print_summary()
+        return model
+
+    def compile_model(self) -> mujoco.MjModel:
+        '''
+        Compile the Mujoco model in memory, without exporting the XML file or copying assets (see 'Mujoco_XML.compile_model').
+
+        Returns:
+            mujoco.MjModel: The compiled model.
+        '''
+        with self._stage("compile_model"):
+            model = self._env.compile_model()
+        if self._env.model_cache is not None:
+            self._env.model_cache.print_summary()
+        return model
+
+    def rollout(self, controls: Union[np.ndarray, Dict[str, np.ndarray]], initial_qpos: np.ndarray = None, initial_qvel: np.ndarray = None, n_workers: int = None, n_substeps: int = 1) -> Dict[str, np.ndarray]:
+        '''
+        Simulate a batch of control sequences for the joint actuators without a display (see 'Mujoco_XML.rollout').
+
+        Args:
+            controls (Union[np.ndarray, Dict[str, np.ndarray]]):    (n_rollouts, n_steps, nu) controls, or actuator name -> (n_rollouts, n_steps) controls.
+            initial_qpos (np.ndarray):                              The initial joint positions (per rollout or shared).
+            initial_qvel (np.ndarray):                              The initial joint velocities (per rollout or shared).
+            n_workers (int):                                        The number of worker processes (None = number of CPU cores).
+            n_substeps (int):                                       The physics steps per control step.
+
+        Returns:
+            Dict[str, np.ndarray]: The stacked 'qpos', 'qvel', 'ctrl', 'ncon', 'contacts' and 'contact_dist' arrays.
+        '''
+        return self._env.rollout(controls, initial_qpos=initial_qpos, initial_qvel=initial_qvel, n_workers=n_workers, n_substeps=n_substeps)
+
+    def make_vector_env(self, n_envs: int, n_workers: int = None, n_substeps: int = 1) -> Vector_Env:
+        '''
+        Create a vectorized environment of the exported model, with actions and observations in shared memory (see 'Vector_Env').
+        Call 'close' on it when done.
+
+        Args:
+            n_envs (int):       The number of environments.
+            n_workers (int):    The number of worker processes (None = number of CPU cores).
+            n_substeps (int):   The physics steps per environment step.
+
+        Returns:
+            Vector_Env: The vectorized environment.
+        '''
+        return Vector_Env(model_path=self._env.compiled_model_path(), n_envs=n_envs, n_workers=n_workers, n_substeps=n_substeps)
+
+    def make_renderer(self, width: int = 640, height: int = 480, cameras: List[Camera] = [-1], fps: float = 30.0, gl_backend: str = "osmesa", n_workers: int = None) -> Trajectory_Renderer:
+        '''
+        Create an offscreen renderer for trajectories of the exported model, e.g. the 'qpos' of 'rollout' (see 'Trajectory_Renderer').
+        Call 'close' on it when done.
+
+        Args:
+            width (int):            The image width in pixels.
+            height (int):           The image height in pixels.
+            cameras (List[Camera]): The views rendered per frame (-1 = free camera, a camera name, or free camera settings).
+            fps (float):            The target frame rate (samples in between frames are skipped).
+            gl_backend (str):       The GL backend of the rendering processes ("osmesa" renders on the CPU).
+            n_workers (int):        The number of rendering processes (None = number of CPU cores).
+
+        Returns:
+            Trajectory_Renderer: The renderer.
+        '''
+        return Trajectory_Renderer(model_path=self._env.compiled_model_path(), width=width, height=height, cameras=list(cameras), fps=fps, gl_backend=gl_backend, n_workers=n_workers)
+
+    def simulation_report(self, sweep_duration: float = 1.0, output_path: str = None, n_top: int = 10) -> Simulation_Report:
+        '''
+        Step the exported model through a sweep of every actuator and report which geom pairs and components (with their STL files) make it expensive to simulate
+        (see 'Simulation_Report').
+
+        Args:
+            sweep_duration (float): The seconds of simulated time per actuator sweep.
+            output_path (str):      A JSON file for the full report (optional).
+            n_top (int):            The number of pairs and components printed.
+
+        Returns:
+            Simulation_Report: The report, with its 'results'.
+        '''
+        report = Simulation_Report(model_path=self._env.compiled_model_path(), sweep_duration=sweep_duration)
+        with self._stage("simulation_report") as counts:
+            report.run()
+            counts["steps"] = report.results["n_steps"]
+        report.print_summary(n_top)
+        if output_path is not None:
+            report.write_json(output_path)
+        return report
 
     def run_interactive(self):
         '''
         Run the Mujoco simulation interactively.
         '''
         self._env.run_interactive()
+        if self._env.model_cache is not None:
+            self._env.model_cache.print_summary()
 
 if __name__ == "__main__":
     model = Fusion_to_Mujoco(reduce_stls=True, use_rel_stlpath=True)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+from termcolor import colored
+from src.utils import file_hash, bytes_to_mb, link_or_copy_atomic
+
+@dataclass
+class Mesh_Cache:
+    # Neccesary inputs
+    # /
+
+    # Optional inputs
+    cache_dir:  str = "cache/meshes/"
+    max_size:   int = 1e9       # Bytes of reduced meshes, least recently used ones are evicted above this size (originals are never evicted)
+
+    # Public variables, not to be set by user
+    n_hits:     int = field(init=False, default=0)
+    n_misses:   int = field(init=False, default=0)
+
+    # Internal variables
+    _index:     Dict[str, Dict] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        os.makedirs(os.path.join(self.cache_dir, "originals"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "reduced"), exist_ok=True)
+
+        if os.path.isfile(self._index_path):
+            with open(self._index_path, 'r') as index_file:
+                self._index = json.load(index_file)
+        self._index.setdefault("originals", {})
+        self._index.setdefault("reduced", {})
+        self._index.setdefault("sources", {}) # Hash of a reduced mesh -> hash of its original mesh (kept after eviction)
+
+        # Forget entries whose files were removed by hand
+        self._index["originals"] = {key: entry for key, entry in self._index["originals"].items() if os.path.isfile(self.original_path(key))}
+        self._index["reduced"] = {key: entry for key, entry in self._index["reduced"].items() if os.path.isfile(self._entry_path(key, entry))}
+
+    @property
+    def _index_path(self) -> str:
+        '''
+        The path of the cache index file.
+        '''
+        return os.path.join(self.cache_dir, "index.json")
+
+    def original_path(self, source_hash: str) -> str:
+        '''
+        Get the path of a cached original mesh.
+
+        Args:
+            source_hash (str): The content hash of the original mesh.
+
+        Returns:
+            str: The path of the cached original mesh.
+        '''
+        return os.path.join(self.cache_dir, "originals", f"{source_hash}.stl")
+
+    def reduced_path(self, key: str, extension: str = ".stl") -> str:
+        '''
+        Get the path of a cached reduced mesh.
+
+        Args:
+            key (str):          The cache key of the reduced mesh (see 'key').
+            extension (str):    The file extension, e.g. ".msh" for converted meshes.
+
+        Returns:
+            str: The path of the cached reduced mesh.
+        '''
+        return os.path.join(self.cache_dir, "reduced", f"{key}{extension}")
+
+    def _entry_path(self, key: str, entry: Dict) -> str:
+        '''
+        Get the path of a cached reduced mesh from its index entry (entries without an extension are STL files).
+        '''
+        return self.reduced_path(key, entry.get("extension", ".stl"))
+
+    def key(self, source_hash: str, **params) -> str:
+        '''
+        Get the cache key of a reduced mesh.
+
+        Args:
+            source_hash (str):  The content hash of the original mesh.
+            params:             The reduction parameters (e.g. 'reduction_factor').
+
+        Returns:
+            str: The cache key.
+        '''
+        params = {name: round(value, 12) if isinstance(value, float) else value for name, value in params.items()}
+        return hashlib.sha256(f"{source_hash}:{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+
+    def resolve(self, stl_path: str) -> Tuple[str, int]:
+        '''
+        Find the original of an STL file and make sure it is stored in the cache.
+        Files that are the output of an earlier (in place) reduction resolve to the mesh they were reduced from.
+
+        Args:
+            stl_path (str): The path to the STL file.
+
+        Returns:
+            Tuple[str, int]: The content hash and the size in bytes of the original mesh.
+        '''
+        stl_hash = file_hash(stl_path)
+        source_hash = self._index["sources"].get(stl_hash, stl_hash)
+        if source_hash not in self._index["originals"]:
+            if source_hash != stl_hash:
+                print(colored("WARNING", "yellow") + f": The original of the already reduced file {stl_path} was removed from the cache by hand, it will be treated as original")
+                source_hash = stl_hash
+            if source_hash not in self._index["originals"]:
+                link_or_copy_atomic(stl_path, self.original_path(source_hash))
+                self._index["originals"][source_hash] = {"size": os.path.getsize(stl_path), "last_used": time.time()}
+
+        self._index["originals"][source_hash]["last_used"] = time.time()
+        return source_hash, self._index["originals"][source_hash]["size"]
+
+    def get(self, key: str) -> str:
+        '''
+        Look up a reduced mesh, counting cache hits and misses.
+
+        Args:
+            key (str): The cache key of the reduced mesh.
+
+        Returns:
+            str: The path of the cached reduced mesh, None if it is not cached.
+        '''
+        if key not in self._index["reduced"]:
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        self._index["reduced"][key]["last_used"] = time.time()
+        return self._entry_path(key, self._index["reduced"][key])
+
+    def put(self, key: str, source_hash: str, extension: str = ".stl", **params):
+        '''
+        Register a reduced mesh that was written to 'reduced_path(key, extension)'.
+
+        Args:
+            key (str):          The cache key of the reduced mesh.
+            source_hash (str):  The content hash of the original mesh.
+            extension (str):    The file extension of the reduced mesh.
+            params:             The reduction parameters.
+        '''
+        output_hash = file_hash(self.reduced_path(key, extension))
+        self._index["reduced"][key] = {
+            "source": source_hash,
+            "params": params,
+            "extension": extension,
+            "output_hash": output_hash,
+            "size": os.path.getsize(self.reduced_path(key, extension)),
+            "last_used": time.time(),
+        }
+        self._index["sources"][output_hash] = source_hash
+
+    def export(self, key: str, output_file: str):
+        '''
+        Copy a cached reduced mesh to the output file, unless the output file already is identical.
+
+        Args:
+            key (str):          The cache key of the reduced mesh.
+            output_file (str):  The path to copy the reduced mesh to.
+        '''
+        entry = self._index["reduced"][key]
+        if os.path.isfile(output_file) and os.path.getsize(output_file) == entry["size"] and file_hash(output_file) == entry["output_hash"]:
+            return
+        link_or_copy_atomic(self._entry_path(key, entry), output_file)
+
+    def save(self):
+        '''
+        Evict the least recently used reduced meshes above 'max_size' and write the cache index to disk.
+        Originals are never evicted: export folders that were reduced in place by older versions could not be restored without them.
+        '''
+        entries = sorted(self._index["reduced"].items(), key=lambda item: item[1]["last_used"])
+        total_size = sum(entry["size"] for _, entry in entries)
+        for key, entry in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(self._entry_path(key, entry))
+            del self._index["reduced"][key]
+            total_size -= entry["size"]
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump(self._index, index_file, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def size(self, kind: str = "reduced") -> int:
+        '''
+        Get the total size of the cached meshes of a kind.
+
+        Args:
+            kind (str): "reduced" (the meshes 'max_size' applies to) or "originals".
+
+        Returns:
+            int: The size in bytes.
+        '''
+        return sum(entry["size"] for entry in self._index[kind].values())
+
+    def print_summary(self):
+        '''
+        Print the cache hits and misses of this run and the size of the cache.
+        '''
+        print(colored("Mesh cache", "cyan") + f": {self.n_hits} hit(s), {self.n_misses} miss(es), {bytes_to_mb(self.size()):.2f} MB of {bytes_to_mb(self.max_size):.2f} MB used by reduced meshes, "
+              f"{bytes_to_mb(self.size('originals')):.2f} MB by originals ({self.cache_dir})")
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List
+import mujoco
+from termcolor import colored
+from src.utils import file_hash, bytes_to_mb
+
+@dataclass
+class Model_Cache:
+    # Neccesary inputs
+    # /
+
+    # Optional inputs
+    cache_dir:  str = "cache/models/"
+    max_size:   int = 2e9       # Bytes, least recently used models are evicted above this size
+
+    # Public variables, not to be set by user
+    n_hits:         int     = field(init=False, default=0)
+    n_misses:       int     = field(init=False, default=0)
+    load_time:      float   = field(init=False, default=0.0) # Seconds spent loading cached models in this run
+    compile_time:   float   = field(init=False, default=0.0) # Seconds spent compiling models in this run
+    saved_time:     float   = field(init=False, default=0.0) # Seconds of compilation saved by cache hits in this run
+
+    # Internal variables
+    _index:     Dict[str, Dict] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        if os.path.isfile(self._index_path):
+            with open(self._index_path, 'r') as index_file:
+                self._index = json.load(index_file)
+        self._index.setdefault("models", {})
+        self._index.setdefault("files", {}) # Absolute path -> size, mtime and content hash (avoids rehashing unchanged meshes)
+
+        # Forget entries whose files were removed by hand
+        self._index["models"] = {key: entry for key, entry in self._index["models"].items() if os.path.isfile(self.model_path(key))}
+
+    @property
+    def _index_path(self) -> str:
+        '''
+        The path of the cache index file.
+        '''
+        return os.path.join(self.cache_dir, "index.json")
+
+    def model_path(self, key: str) -> str:
+        '''
+        Get the path of a cached compiled model.
+
+        Args:
+            key (str): The cache key of the model (see 'key').
+
+        Returns:
+            str: The path of the .mjb file.
+        '''
+        return os.path.join(self.cache_dir, f"{key}.mjb")
+
+    def dependencies(self, xml_path: str) -> List[str]:
+        '''
+        Find the files an XML model refers to (meshes, textures, height fields, skins and included files).
+
+        Args:
+            xml_path (str): The path to the XML file.
+
+        Returns:
+            List[str]: The absolute paths of the referenced files.
+        '''
+        xml_dir = os.path.dirname(os.path.abspath(xml_path))
+        root = ET.parse(xml_path).getroot()
+        compiler = root.find("compiler")
+        asset_dir = compiler.get("assetdir", "") if compiler is not None else ""
+        asset_dirs = {tag: (compiler.get(f"{tag}dir", asset_dir) if compiler is not None else "") for tag in ["mesh", "texture"]}
+
+        files = []
+        for element in root.iter():
+            if element.get("file") is None:
+                continue
+            filepath = element.get("file")
+            if not os.path.isabs(filepath):
+                # Meshes, skins and height fields use 'meshdir', textures use 'texturedir' (both default to 'assetdir')
+                if element.tag == "include":
+                    filepath = os.path.join(xml_dir, filepath)
+                else:
+                    filepath = os.path.join(xml_dir, asset_dirs["texture" if element.tag == "texture" else "mesh"], filepath)
+            files.append(os.path.abspath(filepath))
+        return files
+
+    def key(self, xml_path: str) -> str:
+        '''
+        Get the cache key of a model: a hash of the MuJoCo version, the XML text and the contents of all referenced files.
+
+        Args:
+            xml_path (str): The path to the XML file.
+
+        Returns:
+            str: The cache key.
+        '''
+        digest = hashlib.sha256(mujoco.__version__.encode())
+        with open(xml_path, 'rb') as xml_file:
+            digest.update(xml_file.read())
+        for filepath in self.dependencies(xml_path):
+            # Missing files are left to the compiler to report
+            digest.update(filepath.encode() + b":" + (self._file_hash(filepath) if os.path.isfile(filepath) else "missing").encode())
+        return digest.hexdigest()
+
+    def load(self, xml_path: str) -> mujoco.MjModel:
+        '''
+        Load a model from the cache, or compile it from the XML file (and cache it).
+
+        Args:
+            xml_path (str): The path to the XML file.
+
+        Returns:
+            mujoco.MjModel: The compiled model.
+        '''
+        return self._load(self.key(xml_path), lambda: mujoco.MjModel.from_xml_path(os.path.abspath(xml_path)), os.path.abspath(xml_path))
+
+    def load_string(self, xml: str, assets: Dict[str, bytes], asset_hashes: Dict[str, str]) -> mujoco.MjModel:
+        '''
+        Load a model from the cache, or compile it from an XML string and in-memory assets (and cache it).
+
+        Args:
+            xml (str):                      The XML text.
+            assets (Dict[str, bytes]):      File name (as referenced in the XML) -> file content.
+            asset_hashes (Dict[str, str]):  File name -> content hash (so that the buffers are not hashed again).
+
+        Returns:
+            mujoco.MjModel: The compiled model.
+        '''
+        digest = hashlib.sha256(mujoco.__version__.encode())
+        digest.update(xml.encode())
+        for name in sorted(assets):
+            digest.update(f"{name}:{asset_hashes[name]}".encode())
+        return self._load(digest.hexdigest(), lambda: mujoco.MjModel.from_xml_string(xml, assets), "<memory>")
+
+    def _load(self, key: str, compile_model, source: str) -> mujoco.MjModel:
+        '''
+        Load the model with the given key from the cache, or compile it with 'compile_model' (and cache it).
+        '''
+        if key in self._index["models"]:
+            start = time.perf_counter()
+            try:
+                model = mujoco.MjModel.from_binary_path(self.model_path(key))
+            except Exception as error:
+                print(colored("WARNING", "yellow") + f": Cached model {self.model_path(key)} could not be loaded ({error}), recompiling")
+                del self._index["models"][key]
+            else:
+                entry = self._index["models"][key]
+                entry["last_used"] = time.time()
+                elapsed = time.perf_counter() - start
+                self.n_hits += 1
+                self.load_time += elapsed
+                self.saved_time += max(entry["compile_time"] - elapsed, 0)
+                self.save()
+                return model
+
+        self.n_misses += 1
+        start = time.perf_counter()
+        model = compile_model()
+        elapsed = time.perf_counter() - start
+        self.compile_time += elapsed
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".mjb", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            mujoco.mj_saveModel(model, tmp_path, None)
+            os.replace(tmp_path, self.model_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._index["models"][key] = {
+            "xml": source,
+            "size": os.path.getsize(self.model_path(key)),
+            "compile_time": elapsed,
+            "last_used": time.time(),
+        }
+        self.save()
+        return model
+
+    def compiled_path(self, xml_path: str) -> str:
+        '''
+        Get the path of the cached compiled model of an XML file, compiling it if necessary (e.g. to pass it to the viewer).
+
+        Args:
+            xml_path (str): The path to the XML file.
+
+        Returns:
+            str: The path of the .mjb file.
+        '''
+        key = self.key(xml_path)
+        if key not in self._index["models"]:
+            self.load(xml_path)
+        else:
+            self._index["models"][key]["last_used"] = time.time()
+            self.save()
+        return self.model_path(key)
+
+    def save(self):
+        '''
+        Evict the least recently used models above 'max_size' and write the cache index to disk.
+        '''
+        entries = sorted(self._index["models"].items(), key=lambda item: item[1]["last_used"])
+        total_size = sum(entry["size"] for _, entry in entries)
+        for key, entry in entries[:-1]: # The most recently used model is always kept
+            if total_size <= self.max_size:
+                break
+            os.remove(self.model_path(key))
+            del self._index["models"][key]
+            total_size -= entry["size"]
+
+        # Forget file hashes of files that no longer exist
+        self._index["files"] = {filepath: entry for filepath, entry in self._index["files"].items() if os.path.isfile(filepath)}
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump(self._index, index_file, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def size(self) -> int:
+        '''
+        Get the total size of the cached models.
+
+        Returns:
+            int: The size in bytes.
+        '''
+        return sum(entry["size"] for entry in self._index["models"].values())
+
+    def print_summary(self):
+        '''
+        Print the cache hits and misses of this run, the time saved and the size of the cache.
+        '''
+        print(colored("Model cache", "cyan") + f": {self.n_hits} hit(s) ({self.load_time:.2f} s loading, {self.saved_time:.2f} s compilation saved), "
+              f"{self.n_misses} miss(es) ({self.compile_time:.2f} s compiling), {bytes_to_mb(self.size()):.2f} MB of {bytes_to_mb(self.max_size):.2f} MB used ({self.cache_dir})")
+
+    def _file_hash(self, filepath: str) -> str:
+        '''
+        Get the content hash of a file, reusing the stored hash if its size and modification time did not change.
+        '''
+        stat = os.stat(filepath)
+        entry = self._index["files"].get(filepath)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash(filepath)}
+            self._index["files"][filepath] = entry
+        return entry["hash"]
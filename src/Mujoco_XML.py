@@ -1,11 +1,43 @@
 import os
+import sys
+import hashlib
 import subprocess
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
 
-from mujoco_py import load_model_from_xml, MjSim, MjViewer
 from dataclasses import dataclass, field
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Iterator, Tuple
 import numpy as np
 from pyquaternion import Quaternion
+import mujoco
+import mujoco.viewer
+from termcolor import colored
+from src.Model_Cache import Model_Cache
+from src.Rollout import Rollout
+
+# Asset file contents shared by all models of this process: absolute path -> (size, modification time, inode, content, content hash)
+_asset_buffers: Dict[str, Tuple[int, int, int, bytes, str]] = {}
+
+def read_asset(filepath: str) -> Tuple[bytes, str]:
+    '''
+    Read an asset file once per process; later calls return the same buffer unless the file changed.
+    Files replaced by a link keep the modification time of the linked file, so the inode is compared as well.
+
+    Args:
+        filepath (str): The path to the file.
+
+    Returns:
+        Tuple[bytes, str]: The content and its SHA-256 hash.
+    '''
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    entry = _asset_buffers.get(filepath)
+    if entry is None or entry[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+        with open(filepath, 'rb') as file:
+            content = file.read()
+        entry = (stat.st_size, stat.st_mtime_ns, stat.st_ino, content, hashlib.sha256(content).hexdigest())
+        _asset_buffers[filepath] = entry
+    return entry[3], entry[4]
 
 @dataclass
 class Mujoco_XML:
@@ -14,14 +46,18 @@ class Mujoco_XML:
 
     # Optional inputs
     use_defaults: str = True
+    precision:    int   = None  # Significant digits of exported pos/quat/axis/range values (None = full precision)
+    epsilon:      float = 0.0   # Values closer than this to 0 (or to +-1 for quaternions/axes) are snapped
+    mesh_scale:   float = 0.001 # Default scale of all meshes (1 = no default, e.g. for pre-scaled meshes)
+    collision_classes: bool = False # Add 'visual' (group 1, no contact) and 'collision' (group 3, no mass) default classes for separate geoms
+    model_cache:  Model_Cache = None # Cache of compiled models, used by 'load_model', 'compile_model' and 'run_interactive'
 
     # Public variables, not to be set by user
-    model_str: str = field(init=False)
+    # model_str (see property below)
 
     # Internal variables
-    _assets:            List[str]       = field(init=False, default_factory=list)
+    _assets:            List[Tuple[str, str]] = field(init=False, default_factory=list) # (file as referenced in the XML, file the content is read from)
     _xml_path:          str             = field(init=False, default='model.xml')
-    _mujoco_sim_path:   str             = field(init=False, default=os.path.join(os.path.dirname(__file__), 'mujoco_sim.sh'))
     _first_set:         Dict[str, bool] = field(init=False, default_factory=lambda: {
         'compiler': False,
         'default': False,
@@ -32,24 +68,19 @@ class Mujoco_XML:
         'collision_class': False,
         'visual_class': False,
     })
-    
+    _root:              ET.Element              = field(init=False)
+    _sections:          Dict[str, ET.Element]   = field(init=False, default_factory=dict) # Section name -> element (e.g. 'worldbody')
+    _default_classes:   Dict[str, ET.Element]   = field(init=False, default_factory=dict) # Default class name -> element
+    _bodies:            Dict[str, ET.Element]   = field(init=False, default_factory=dict) # Body name -> element
+    _joints:            Dict[str, ET.Element]   = field(init=False, default_factory=dict) # Joint name -> element
+    _container_tags:    tuple                   = field(init=False, default=('mujoco', 'default', 'asset', 'worldbody', 'body', 'actuator', 'contact', 'equality'))
+    _numeric_attribs:   List[Tuple]             = field(init=False, default_factory=list) # (element, attribute, raw values, kind, precision, epsilon)
+    _max_errors:        Dict[str, float]        = field(init=False, default_factory=lambda: {'pos': 0.0, 'rot': 0.0, 'range': 0.0})
+
     def __post_init__(self):
-        self.model_str = (
-            f'<mujoco model="{self.model_name}">\n'
-            '\t<default>\n'
-            '\t</default>\n'
-            '\t<asset>\n'
-            '\t</asset>\n'
-            '\t<worldbody>\n'
-            '\t</worldbody>\n'
-            '\t<actuator>\n'
-            '\t</actuator>\n'
-            '\t<contact>\n'
-            '\t</contact>\n'
-            '\t<equality>\n'
-            '\t</equality>\n'
-            '</mujoco>'
-        )
+        self._root = ET.Element('mujoco', {'model': self.model_name})
+        for section in ['default', 'asset', 'worldbody', 'actuator', 'contact', 'equality']:
+            self._sections[section] = ET.SubElement(self._root, section)
 
         # Default settings - turn off when creating a new 'Mujoco_XML' object by passing 'use_defaults=False'
         if self.use_defaults:
@@ -70,69 +101,171 @@ class Mujoco_XML:
             self.add_default("geom", rgba="1 1 1 1", type="mesh", friction="1 0.005 0.001", condim="3", margin="0.0005", contype="1", conaffinity="1")
             self.add_default("joint", type="hinge", limited="true", damping="0.1", armature="0.001", margin="0.01", frictionloss="0.001")
             self.add_default("position", ctrllimited="true", forcelimited="true", forcerange="-1 1", kp="2.0")
-            self.add_default("mesh", scale="0.001 0.001 0.001") # New
+            if self.mesh_scale != 1:
+                self.add_default("mesh", scale=f"{self.mesh_scale} {self.mesh_scale} {self.mesh_scale}") # New
+        if self.collision_classes:
+            # Mass and inertia still come from the (full) visual mesh
+            self.add_default_class("collision")
+            self.add_default("geom", "collision", contype="1", conaffinity="1", group="3", mass="0")
+            self.add_default_class("visual")
+            self.add_default("geom", "visual", contype="0", conaffinity="0", group="1")
+        if self.use_defaults:
             # Add root body
-            self._insert_before_last("worldbody", '<body name="root" quat="1.0 0.0 0.0 0.0">', add_end='</body>')
+            self._bodies["root"] = self._add_element(self._sections["worldbody"], "body", {"name": "root", "quat": "1.0 0.0 0.0 0.0"})
         # self.sim = mujoco_py.MjSim(self.model)
 
-    # TODO: Add check to see if called from "before" or "after". In "before" case, instead of using "previous_line" use "line"
-    def _insert_at_index(self, target: str, index: int, insert: str, add_end: str = ''): # ", after: bool"
+    @property
+    def model_str(self) -> str:
+        '''
+        The Mujoco XML file as a string, serialized from the element tree.
+        '''
+        return '\n'.join(self._serialize(self._root))
+
+    def _serialize(self, element: ET.Element, level: int = 0) -> Iterator[str]:
         '''
-        Insert a string at a specific index in the Mujoco XML file.
+        Serialize an element (and its children) of the Mujoco XML tree line by line.
 
         Args:
-            target (str):   The target string to search for in the XML file.
-            index (int):    The index to insert the string at.
-            insert (str):   The string to insert at the specified index.
-            add_end (str):  The string to insert after the insert string. Defaults to empty string.
-        '''
-        # For indent purposes (0 = False, 1 = True)
-        if target in self._first_set.keys():
-            add_indent = 1 - self._first_set[target]
+            element (ET.Element):   The element to serialize.
+            level (int):            The indentation level of the element. Defaults to 0.
+
+        Yields:
+            str: The lines of the serialized element, without line breaks.
+        '''
+        indent = level * '\t'
+        attrib_str = ''.join([f' {key}={quoteattr(value)}' for key, value in element.attrib.items()])
+        if len(element) == 0 and element.tag not in self._container_tags:
+            yield f'{indent}<{element.tag}{attrib_str}/>'
+            return
+
+        yield f'{indent}<{element.tag}{attrib_str}>'
+        for child in element:
+            yield from self._serialize(child, level + 1)
+        yield f'{indent}</{element.tag}>'
+
+    def _add_element(self, parent: ET.Element, tag: str, attrib: Dict[str, str], first: bool = False) -> ET.Element:
+        '''
+        Add an element to a parent element of the Mujoco XML tree.
+
+        Args:
+            parent (ET.Element):    The parent element to add the new element to.
+            tag (str):              The XML tag of the new element.
+            attrib (Dict[str, str]): The attributes of the new element.
+            first (bool):           Whether to add the element as first child (instead of last child) of the parent. Defaults to False.
+
+        Returns:
+            ET.Element: The new element.
+        '''
+        element = ET.Element(tag, {key: str(value) for key, value in attrib.items()})
+        if first:
+            parent.insert(0, element)
         else:
-            # Target is file name or also contains class name
-            add_indent = True
-        
-        lines = self.model_str.splitlines()
-        previous_line = lines[index - 1]
-        indent = (len(previous_line) - len(previous_line.lstrip()) + add_indent) * '\t'
+            parent.append(element)
 
-        lines.insert(index, indent + insert)
-        if add_end != '':
-            lines.insert(index + 1, indent + add_end)
-        
-        self.model_str = '\n'.join(lines)
+        if self._sections.get(parent.tag) is parent and parent.tag in self._first_set.keys():
+            self._first_set[parent.tag] = True
 
-        if target in self._first_set.keys():
-            self._first_set[target] = True
+        return element
 
-    def _insert_after_first(self, target: str, insert: str, add_end: str = ''):
+    def _get_body(self, body_name: str) -> ET.Element:
         '''
-        Insert a string after the first instance of a target string in the Mujoco XML file.
+        Get a body element of the Mujoco XML tree by its name.
 
         Args:
-            target (str):   The target string to search for in the XML file.
-            insert (str):   The string to insert after the first instance of the target string.
-            add_end (str):  The string to insert after the insert string. Defaults to empty string.
+            body_name (str): The name of the body.
+
+        Returns:
+            ET.Element: The body element.
         '''
-        lines = self.model_str.splitlines()
-        target_indices = [i for i, line in enumerate(lines) if target in line]
-        if len(target_indices) == 0:
-            raise ValueError(f"Target '{target}' not found in XML file.")
-        self._insert_at_index(target, target_indices[0] + 1, insert, add_end=add_end)
+        if body_name not in self._bodies:
+            raise ValueError(f"Body '{body_name}' not found in XML file.")
+        return self._bodies[body_name]
 
-    def _insert_before_last(self, target: str, insert: str, add_end: str = ''):
+    def _format_values(self, values: List[float], kind: str, precision: int = None, epsilon: float = None) -> Tuple[str, float]:
         '''
-        Insert a string before the last instance of a target string in the Mujoco XML file.
+        Format numeric attribute values, snapping them to 0 (and +-1 for unit vectors) and rounding them to the given precision.
 
         Args:
-            target (str):   The target string to search for in the XML file.
-            insert (str):   The string to insert before the last instance of the target string.
-            add_end (str):  The string to insert after the insert string. Defaults to empty string.
+            values (List[float]):   The values to format.
+            kind (str):             The kind of values ('pos', 'quat', 'axis' or 'range').
+            precision (int):        The number of significant digits. Defaults to None (i.e. 'self.precision').
+            epsilon (float):        The snapping threshold. Defaults to None (i.e. 'self.epsilon').
+
+        Returns:
+            Tuple[str, float]: The formatted values and the error introduced (rotation angle for 'quat' and 'axis', max. absolute deviation otherwise).
+        '''
+        precision = self.precision if precision is None else precision
+        epsilon = self.epsilon if epsilon is None else epsilon
+        if precision is None and epsilon == 0:
+            return ' '.join([f'{value}' for value in values]), 0.0
+
+        original = np.array(values, dtype=float)
+        snapped = original.copy()
+        snapped[np.abs(snapped) < epsilon] = 0.0
+        if kind in ['quat', 'axis']:
+            near_unit = np.abs(np.abs(snapped) - 1) < epsilon
+            snapped[near_unit] = np.sign(snapped[near_unit])
+        snapped += 0.0 # Avoid '-0'
+
+        if precision is None:
+            value_strs = [f'{value}' for value in snapped]
+        else:
+            value_strs = [f'{value:.{precision}g}' for value in snapped]
+        exported = np.array([float(value_str) for value_str in value_strs])
+
+        if kind in ['quat', 'axis']:
+            # Angle between the unit vectors (numerically stable for small angles)
+            a = original / np.linalg.norm(original)
+            b = exported / np.linalg.norm(exported)
+            if kind == 'quat' and np.dot(a, b) < 0:
+                b = -b # q and -q are the same rotation
+            error = 2 * np.arctan2(np.linalg.norm(a - b), np.linalg.norm(a + b))
+            if kind == 'quat':
+                error *= 2 # Quaternion angle is half the rotation angle
+        else:
+            error = np.max(np.abs(exported - original))
+
+        return ' '.join(value_strs), float(error)
+
+    def _set_numeric_attrib(self, element: ET.Element, attribute: str, values: List[float], kind: str, precision: int = None, epsilon: float = None):
+        '''
+        Set a numeric attribute of an element, keeping the raw values so that it can be reformatted on export.
+
+        Args:
+            element (ET.Element):   The element to set the attribute of.
+            attribute (str):        The name of the attribute.
+            values (List[float]):   The raw values of the attribute.
+            kind (str):             The kind of values ('pos', 'quat', 'axis' or 'range').
+            precision (int):        The number of significant digits. Defaults to None (i.e. 'self.precision').
+            epsilon (float):        The snapping threshold. Defaults to None (i.e. 'self.epsilon').
+        '''
+        value_str, error = self._format_values(values, kind, precision, epsilon)
+        element.set(attribute, value_str)
+        self._numeric_attribs.append((element, attribute, values, kind, precision, epsilon))
+        self._update_max_error(kind, error)
+
+    def _update_max_error(self, kind: str, error: float):
+        '''
+        Update the max. error introduced by the number format for the given kind of values.
+        '''
+        error_key = {'pos': 'pos', 'quat': 'rot', 'axis': 'rot', 'range': 'range'}[kind]
+        self._max_errors[error_key] = max(self._max_errors[error_key], error)
+
+    def set_number_format(self, precision: int = None, epsilon: float = 0.0):
+        '''
+        Set the number format of all pos/quat/axis/range values, including the ones that were already added.
+
+        Args:
+            precision (int):    The number of significant digits. Defaults to None (i.e. full precision).
+            epsilon (float):    Values closer than this to 0 (or to +-1 for quaternions/axes) are snapped. Defaults to 0.0 (i.e. no snapping).
         '''
-        lines = self.model_str.splitlines()
-        target_indices = [i for i, line in enumerate(lines) if target in line]
-        self._insert_at_index(target, target_indices[-1], insert, add_end=add_end)
+        self.precision = precision
+        self.epsilon = epsilon
+        self._max_errors = {key: 0.0 for key in self._max_errors.keys()}
+        for element, attribute, values, kind, attrib_precision, attrib_epsilon in self._numeric_attribs:
+            value_str, error = self._format_values(values, kind, attrib_precision, attrib_epsilon)
+            element.set(attribute, value_str)
+            self._update_max_error(kind, error)
 
     def add_option(self, **kwargs):
         '''
@@ -141,8 +274,7 @@ class Mujoco_XML:
         Args:
             kwargs: The arguments to pass to the option.
         '''
-        kwarg_str = ' '.join([f'{key}="{value}"' for key, value in kwargs.items()])
-        self._insert_after_first(self.model_name, f'<option {kwarg_str}/>')
+        self._add_element(self._root, "option", kwargs, first=True)
 
     def add_compiler(self, **kwargs):
         '''
@@ -151,8 +283,7 @@ class Mujoco_XML:
         Args:
             kwargs: The arguments to pass to the compiler.
         '''
-        kwarg_str = ' '.join([f'{key}="{value}"' for key, value in kwargs.items()])
-        self._insert_after_first(self.model_name, f'<compiler {kwarg_str}/>')
+        self._add_element(self._root, "compiler", kwargs, first=True)
 
     def add_default_class(self, class_name: str, parent_class: str = ''):
         '''
@@ -163,9 +294,10 @@ class Mujoco_XML:
             parent_class (str): The name of the parent class. Defaults to empty string (i.e. no parent class).
         '''
         if parent_class == '':
-            self._insert_before_last("default", f'<default class="{class_name}">', add_end='</default>')
+            attrib = {"class": class_name}
         else:
-            self._insert_before_last("default", f'<default class="{class_name}" parent="{parent_class}">', add_end='</default>')
+            attrib = {"class": class_name, "parent": parent_class}
+        self._default_classes[class_name] = self._add_element(self._sections["default"], "default", attrib)
 
         if class_name == "collision" or class_name == "visual":
             self._first_set[f'{class_name}_class'] = True
@@ -178,24 +310,26 @@ class Mujoco_XML:
             tag (str):          The XML tag to add (geom, position, velocity, motor, mesh, joint, etc.).
             class_name (str):   The default class name to add the tag to (needs to be added first via 'add_default_class'). Defaults to empty string (i.e. no parent class).
         '''
-        kwarg_str = ' '.join([f'{key}="{value}"' for key, value in kwargs.items()])
         if class_name == '':
-            self._insert_before_last("default", f'<{tag} {kwarg_str}/>')
+            self._add_element(self._sections["default"], tag, kwargs)
         else:
-            self._insert_after_first(f'default class="{class_name}"', f'<{tag} {kwarg_str}/>')
+            if class_name not in self._default_classes:
+                raise ValueError(f"Default class '{class_name}' not found in XML file.")
+            self._add_element(self._default_classes[class_name], tag, kwargs, first=True)
 
-    def add_asset(self, name: str, filepath: str):
+    def add_asset(self, name: str, filepath: str, source: str = None):
         '''
         Add an asset to the Mujoco XML file.
 
         Args:
             name (str):     The name of the asset.
-            filepath (str): The file path to the asset.
+            filepath (str): The file path to the asset, as referenced in the XML file.
+            source (str):   The file the content is read from by 'asset_dict', if 'filepath' only resolves next to the exported XML file. Defaults to 'filepath'.
         '''
-        self._insert_before_last("asset", f'<mesh name="{name}" file="{filepath}"/>')
-        self._assets.append(filepath)
+        self._add_element(self._sections["asset"], "mesh", {"name": name, "file": filepath})
+        self._assets.append((filepath, source if source is not None else filepath))
 
-    def add_body(self, body_name: str, mesh_name: str = '', pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), quat: Union[List[float], np.ndarray, Quaternion] = Quaternion(1, 0, 0, 0), parent_body_name: str = '', exclude_contact: bool = True):
+    def add_body(self, body_name: str, mesh_name: str = '', pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), quat: Union[List[float], np.ndarray, Quaternion] = Quaternion(1, 0, 0, 0), parent_body_name: str = '', exclude_contact: bool = True, precision: int = None, epsilon: float = None, collision_mesh_name: str = ''):
         '''
         Add a body within the "worldbody" section to the Mujoco XML file.
 
@@ -205,20 +339,57 @@ class Mujoco_XML:
             pos (List[float] | np.ndarray):                 The position of the body in the format [x, y, z]. Defaults to [0, 0, 0].
             quat (List[float] | np.ndarray | Quaternion):   The quaternion of the body in the format [w, x, y, z]. Defaults to [1, 0, 0, 0].
             parent_body_name (str):                         The name of the parent body. Defaults to empty string.
+            exclude_contact (bool):                         Whether to exclude contacts between the body and its parent. Defaults to True.
+            precision (int):                                The number of significant digits of pos and quat. Defaults to None (i.e. 'self.precision').
+            epsilon (float):                                The snapping threshold of pos and quat. Defaults to None (i.e. 'self.epsilon').
+            collision_mesh_name (str):                      The name of a separate collision mesh asset. Defaults to empty string (i.e. a single geom that is used for both).
+                                                            None adds only the visual geom (see 'add_collision_geom').
         '''
         if mesh_name == '':
             mesh_name = body_name
 
-        insert_str = f'<body name="{body_name}" pos="{pos[0]} {pos[1]} {pos[2]}" quat="{quat[0]} {quat[1]} {quat[2]} {quat[3]}">'
+        if body_name in self._bodies:
+            raise ValueError(f"Body '{body_name}' already exists in XML file.")
+
         if parent_body_name == '':
-            self._insert_before_last("worldbody", insert_str, add_end='</body>')
+            body = self._add_element(self._sections["worldbody"], "body", {"name": body_name})
         else:
             # TODO (For better .xml-file readability): Add before closing bracket, not after opening bracket
-            self._insert_after_first(f'body name="{parent_body_name}"', insert_str, add_end='</body>')
+            body = self._add_element(self._get_body(parent_body_name), "body", {"name": body_name}, first=True)
             if exclude_contact:
                 self.exclude_contact(parent_body_name, body_name)
+        self._set_numeric_attrib(body, "pos", [pos[0], pos[1], pos[2]], "pos", precision, epsilon)
+        self._set_numeric_attrib(body, "quat", [quat[0], quat[1], quat[2], quat[3]], "quat", precision, epsilon)
+        self._bodies[body_name] = body
+
+        if collision_mesh_name == '':
+            self._add_element(body, "geom", {"mesh": mesh_name}, first=True)
+        else:
+            if not (self._first_set['collision_class'] and self._first_set['visual_class']):
+                raise ValueError("A 'collision_mesh_name' requires the 'collision' and 'visual' default classes (see 'collision_classes').")
+            if collision_mesh_name is not None:
+                self._add_element(body, "geom", {"class": "collision", "mesh": collision_mesh_name}, first=True)
+            self._add_element(body, "geom", {"class": "visual", "mesh": mesh_name}, first=True)
 
-        self._insert_after_first(insert_str, f'<geom mesh="{mesh_name}"/>')
+    def add_collision_geom(self, body_name: str, geom_type: str, size: Union[List[float], np.ndarray], pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), quat: Union[List[float], np.ndarray, Quaternion] = Quaternion(1, 0, 0, 0), precision: int = None, epsilon: float = None):
+        '''
+        Add a primitive collision geom (of the 'collision' default class) to a body.
+
+        Args:
+            body_name (str):                                The name of the body.
+            geom_type (str):                                The Mujoco geom type, e.g. "box", "cylinder" or "capsule".
+            size (List[float] | np.ndarray):                The size of the geom (Mujoco convention, e.g. half-sizes for boxes).
+            pos (List[float] | np.ndarray):                 The position of the geom in the body frame in the format [x, y, z]. Defaults to [0, 0, 0].
+            quat (List[float] | np.ndarray | Quaternion):   The orientation of the geom in the body frame in the format [w, x, y, z]. Defaults to [1, 0, 0, 0].
+            precision (int):                                The number of significant digits of size, pos and quat. Defaults to None (i.e. 'self.precision').
+            epsilon (float):                                The snapping threshold of size, pos and quat. Defaults to None (i.e. 'self.epsilon').
+        '''
+        if not self._first_set['collision_class']:
+            raise ValueError("Collision geoms require the 'collision' default class (see 'collision_classes').")
+        geom = self._add_element(self._get_body(body_name), "geom", {"class": "collision", "type": geom_type})
+        self._set_numeric_attrib(geom, "size", list(size), "pos", precision, epsilon)
+        self._set_numeric_attrib(geom, "pos", [pos[0], pos[1], pos[2]], "pos", precision, epsilon)
+        self._set_numeric_attrib(geom, "quat", [quat[0], quat[1], quat[2], quat[3]], "quat", precision, epsilon)
 
     # def add_body(self, body_name: str, mesh_name: str = '', pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), quat: Union[List[float], np.ndarray, Quaternion] = Quaternion(1, 0, 0, 0), parent_body_name: str = '', exclude_contact: bool = True):
     #     '''
@@ -248,46 +419,99 @@ class Mujoco_XML:
 
     #     self._insert_after_first(f'body name="{body_name}"', f'<geom mesh="{mesh_name}"/>')
 
-    def add_joint(self, body_name: str, joint_name: str, pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), axis: Union[List[float], np.ndarray] = np.array([0, 0, 1]), range: Union[List[float], np.ndarray] = np.array([-1, 1])):
+    def add_joint(self, body_name: str, joint_name: str, pos: Union[List[float], np.ndarray] = np.array([0, 0, 0]), axis: Union[List[float], np.ndarray] = np.array([0, 0, 1]), range: Union[List[float], np.ndarray] = np.array([-1, 1]), precision: int = None, epsilon: float = None):
         '''
         TODO (perfect/debug)
+
+        'precision' and 'epsilon' override 'self.precision' and 'self.epsilon' for pos, axis and range of this joint.
         '''
-        self._insert_after_first(f'body name="{body_name}"', f'<joint name="{joint_name}" pos="{pos[0]} {pos[1]} {pos[2]}" axis="{axis[0]} {axis[1]} {axis[2]}" range="{range[0]} {range[1]}"/>')
+        joint = self._add_element(self._get_body(body_name), "joint", {"name": joint_name}, first=True)
+        self._set_numeric_attrib(joint, "pos", [pos[0], pos[1], pos[2]], "pos", precision, epsilon)
+        self._set_numeric_attrib(joint, "axis", [axis[0], axis[1], axis[2]], "axis", precision, epsilon)
+        self._set_numeric_attrib(joint, "range", [range[0], range[1]], "range", precision, epsilon)
+        self._joints[joint_name] = joint
 
     def add_actuator(self, name: str, joint_name: str, actuator_type: str = 'position', ctrlrange: Union[List[float], np.ndarray] = np.array([-1, 1])):
         '''
         TODO (perfect/debug)
         '''
-        self._insert_before_last("actuator", f'<{actuator_type} name="{name}" joint="{joint_name}" ctrlrange="{ctrlrange[0]} {ctrlrange[1]}"/>')
+        self._add_element(self._sections["actuator"], actuator_type, {"name": name, "joint": joint_name, "ctrlrange": f"{ctrlrange[0]} {ctrlrange[1]}"})
 
     def exclude_contact(self, body1: str, body2: str):
         '''
         TODO (perfect/debug)
         '''
-        self._insert_before_last("contact", f'<exclude body1="{body1}" body2="{body2}"/>')
+        self._add_element(self._sections["contact"], "exclude", {"body1": body1, "body2": body2})
+
+    def set_contact_bits(self, body_name: str, contype: int, conaffinity: int):
+        '''
+        Set the contype/conaffinity bitmasks of all colliding geoms (i.e. not of the 'visual' class) of a body.
+
+        Args:
+            body_name (str):    The name of the body.
+            contype (int):      The contype bitmask.
+            conaffinity (int):  The conaffinity bitmask.
+        '''
+        for geom in self._get_body(body_name).findall("geom"):
+            if geom.get("class") != "visual":
+                geom.set("contype", str(contype))
+                geom.set("conaffinity", str(conaffinity))
 
     def add_joint_equality(self, joint1: str, joint2: str, factor: float = 1):
         '''
-        TODO: Remove extra added indentation 
+        TODO (perfect/debug)
         '''
         # Linear relationship (theta_2 = theta_1 * factor, usually t2 = a_0 + a_1 * t1 + ... + a_4 * t1^4 possible)
-        self._insert_before_last("equality", f'<joint joint1="{joint1}" joint2="{joint2}" polycoef="0 {factor} 0 0 0"/>')
+        self._add_element(self._sections["equality"], "joint", {"joint1": joint1, "joint2": joint2, "polycoef": f"0 {factor} 0 0 0"})
 
-    def export_xml(self, filepath: str = 'model.xml'):
+    def export_xml(self, filepath: str = 'model.xml', precision: int = None, epsilon: float = None, only_if_changed: bool = False) -> bool:
         '''
         Export the Mujoco XML file to the specified filepath.
 
         Args:
-            filepath (str): The file path to export the XML file to. Defaults to 'model.xml'.
+            filepath (str):         The file path to export the XML file to. Defaults to 'model.xml'.
+            precision (int):        The number of significant digits of pos/quat/axis/range values. Defaults to None (i.e. keep 'self.precision').
+            epsilon (float):        The snapping threshold of pos/quat/axis/range values. Defaults to None (i.e. keep 'self.epsilon').
+            only_if_changed (bool): Leave the file untouched if it already has the same content (keeps its modification time). Defaults to False.
+
+        Returns:
+            bool: Whether the file was written.
         '''
         if filepath == '':
             raise ValueError("ERROR in 'export_xml': 'filepath' cannot be empty.")
+
+        if precision is not None or epsilon is not None:
+            self.set_number_format(precision if precision is not None else self.precision, epsilon if epsilon is not None else self.epsilon)
         
         self._xml_path = os.path.abspath(filepath)# os.path.join(os.path.dirname(__file__), filepath)
         if os.path.dirname(self._xml_path) != '' and not os.path.exists(os.path.dirname(self._xml_path)):
             os.makedirs(os.path.dirname(self._xml_path))
-        with open(self._xml_path, 'w') as file:
-            file.write(self.model_str)
+        n_bytes = 0
+        if only_if_changed:
+            content = '\n'.join(self._serialize(self._root))
+            n_bytes = len(content.encode())
+            if os.path.isfile(self._xml_path):
+                with open(self._xml_path, 'r') as file:
+                    if file.read() == content:
+                        return False
+            with open(self._xml_path, 'w') as file:
+                file.write(content)
+        else:
+            with open(self._xml_path, 'w') as file:
+                for i, line in enumerate(self._serialize(self._root)):
+                    line = line if i == 0 else '\n' + line
+                    file.write(line)
+                    n_bytes += len(line.encode())
+
+        if self.precision is not None or self.epsilon > 0:
+            # Size of the same file with full precision values
+            full_bytes = n_bytes
+            for element, attribute, values, kind, _, _ in self._numeric_attribs:
+                full_bytes += len(' '.join([f'{value}' for value in values]).encode()) - len(element.get(attribute).encode())
+            reduction = 100 * (1 - n_bytes / full_bytes) if full_bytes > 0 else 0
+            print(f"Exported {self._xml_path}: {n_bytes} bytes instead of {full_bytes} bytes ({reduction:.1f}% smaller). "
+                  f"Max. error introduced: {self._max_errors['pos']:.2e} (pos), {self._max_errors['rot']:.2e} rad (quat/axis), {self._max_errors['range']:.2e} rad (range)")
+        return True
 
 # def export_xml(self, filepath: str = 'model.xml'):
 #     '''
@@ -313,36 +537,106 @@ class Mujoco_XML:
 
     def run_interactive(self, filepath: str = ''):
         '''
-        Run the interactive window for the Mujoco XML file.
+        Run the interactive window for the Mujoco XML file (in a separate process, which loads the cached compiled model if 'model_cache' is given).
 
-        Note:
-            Be sure mujoco_sim.sh is in your PATH or in the same directory as this file.
+        Args:
+            filepath (str): The path to the XML file. Defaults to the last exported file (which is exported if it does not exist).
+        '''
+        model_path = self.compiled_model_path(filepath)
+        print(colored("Running Mujoco viewer for:", "cyan") + f"\t {os.path.basename(filepath or self._xml_path)}" + (f" (compiled model {model_path})" if model_path.endswith(".mjb") else ""))
+        subprocess.Popen([sys.executable, "-m", "mujoco.viewer", f"--mjcf={model_path}"], cwd=os.path.dirname(model_path), start_new_session=True)
+
+    def load_model(self, filepath: str = '') -> mujoco.MjModel:
+        '''
+        Load the compiled Mujoco model of the XML file, through 'model_cache' if given.
+
+        Args:
+            filepath (str): The path to the XML file. Defaults to the last exported file (which is exported if it does not exist).
+
+        Returns:
+            mujoco.MjModel: The compiled model.
         '''
         if filepath == '':
             filepath = self._xml_path
         if not os.path.exists(filepath):
             self.export_xml(filepath)
-        subprocess.run(f"cd {os.path.dirname(filepath)} && bash {self._mujoco_sim_path}", shell=True, check=True)
+        if self.model_cache is None:
+            return mujoco.MjModel.from_xml_path(os.path.abspath(filepath))
+        return self.model_cache.load(filepath)
+
+    def compiled_model_path(self, filepath: str = '') -> str:
+        '''
+        Get the path worker processes should load the model from: the cached compiled model if 'model_cache' is given, otherwise the XML file.
+
+        Args:
+            filepath (str): The path to the XML file. Defaults to the last exported file (which is exported if it does not exist).
+
+        Returns:
+            str: The absolute path of the .mjb or .xml file.
+        '''
+        if filepath == '':
+            filepath = self._xml_path
+        if not os.path.exists(filepath):
+            self.export_xml(filepath)
+        return os.path.abspath(self.model_cache.compiled_path(filepath) if self.model_cache is not None else filepath)
+
+    def rollout(self, controls: Union[np.ndarray, Dict[str, np.ndarray]], filepath: str = '', initial_qpos: np.ndarray = None, initial_qvel: np.ndarray = None, n_workers: int = None, n_substeps: int = 1, max_contacts: int = 16) -> Dict[str, np.ndarray]:
+        '''
+        Simulate a batch of control sequences for the actuators (see 'add_actuator') without a display, across a process pool (see 'Rollout').
+        The workers load the cached compiled model if 'model_cache' is given.
+
+        Args:
+            controls (Union[np.ndarray, Dict[str, np.ndarray]]):    (n_rollouts, n_steps, nu) controls, or actuator name -> (n_rollouts, n_steps) controls.
+            filepath (str):                                         The path to the XML file. Defaults to the last exported file (which is exported if it does not exist).
+            initial_qpos (np.ndarray):                              The initial joint positions (per rollout or shared). Defaults to the model's 'qpos0'.
+            initial_qvel (np.ndarray):                              The initial joint velocities (per rollout or shared). Defaults to 0.
+            n_workers (int):                                        The number of worker processes (None = number of CPU cores).
+            n_substeps (int):                                       The physics steps per control step.
+            max_contacts (int):                                     The contacts stored per step.
+
+        Returns:
+            Dict[str, np.ndarray]: The stacked 'qpos', 'qvel', 'ctrl', 'ncon', 'contacts' and 'contact_dist' arrays (see 'Rollout.run').
+        '''
+        rollout = Rollout(model_path=self.compiled_model_path(filepath), n_workers=n_workers, n_substeps=n_substeps, max_contacts=max_contacts)
+        try:
+            result = rollout.run(controls, initial_qpos=initial_qpos, initial_qvel=initial_qvel)
+        finally:
+            rollout.close()
+        rollout.print_summary()
+        return result
+
+    def asset_dict(self) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+        '''
+        Get the contents of all assets, keyed by the file names as they are referenced in the XML (see 'read_asset').
+
+        Returns:
+            Tuple[Dict[str, bytes], Dict[str, str]]: File name -> content, and file name -> content hash.
+        '''
+        assets = {}
+        hashes = {}
+        for filepath, source in self._assets:
+            assets[filepath], hashes[filepath] = read_asset(source)
+        return assets, hashes
+
+    def compile_model(self) -> mujoco.MjModel:
+        '''
+        Compile the model directly from 'model_str' and the asset contents in memory (no exported file or copied assets needed),
+        through 'model_cache' if given. Relative asset paths are relative to the working directory.
+
+        Returns:
+            mujoco.MjModel: The compiled model.
+        '''
+        assets, hashes = self.asset_dict()
+        if self.model_cache is None:
+            return mujoco.MjModel.from_xml_string(self.model_str, assets)
+        return self.model_cache.load_string(self.model_str, assets, hashes)
 
     def run_simulation(self):
         '''
-        (Still TODO) Run the physics simulation using the Mujoco XML file. Includes inputs etc.
-
-        Note:
-            Make sure to run the script from its directory.
-        '''
-        subprocess.run(["mkdir", "-p", "/tmp/assets"])
-        model_str = self.model_str
-        for asset in self._assets:
-            print("Copying", asset)
-            subprocess.run(["cp", asset, "/tmp/assets/"])
-            model_str = model_str.replace(asset, f"/tmp/assets/{os.path.basename(asset)}")
-                
-        model = load_model_from_xml(model_str)
-        sim = MjSim(model)
-        viewer = MjViewer(sim)
-        while True:
-            viewer.render()
+        Run the physics simulation of the model in the interactive viewer, compiled in memory (see 'compile_model'). Blocks until the viewer is closed.
+        For simulating control sequences without a display, see 'rollout'.
+        '''
+        mujoco.viewer.launch(self.compile_model())
 
 if __name__ == "__main__":
     env = Mujoco_XML(model_name='exclude_main_template.xml')
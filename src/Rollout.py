@@ -0,0 +1,207 @@
+import os
+import time
+import numpy as np
+import mujoco
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from termcolor import colored
+
+# Model and data of a rollout worker process (loaded once per worker by '_init_rollout_worker')
+_worker_model: mujoco.MjModel = None
+_worker_data: mujoco.MjData = None
+
+def load_compiled_model(model_path: str) -> mujoco.MjModel:
+    '''
+    Load a Mujoco model from an XML file or a compiled (.mjb) model.
+
+    Args:
+        model_path (str): The path to the .xml or .mjb file.
+
+    Returns:
+        mujoco.MjModel: The compiled model.
+    '''
+    if model_path.lower().endswith(".mjb"):
+        return mujoco.MjModel.from_binary_path(model_path)
+    return mujoco.MjModel.from_xml_path(model_path)
+
+def _set_worker_model(model: mujoco.MjModel) -> None:
+    '''
+    Set the model (and a fresh data object) that '_rollout_job' simulates in this process.
+    '''
+    global _worker_model, _worker_data
+    _worker_model = model
+    _worker_data = mujoco.MjData(model)
+
+def _init_rollout_worker(model_path: str) -> None:
+    '''
+    Load the model once per worker process. Defined on module level, so that it can be used in a process pool.
+    '''
+    _set_worker_model(load_compiled_model(model_path))
+
+def _rollout_job(job: Tuple[np.ndarray, np.ndarray, np.ndarray, int, int]) -> Tuple[Dict[str, np.ndarray], Tuple[int, int, float]]:
+    '''
+    Simulate a chunk of rollouts in the worker's model. Defined on module level, so that it can be used in a process pool.
+
+    Args:
+        job (Tuple): The (b, T, nu) controls, the (b, nq) initial positions and (b, nv) initial velocities (None for the model defaults),
+                     the physics steps per control step and the number of contacts stored per step.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Tuple[int, int, float]]: The recorded arrays and the (process id, physics steps, seconds) of the worker.
+    '''
+    controls, initial_qpos, initial_qvel, n_substeps, max_contacts = job
+    model, data = _worker_model, _worker_data
+    n_rollouts, n_steps, _ = controls.shape
+    result = {
+        "qpos": np.empty((n_rollouts, n_steps, model.nq)),
+        "qvel": np.empty((n_rollouts, n_steps, model.nv)),
+        "ctrl": np.empty((n_rollouts, n_steps, model.nu)),
+        "ncon": np.zeros((n_rollouts, n_steps), dtype=np.int32),
+        "contacts": np.full((n_rollouts, n_steps, max_contacts, 2), -1, dtype=np.int32),
+        "contact_dist": np.full((n_rollouts, n_steps, max_contacts), np.nan),
+    }
+
+    start = time.perf_counter()
+    for rollout in range(n_rollouts):
+        mujoco.mj_resetData(model, data)
+        if initial_qpos is not None:
+            data.qpos[:] = initial_qpos[rollout]
+        if initial_qvel is not None:
+            data.qvel[:] = initial_qvel[rollout]
+        for step in range(n_steps):
+            data.ctrl[:] = controls[rollout, step]
+            mujoco.mj_step(model, data, n_substeps)
+            result["qpos"][rollout, step] = data.qpos
+            result["qvel"][rollout, step] = data.qvel
+            result["ctrl"][rollout, step] = data.ctrl
+            result["ncon"][rollout, step] = data.ncon
+            n_stored = min(data.ncon, max_contacts)
+            if n_stored > 0:
+                result["contacts"][rollout, step, :n_stored] = data.contact.geom[:n_stored]
+                result["contact_dist"][rollout, step, :n_stored] = data.contact.dist[:n_stored]
+    elapsed = time.perf_counter() - start
+    return result, (os.getpid(), n_rollouts * n_steps * n_substeps, elapsed)
+
+@dataclass
+class Rollout:
+    # Neccesary inputs
+    model_path:         str = field() # The XML file or compiled (.mjb) model, loaded once per worker
+
+    # Optional inputs
+    n_workers:          int = None  # Number of worker processes (None = number of CPU cores, 1 = simulate in this process)
+    n_substeps:         int = 1     # Physics steps per control step
+    max_contacts:       int = 16    # Contacts stored per step (the count 'ncon' is always complete)
+    chunks_per_worker:  int = 4     # Rollouts are split into this many jobs per worker, to balance the load
+
+    # Public variables, not to be set by user
+    model:              mujoco.MjModel              = field(init=False, default=None) # The model in this process (for actuator names and array shapes)
+    worker_stats:       Dict[int, Dict[str, float]] = field(init=False, default_factory=dict) # Process id -> 'steps', 'time' and 'steps_per_second' of the last run
+    wall_time:          float                       = field(init=False, default=0.0) # Seconds of the last run
+
+    # Internal variables
+    _executor:  ProcessPoolExecutor = field(init=False, default=None)
+
+    def __post_init__(self):
+        self.model = load_compiled_model(self.model_path)
+        if self.n_workers is None:
+            self.n_workers = os.cpu_count()
+
+    @property
+    def actuator_names(self) -> List[str]:
+        '''
+        The actuator names in the order of the control dimension (the order of 'add_actuator').
+        '''
+        return [mujoco.mj_id2name(self.model, mujoco.mjtObj.mjOBJ_ACTUATOR, actuator_id) for actuator_id in range(self.model.nu)]
+
+    def _control_array(self, controls: Union[np.ndarray, Dict[str, np.ndarray]]) -> np.ndarray:
+        '''
+        Convert controls to a (n_rollouts, n_steps, nu) array.
+
+        Args:
+            controls (Union[np.ndarray, Dict[str, np.ndarray]]): A (n_rollouts, n_steps, nu) or (n_steps, nu) array, or actuator name ->
+                                                                 (n_rollouts, n_steps) or (n_steps,) array (missing actuators get 0).
+        '''
+        if isinstance(controls, dict):
+            unknown = set(controls) - set(self.actuator_names)
+            if len(controls) == 0 or unknown:
+                raise ValueError(f"Unknown actuator(s) {sorted(unknown)}. The model has the actuators {self.actuator_names}.")
+            shape = np.broadcast_shapes(*(np.shape(values) for values in controls.values()))
+            controls = np.stack([np.broadcast_to(controls.get(name, 0.0), shape) for name in self.actuator_names], axis=-1)
+        controls = np.asarray(controls, dtype=np.float64)
+        if controls.ndim == 2:
+            controls = controls[np.newaxis]
+        if controls.ndim != 3 or controls.shape[2] != self.model.nu:
+            raise ValueError(f"Controls must have the shape (n_rollouts, n_steps, {self.model.nu}), not {controls.shape}.")
+        return controls
+
+    def run(self, controls: Union[np.ndarray, Dict[str, np.ndarray]], initial_qpos: np.ndarray = None, initial_qvel: np.ndarray = None) -> Dict[str, np.ndarray]:
+        '''
+        Simulate a batch of control sequences without a display, split across the worker processes.
+
+        Args:
+            controls (Union[np.ndarray, Dict[str, np.ndarray]]):    The controls per rollout and step, see '_control_array'.
+            initial_qpos (np.ndarray):                              The (nq,) or (n_rollouts, nq) initial joint positions. Defaults to the model's 'qpos0'.
+            initial_qvel (np.ndarray):                              The (nv,) or (n_rollouts, nv) initial joint velocities. Defaults to 0.
+
+        Returns:
+            Dict[str, np.ndarray]: The state after every control step, stacked over rollouts and steps:
+                                   'qpos' (n_rollouts, n_steps, nq), 'qvel' (n_rollouts, n_steps, nv), 'ctrl' (n_rollouts, n_steps, nu),
+                                   'ncon' (n_rollouts, n_steps), 'contacts' (n_rollouts, n_steps, max_contacts, 2) geom ids (-1 if unused)
+                                   and 'contact_dist' (n_rollouts, n_steps, max_contacts) distances (NaN if unused).
+        '''
+        controls = self._control_array(controls)
+        n_rollouts = controls.shape[0]
+        if initial_qpos is not None:
+            initial_qpos = np.broadcast_to(np.asarray(initial_qpos, dtype=np.float64), (n_rollouts, self.model.nq))
+        if initial_qvel is not None:
+            initial_qvel = np.broadcast_to(np.asarray(initial_qvel, dtype=np.float64), (n_rollouts, self.model.nv))
+
+        n_chunks = max(min(n_rollouts, self.n_workers * self.chunks_per_worker if self.n_workers > 1 else 1), 1)
+        chunks = np.array_split(np.arange(n_rollouts), n_chunks)
+        jobs = [(controls[chunk], None if initial_qpos is None else initial_qpos[chunk], None if initial_qvel is None else initial_qvel[chunk], self.n_substeps, self.max_contacts) for chunk in chunks]
+
+        start = time.perf_counter()
+        if self.n_workers > 1:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_rollout_worker, initargs=(os.path.abspath(self.model_path),))
+            outputs = list(self._executor.map(_rollout_job, jobs))
+        else:
+            if _worker_model is not self.model:
+                _set_worker_model(self.model)
+            outputs = [_rollout_job(job) for job in jobs]
+        self.wall_time = time.perf_counter() - start
+
+        self.worker_stats = {}
+        for _, (pid, n_steps, elapsed) in outputs:
+            stats = self.worker_stats.setdefault(pid, {"steps": 0, "time": 0.0})
+            stats["steps"] += n_steps
+            stats["time"] += elapsed
+        for stats in self.worker_stats.values():
+            stats["steps_per_second"] = stats["steps"] / stats["time"] if stats["time"] > 0 else 0.0
+
+        return {name: np.concatenate([result[name] for result, _ in outputs]) for name in outputs[0][0]}
+
+    @property
+    def steps_per_second(self) -> float:
+        '''
+        The physics steps per second of all workers together in the last run.
+        '''
+        return sum(stats["steps"] for stats in self.worker_stats.values()) / self.wall_time if self.wall_time > 0 else 0.0
+
+    def close(self):
+        '''
+        Shut down the worker processes.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def print_summary(self):
+        '''
+        Print the throughput of the last run, in total and per worker.
+        '''
+        print(colored("Rollout", "cyan") + f": {sum(stats['steps'] for stats in self.worker_stats.values())} physics steps in {self.wall_time:.2f} s "
+              f"({self.steps_per_second:.0f} steps/s with {len(self.worker_stats)} worker(s))")
+        for pid, stats in sorted(self.worker_stats.items()):
+            print(f"  Worker {pid}: {stats['steps']} steps in {stats['time']:.2f} s ({stats['steps_per_second']:.0f} steps/s)")
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Tuple
+
+@dataclass
+class STL_Mesh:
+    # Neccesary inputs
+    filepath: str = field()
+
+    # Public variables, not to be set by user
+    # /
+
+    # Internal variables
+    _triangles:     np.ndarray  = field(init=False, default=None) # Structured array, memory-mapped for binary STL files
+    _is_binary:     bool        = field(init=False, default=None)
+    _n_triangles:   int         = field(init=False, default=None)
+
+    HEADER_SIZE = 80
+    TRIANGLE_DTYPE = np.dtype([
+        ('normal', '<f4', (3,)),
+        ('vectors', '<f4', (3, 3)),
+        ('attr', '<u2'),
+    ]) # 50 bytes per triangle
+
+    def __post_init__(self):
+        if not os.path.isfile(self.filepath):
+            raise FileNotFoundError(f"The file {self.filepath} does not exist.")
+
+    def _read_header(self):
+        '''
+        Read the header of the STL file (only 84 bytes) and determine whether it is a binary or ASCII STL file.
+        '''
+        filesize = os.path.getsize(self.filepath)
+        with open(self.filepath, 'rb') as file:
+            header = file.read(self.HEADER_SIZE + 4)
+
+        if len(header) == self.HEADER_SIZE + 4:
+            n_triangles = int(np.frombuffer(header[self.HEADER_SIZE:], dtype='<u4')[0])
+            if filesize == self.HEADER_SIZE + 4 + n_triangles * self.TRIANGLE_DTYPE.itemsize:
+                # Binary STL headers may also start with "solid", so the file size decides
+                self._is_binary = True
+                self._n_triangles = n_triangles
+                return
+
+        if header.lstrip().startswith(b"solid"):
+            self._is_binary = False
+        else:
+            raise ValueError(f"The file {self.filepath} is not a valid STL file (triangle count in header does not match the file size).")
+
+    @property
+    def is_binary(self) -> bool:
+        '''
+        Whether the STL file is binary (True) or ASCII (False).
+        '''
+        if self._is_binary is None:
+            self._read_header()
+        return self._is_binary
+
+    @property
+    def n_triangles(self) -> int:
+        '''
+        The number of triangles. For binary STL files only the header is read.
+        '''
+        if self._n_triangles is None and not self.is_binary:
+            self._n_triangles = len(self.triangles)
+        return self._n_triangles
+
+    @property
+    def triangles(self) -> np.ndarray:
+        '''
+        The structured (n,) triangle array with the fields 'normal', 'vectors' and 'attr'.
+        Binary STL files are memory-mapped (read-only, no copy), ASCII STL files are parsed line by line.
+        '''
+        if self._triangles is None:
+            if self.is_binary:
+                if self._n_triangles == 0:
+                    self._triangles = np.zeros(0, dtype=self.TRIANGLE_DTYPE)
+                else:
+                    self._triangles = np.memmap(self.filepath, dtype=self.TRIANGLE_DTYPE, mode='r', offset=self.HEADER_SIZE + 4, shape=(self._n_triangles,))
+            else:
+                self._triangles = self._parse_ascii()
+        return self._triangles
+
+    @property
+    def vectors(self) -> np.ndarray:
+        '''
+        The (n, 3, 3) triangle vertices (a view on 'triangles', no copy).
+        '''
+        return self.triangles['vectors']
+
+    @property
+    def normals(self) -> np.ndarray:
+        '''
+        The (n, 3) triangle normals as stored in the file (a view on 'triangles', no copy).
+        '''
+        return self.triangles['normal']
+
+    def _parse_ascii(self) -> np.ndarray:
+        '''
+        Parse an ASCII STL file line by line.
+
+        Returns:
+            np.ndarray: The structured triangle array.
+        '''
+        normals = []
+        vertices = []
+        with open(self.filepath, 'r', errors='replace') as file:
+            for line in file:
+                words = line.split()
+                if len(words) == 0:
+                    continue
+                if words[0] == "facet" and len(words) == 5:
+                    normals.append([float(value) for value in words[2:5]])
+                elif words[0] == "vertex" and len(words) == 4:
+                    vertices.append([float(value) for value in words[1:4]])
+
+        if len(vertices) != 3 * len(normals):
+            raise ValueError(f"The ASCII STL file {self.filepath} is malformed ({len(normals)} facets, {len(vertices)} vertices).")
+
+        triangles = np.zeros(len(normals), dtype=self.TRIANGLE_DTYPE)
+        if len(normals) > 0:
+            triangles['normal'] = np.array(normals, dtype=np.float32)
+            triangles['vectors'] = np.array(vertices, dtype=np.float32).reshape(-1, 3, 3)
+        return triangles
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Calculate the axis-aligned bounding box of the mesh.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The minimum and maximum corner of the bounding box.
+        '''
+        vertices = self.vectors.reshape(-1, 3)
+        return vertices.min(axis=0), vertices.max(axis=0)
+
+    def surface_area(self) -> float:
+        '''
+        Calculate the surface area of the mesh.
+
+        Returns:
+            float: The surface area (in the units of the STL file, squared).
+        '''
+        vectors = self.vectors.astype(np.float64)
+        return float(0.5 * np.linalg.norm(np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0]), axis=1).sum())
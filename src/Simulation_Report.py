@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import mujoco
+from dataclasses import dataclass, field
+from typing import Dict
+from termcolor import colored
+from src.Rollout import load_compiled_model
+
+def sweep_controls(model: mujoco.MjModel, sweep_duration: float = 1.0) -> np.ndarray:
+    '''
+    Controls that sweep every actuator through its control range (rest -> low -> high -> rest), one actuator after the other
+    and finally all of them together. Actuators rest at 0 (clipped to their range).
+
+    Args:
+        model (mujoco.MjModel): The model.
+        sweep_duration (float): The seconds of simulated time per sweep.
+
+    Returns:
+        np.ndarray: The (n_steps, nu) controls, one row per physics step.
+    '''
+    n_sweep = max(int(round(sweep_duration / model.opt.timestep)), 1)
+    low, high = model.actuator_ctrlrange[:, 0].copy(), model.actuator_ctrlrange[:, 1].copy()
+    unlimited = low >= high # No range to sweep
+    low[unlimited] = high[unlimited] = 0.0
+    rest = np.clip(0.0, low, high)
+
+    # Piecewise linear: rest -> low -> high -> rest
+    phase = np.linspace(0.0, 1.0, n_sweep, endpoint=False)[:, np.newaxis]
+    sweep = np.where(phase < 0.25, rest + (low - rest) * phase / 0.25,
+                     np.where(phase < 0.75, low + (high - low) * (phase - 0.25) / 0.5, high + (rest - high) * (phase - 0.75) / 0.25))
+
+    controls = np.tile(rest, ((model.nu + 1) * n_sweep, 1))
+    for actuator in range(model.nu):
+        controls[actuator * n_sweep:(actuator + 1) * n_sweep, actuator] = sweep[:, actuator]
+    controls[model.nu * n_sweep:] = sweep
+    return controls
+
+@dataclass
+class Simulation_Report:
+    # Neccesary inputs
+    model_path:         str = field() # The XML file or compiled (.mjb) model, e.g. the exported hand
+
+    # Optional inputs
+    sweep_duration:     float   = 1.0   # Seconds of simulated time per actuator sweep (see 'sweep_controls')
+    sample_interval:    int     = 10    # Steps between the samples of the narrow-phase cost per geom pair
+    n_timing:           int     = 3     # Timed distance queries per pair and sample (the fastest counts)
+
+    # Public variables, not to be set by user
+    model:      mujoco.MjModel  = field(init=False, default=None)
+    results:    Dict            = field(init=False, default_factory=dict) # See 'run'
+
+    # Internal variables
+    _pairs:     np.ndarray      = field(init=False, default=None) # (n_pairs, 2) geom pairs that can collide (contact filters and excludes applied)
+
+    def __post_init__(self):
+        self.model = load_compiled_model(self.model_path)
+        self._pairs = self._collision_pairs()
+
+    def _collision_pairs(self) -> np.ndarray:
+        '''
+        Find the geom pairs Mujoco checks for collisions: contype/conaffinity match, not within one (welded) body, not parent and child
+        (unless the parent filter is disabled) and not excluded.
+        '''
+        model = self.model
+        weld = model.body_weldid
+        weld_parent = weld[model.body_parentid[weld]]
+        filter_parent = not (model.opt.disableflags & mujoco.mjtDisableBit.mjDSBL_FILTERPARENT)
+        excluded = set(model.exclude_signature.tolist())
+
+        pairs = []
+        for geom1 in range(model.ngeom):
+            for geom2 in range(geom1 + 1, model.ngeom):
+                if not (model.geom_contype[geom1] & model.geom_conaffinity[geom2] or model.geom_contype[geom2] & model.geom_conaffinity[geom1]):
+                    continue
+                body1, body2 = sorted((model.geom_bodyid[geom1], model.geom_bodyid[geom2]))
+                weld1, weld2 = weld[body1], weld[body2]
+                if weld1 == weld2:
+                    continue
+                if filter_parent and weld1 != 0 and weld2 != 0 and (weld1 == weld_parent[weld2] or weld2 == weld_parent[weld1]):
+                    continue
+                if (body1 << 16) + body2 in excluded:
+                    continue
+                pairs.append((geom1, geom2))
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def _candidates(self, data: mujoco.MjData) -> np.ndarray:
+        '''
+        Find the pairs whose bounding boxes (grown by their margins) overlap in the current state, i.e. that reach the narrow phase.
+
+        Returns:
+            np.ndarray: A (n_pairs,) boolean mask.
+        '''
+        model = self.model
+        if len(self._pairs) == 0:
+            return np.zeros(0, dtype=bool)
+        rotations = data.geom_xmat.reshape(-1, 3, 3)
+        centers = data.geom_xpos + np.einsum("gij,gj->gi", rotations, model.geom_aabb[:, :3])
+        half_sizes = np.einsum("gij,gj->gi", np.abs(rotations), model.geom_aabb[:, 3:])
+        geom1, geom2 = self._pairs[:, 0], self._pairs[:, 1]
+        margins = np.maximum(model.geom_margin[geom1], model.geom_margin[geom2])
+        return np.all(np.abs(centers[geom1] - centers[geom2]) <= half_sizes[geom1] + half_sizes[geom2] + margins[:, np.newaxis], axis=1)
+
+    def _geom_info(self, geom: int) -> Dict:
+        '''
+        Get the body (the Fusion component), mesh and mesh file of a geom.
+        '''
+        model = self.model
+        body = mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_BODY, model.geom_bodyid[geom])
+        if model.geom_type[geom] != mujoco.mjtGeom.mjGEOM_MESH:
+            return {"body": body, "mesh": mujoco.mjtGeom(model.geom_type[geom]).name[len("mjGEOM_"):].lower(), "file": None, "vertices": 0, "hull_vertices": 0}
+        mesh = model.geom_dataid[geom]
+        path = model.paths[model.mesh_pathadr[mesh]:].split(b"\0", 1)[0].decode() if model.mesh_pathadr[mesh] >= 0 else None
+        graph = model.mesh_graphadr[mesh]
+        return {"body": body, "mesh": mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_MESH, mesh), "file": path, "vertices": int(model.mesh_vertnum[mesh]),
+                "hull_vertices": int(model.mesh_graph[graph]) if graph >= 0 else int(model.mesh_vertnum[mesh])}
+
+    def run(self) -> Dict:
+        '''
+        Step the actuator sweep and collect the cost statistics.
+
+        Returns:
+            Dict: 'per_step' (mean/max contacts, solver iterations, constraint rows and rows per constraint type), 'time_share' (of collision,
+                  broad phase, narrow phase and constraint solver in the step time), 'pairs' and 'components' (ranked by their estimated
+                  share of the narrow-phase time, with contacts, body/component names and mesh files).
+        '''
+        model = self.model
+        data = mujoco.MjData(model)
+        controls = sweep_controls(model, self.sweep_duration)
+        n_steps = len(controls)
+        constraint_names = [name[len("mjCNSTR_"):].lower() for name in mujoco.mjtConstraint.__members__]
+
+        ncon = np.zeros(n_steps, dtype=np.int64)
+        niter = np.zeros(n_steps, dtype=np.int64)
+        nefc = np.zeros(n_steps, dtype=np.int64)
+        constraint_rows = np.zeros((n_steps, len(constraint_names)), dtype=np.int64)
+        pair_index = {(geom1, geom2): index for index, (geom1, geom2) in enumerate(self._pairs.tolist())}
+        pair_contacts = np.zeros(len(self._pairs), dtype=np.int64)
+        pair_contact_steps = np.zeros(len(self._pairs), dtype=np.int64)
+        pair_candidate_steps = np.zeros(len(self._pairs), dtype=np.int64) # Counted at the samples only
+        pair_seconds = np.zeros(len(self._pairs)) # Distance query time, summed over the samples
+        n_samples = 0
+
+        # Mujoco's timers only run with a time callback
+        previous_callback = mujoco.get_mjcb_time()
+        mujoco.set_mjcb_time(time.perf_counter)
+        try:
+            for step, ctrl in enumerate(controls):
+                data.ctrl[:] = ctrl
+                mujoco.mj_step(model, data)
+
+                ncon[step] = data.ncon
+                niter[step] = data.solver_niter[:max(data.nisland, 1)].sum()
+                nefc[step] = data.nefc
+                constraint_rows[step] = np.bincount(data.efc_type[:data.nefc], minlength=len(constraint_names))
+                if data.ncon > 0:
+                    contact_pairs, counts = np.unique(np.sort(data.contact.geom[:data.ncon], axis=1), axis=0, return_counts=True)
+                    for (geom1, geom2), count in zip(contact_pairs.tolist(), counts):
+                        index = pair_index.get((geom1, geom2))
+                        if index is not None:
+                            pair_contacts[index] += count
+                            pair_contact_steps[index] += 1
+
+                if step % self.sample_interval == 0:
+                    # The narrow-phase cost per pair is estimated by timing Mujoco's distance query for every pair that passes the broad phase
+                    n_samples += 1
+                    for index in np.flatnonzero(self._candidates(data)):
+                        geom1, geom2 = self._pairs[index]
+                        distmax = max(model.geom_margin[geom1], model.geom_margin[geom2])
+                        fastest = np.inf
+                        for _ in range(self.n_timing):
+                            start = time.perf_counter()
+                            mujoco.mj_geomDistance(model, data, geom1, geom2, distmax, None)
+                            fastest = min(fastest, time.perf_counter() - start)
+                        pair_candidate_steps[index] += 1
+                        pair_seconds[index] += fastest
+        finally:
+            mujoco.set_mjcb_time(previous_callback)
+
+        timer = lambda name: data.timer[getattr(mujoco.mjtTimer, name)].duration
+        step_time = timer("mjTIMER_STEP")
+        narrow_time = timer("mjTIMER_COL_NARROW")
+
+        # Distribute the measured narrow-phase time over the pairs in proportion to their estimated cost
+        shares = pair_seconds / pair_seconds.sum() * narrow_time / step_time if pair_seconds.sum() > 0 and step_time > 0 else np.zeros(len(self._pairs))
+        pairs = []
+        for index in np.argsort(-shares, kind="stable"):
+            if pair_candidate_steps[index] == 0 and pair_contacts[index] == 0:
+                continue
+            geom1, geom2 = self._pairs[index].tolist()
+            pairs.append({"geoms": [geom1, geom2], "infos": [self._geom_info(geom1), self._geom_info(geom2)], "step_share": float(shares[index]),
+                          "narrow_phase_fraction": float(pair_candidate_steps[index] / n_samples), # Fraction of the samples in which the pair reaches the narrow phase
+                          "query_us": float(1e6 * pair_seconds[index] / pair_candidate_steps[index]) if pair_candidate_steps[index] > 0 else 0.0,
+                          "contacts_per_step": float(pair_contacts[index] / n_steps), "contact_fraction": float(pair_contact_steps[index] / n_steps)})
+
+        # Per component (body): pair costs are split in proportion to the (convex hull) vertices of the two geoms, as these drive the narrow phase
+        components = {}
+        for pair in pairs:
+            weights = np.array([max(info["hull_vertices"], 1) for info in pair["infos"]], dtype=np.float64)
+            for info, weight in zip(pair["infos"], weights / weights.sum()):
+                component = components.setdefault(info["body"], {"body": info["body"], "meshes": {}, "step_share": 0.0, "contacts_per_step": 0.0})
+                component["meshes"][info["mesh"]] = {"file": info["file"], "vertices": info["vertices"], "hull_vertices": info["hull_vertices"]}
+                component["step_share"] += pair["step_share"] * weight
+                component["contacts_per_step"] += pair["contacts_per_step"]
+        components = sorted(components.values(), key=lambda component: component["step_share"], reverse=True)
+
+        self.results = {
+            "model": os.path.abspath(self.model_path), "n_steps": n_steps, "timestep": model.opt.timestep, "n_pairs": len(self._pairs),
+            "steps_per_second": n_steps / step_time if step_time > 0 else 0.0,
+            "per_step": {
+                "contacts": {"mean": float(ncon.mean()), "max": int(ncon.max())},
+                "solver_iterations": {"mean": float(niter.mean()), "max": int(niter.max())},
+                "constraint_rows": {"mean": float(nefc.mean()), "max": int(nefc.max())},
+                "constraint_rows_per_type": {name: float(rows) for name, rows in zip(constraint_names, constraint_rows.mean(axis=0)) if rows > 0},
+            },
+            "time_share": {name: timer(f"mjTIMER_{key}") / step_time if step_time > 0 else 0.0 for name, key in
+                           [("collision", "POS_COLLISION"), ("broad_phase", "COL_BROAD"), ("narrow_phase", "COL_NARROW"), ("constraint", "CONSTRAINT")]},
+            "pairs": pairs,
+            "components": components,
+        }
+        return self.results
+
+    def write_json(self, filepath: str):
+        '''
+        Write the results of 'run' to a JSON file.
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        with open(filepath, 'w') as json_file:
+            json.dump(self.results, json_file, indent=1)
+
+    def print_summary(self, n_top: int = 10):
+        '''
+        Print the step statistics and the most expensive geom pairs and components (the parts to simplify first).
+
+        Args:
+            n_top (int): The number of pairs and components shown.
+        '''
+        results = self.results
+        per_step = results["per_step"]
+        print(colored("Simulation report", "cyan") + f": {results['n_steps']} steps ({results['steps_per_second']:.0f} steps/s), {results['n_pairs']} collision pairs")
+        print(f"  Per step: {per_step['contacts']['mean']:.1f} contacts (max {per_step['contacts']['max']}), {per_step['solver_iterations']['mean']:.1f} solver iterations "
+              f"(max {per_step['solver_iterations']['max']}), {per_step['constraint_rows']['mean']:.1f} constraint rows (" +
+              ", ".join(f"{name} {rows:.1f}" for name, rows in per_step["constraint_rows_per_type"].items()) + ")")
+        print("  Step time: " + ", ".join(f"{name.replace('_', ' ')} {100 * share:.0f}%" for name, share in results["time_share"].items()))
+        print(f"  Most expensive pairs (share of the step time):")
+        for pair in results["pairs"][:n_top]:
+            names = " - ".join(f"{info['body']} ({info['mesh']}, {info['hull_vertices']} hull vertices)" for info in pair["infos"])
+            print(f"    {100 * pair['step_share']:5.1f}%  {names}: narrow phase in {100 * pair['narrow_phase_fraction']:.0f}% of the steps, "
+                  f"{pair['query_us']:.1f} us per query, {pair['contacts_per_step']:.2f} contacts per step")
+        print(f"  Components to simplify first:")
+        for component in results["components"][:n_top]:
+            files = ", ".join(os.path.basename(mesh["file"]) if mesh["file"] else name for name, mesh in component["meshes"].items())
+            print(f"    {100 * component['step_share']:5.1f}%  {component['body']} ({files})")
+
+if __name__ == "__main__":
+    # E.g. python -m src.Simulation_Report output/DexterousDynamos.xml
+    report = Simulation_Report(model_path=sys.argv[1] if len(sys.argv) > 1 else "output/DexterousDynamos.xml")
+    report.run()
+    report.print_summary()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import resource
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Tuple
+from concurrent.futures import Executor
+from termcolor import colored
+from src.utils import bytes_to_mb
+
+def _read_memory() -> Tuple[int, int]:
+    '''
+    Get the current and the peak resident memory (bytes) of this process. The peak is since the last '_reset_peak_memory' on Linux,
+    otherwise since the process started.
+    '''
+    try:
+        with open("/proc/self/status", 'r') as status_file:
+            values = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in status_file if line.startswith(("VmRSS", "VmHWM"))}
+        return values["VmRSS"], values["VmHWM"]
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if os.uname().sysname == "Darwin" else 1024 # Bytes on macOS, kB elsewhere
+        return peak, peak
+
+def _reset_peak_memory() -> bool:
+    '''
+    Reset the peak resident memory of this process to its current memory (Linux only).
+
+    Returns:
+        bool: Whether the peak was reset.
+    '''
+    try:
+        with open("/proc/self/clear_refs", 'w') as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+def measure(function: Callable, *args) -> Tuple[object, Dict[str, float]]:
+    '''
+    Call a function and measure it, e.g. in a worker process (see 'Stage_Profiler.add_record').
+
+    Returns:
+        Tuple[object, Dict[str, float]]: The result, and the 'start' (perf_counter), 'wall' and 'cpu' seconds, 'peak_rss' and 'rss' bytes and the 'pid'.
+    '''
+    _reset_peak_memory()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function(*args)
+    rss, peak_rss = _read_memory()
+    return result, {"start": start, "wall": time.perf_counter() - start, "cpu": time.process_time() - cpu_start, "peak_rss": peak_rss, "rss": rss, "pid": os.getpid()}
+
+@dataclass
+class Stage_Profiler:
+    # Neccesary inputs
+    # /
+
+    # Optional inputs
+    trace_path:     str                             = None # Chrome trace (JSON) rewritten after every top-level stage, open it in chrome://tracing or https://ui.perfetto.dev
+    hooks:          List[Callable[[Dict], None]]    = field(default_factory=list) # Called with every finished record (see 'records'), e.g. to forward it to a metrics system
+
+    # Public variables, not to be set by user
+    records:        List[Dict] = field(init=False, default_factory=list) # Finished stages and meshes: 'name', 'category' ("stage" or "mesh"), 'parent', 'depth', 'start' (seconds since
+                                                                         # the profiler was created), 'wall' and 'cpu' seconds, 'peak_rss' and 'rss' bytes, 'counts' and 'pid'
+
+    # Internal variables
+    _origin:        float       = field(init=False, default=0.0) # perf_counter at creation
+    _open:          List[Dict]  = field(init=False, default_factory=list) # Stages that are running (outermost first)
+    _failed_hooks:  set         = field(init=False, default_factory=set) # Hooks that raised an error (reported once)
+
+    def __post_init__(self):
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, category: str = "stage", **counts) -> Iterator[Dict[str, float]]:
+        '''
+        Measure a stage. Stages can be nested, the memory peak of a stage includes its nested stages.
+        The CPU time includes worker processes that finished within the stage (e.g. of a process pool).
+
+        Args:
+            name (str):     The name of the stage.
+            category (str): "stage" or "mesh".
+            counts:         Item counts known at the start (e.g. files=3).
+
+        Yields:
+            Dict[str, float]: The item counts of the record, to be completed within the stage (e.g. counts["meshes"] += 1).
+        '''
+        # Peaks are reset per stage, so the peak so far counts for the stages around it first
+        _, peak_rss = _read_memory()
+        for record in self._open:
+            record["peak_rss"] = max(record["peak_rss"], peak_rss)
+        _reset_peak_memory()
+
+        record = {"name": name, "category": category, "parent": self._open[-1]["name"] if self._open else None, "depth": len(self._open), "peak_rss": 0, "counts": dict(counts), "pid": os.getpid()}
+        self._open.append(record)
+        times = os.times()
+        start = time.perf_counter()
+        try:
+            yield record["counts"]
+        finally:
+            end_times = os.times()
+            record["start"] = start - self._origin
+            record["wall"] = time.perf_counter() - start
+            record["cpu"] = (end_times.user + end_times.system + end_times.children_user + end_times.children_system) - (times.user + times.system + times.children_user + times.children_system)
+            record["rss"], peak_rss = _read_memory()
+            record["peak_rss"] = max(record["peak_rss"], peak_rss)
+            self._open.pop()
+            if self._open:
+                self._open[-1]["peak_rss"] = max(self._open[-1]["peak_rss"], record["peak_rss"])
+            self._finish(record)
+
+    def count(self, **counts):
+        '''
+        Set item counts of the innermost running stage (e.g. from a function that does not know whether it is profiled).
+        '''
+        if self._open:
+            self._open[-1]["counts"].update(counts)
+
+    def add_record(self, name: str, measurement: Dict[str, float], category: str = "mesh", **counts):
+        '''
+        Add a measurement taken elsewhere (see 'measure'), e.g. of a mesh reduced in a worker process. It belongs to the innermost running stage.
+
+        Args:
+            name (str):                     The name of the record.
+            measurement (Dict[str, float]): The result of 'measure'.
+            category (str):                 "stage" or "mesh".
+            counts:                         Item counts of the record.
+        '''
+        record = {"name": name, "category": category, "parent": self._open[-1]["name"] if self._open else None, "depth": len(self._open), "counts": dict(counts),
+                  **measurement, "start": measurement["start"] - self._origin}
+        self._finish(record)
+
+    def map(self, function: Callable, items: List, names: List[str], executor: Executor = None, category: str = "mesh") -> List:
+        '''
+        Apply a function to items (e.g. mesh jobs) and record every call, in this process or in the processes of an executor.
+
+        Args:
+            function (Callable):    The function (defined on module level if an executor is used).
+            items (List):           The arguments of the calls.
+            names (List[str]):      The record name per item (e.g. the mesh name).
+            executor (Executor):    The process pool to use (None = call in this process).
+            category (str):         The category of the records.
+
+        Returns:
+            List: The results of the calls.
+        '''
+        results = []
+        if executor is None:
+            for item, name in zip(items, names):
+                with self.stage(name, category=category):
+                    results.append(function(item))
+            return results
+        # Every worker measures its own calls
+        for name, (result, measurement) in zip(names, executor.map(measure, [function] * len(items), items)):
+            self.add_record(name, measurement, category=category)
+            results.append(result)
+        return results
+
+    def _finish(self, record: Dict):
+        '''
+        Store a finished record, call the hooks and (after top-level stages) rewrite the trace file.
+        '''
+        self.records.append(record)
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception as error:
+                # A broken metrics system must not stop the conversion
+                if id(hook) not in self._failed_hooks:
+                    self._failed_hooks.add(id(hook))
+                    print(colored("WARNING", "yellow") + f": Profiler hook {getattr(hook, '__name__', hook)} failed ({error}), further errors of it are not shown")
+        if record["depth"] == 0 and self.trace_path is not None:
+            self.write_trace(self.trace_path)
+
+    def write_trace(self, filepath: str):
+        '''
+        Write all records as a Chrome trace (JSON), with the measurements and counts as arguments of the events.
+
+        Args:
+            filepath (str): The path to the trace file.
+        '''
+        events = [{"name": record["name"], "cat": record["category"], "ph": "X", "ts": 1e6 * record["start"], "dur": 1e6 * record["wall"], "pid": os.getpid(), "tid": record["pid"],
+                   "args": {"cpu_ms": 1000 * record["cpu"], "peak_rss_mb": bytes_to_mb(record["peak_rss"]), "rss_mb": bytes_to_mb(record["rss"]), **record["counts"]}} for record in self.records]
+        events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": pid, "args": {"name": "main" if pid == os.getpid() else f"worker {pid}"}} for pid in sorted({record["pid"] for record in self.records})]
+
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(filepath)))
+        with os.fdopen(fd, 'w') as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        os.replace(tmp_path, filepath)
+
+    def print_summary(self, n_meshes: int = 3):
+        '''
+        Print the stages in order of their start (nested stages indented), and the slowest meshes per stage.
+
+        Args:
+            n_meshes (int): The number of meshes shown per stage.
+        '''
+        stages = sorted([record for record in self.records if record["category"] == "stage"], key=lambda record: record["start"])
+        print(colored("Profile", "cyan") + f": {len(stages)} stage(s)")
+        print(f"  {'stage':<32}{'wall ms':>10}{'cpu ms':>10}{'peak MB':>10}  counts")
+        for record in stages:
+            counts = ", ".join(f"{name} {value:.4g}" if isinstance(value, float) else f"{name} {value}" for name, value in record["counts"].items())
+            print(f"  {'  ' * record['depth'] + record['name']:<32}{1000 * record['wall']:>10.1f}{1000 * record['cpu']:>10.1f}{bytes_to_mb(record['peak_rss']):>10.1f}  {counts}")
+
+        meshes = {} # Stage -> mesh records
+        for record in self.records:
+            if record["category"] == "mesh":
+                meshes.setdefault(record["parent"], []).append(record)
+        for parent, records in meshes.items():
+            slowest = sorted(records, key=lambda record: record["wall"], reverse=True)[:n_meshes]
+            print(f"  {parent}: {len(records)} mesh(es), {1000 * sum(record['wall'] for record in records):.1f} ms in total, slowest " +
+                  ", ".join(f"{record['name']} ({1000 * record['wall']:.1f} ms, {bytes_to_mb(record['peak_rss']):.1f} MB)" for record in slowest))
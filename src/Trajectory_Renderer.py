@@ -0,0 +1,233 @@
+import os
+import time
+import numpy as np
+import mujoco
+import multiprocessing as mp
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from termcolor import colored
+from src.Rollout import load_compiled_model
+
+Camera = Union[int, str, Dict[str, float]] # Camera id (-1 = free camera), camera name, or free camera settings (e.g. {"azimuth": 90, "elevation": -20})
+
+# Rendering contexts of this process: (model path, width, height) -> (model, data, renderer). Reused by all jobs of a worker
+_renderers: Dict[Tuple[str, int, int], Tuple[mujoco.MjModel, mujoco.MjData, mujoco.Renderer]] = {}
+
+def _get_renderer(model_path: str, width: int, height: int) -> Tuple[mujoco.MjModel, mujoco.MjData, mujoco.Renderer]:
+    '''
+    Get the rendering context of this process for a model and image size, creating it on first use.
+    The GL backend is the one 'MUJOCO_GL' selected when mujoco was imported in this process.
+    '''
+    key = (model_path, width, height)
+    if key not in _renderers:
+        model = load_compiled_model(model_path)
+        # The offscreen framebuffer must be at least as large as the images
+        model.vis.global_.offwidth = max(model.vis.global_.offwidth, width)
+        model.vis.global_.offheight = max(model.vis.global_.offheight, height)
+        _renderers[key] = (model, mujoco.MjData(model), mujoco.Renderer(model, height=height, width=width))
+    return _renderers[key]
+
+def _make_camera(model: mujoco.MjModel, camera: Camera) -> Union[int, str, mujoco.MjvCamera]:
+    '''
+    Convert a camera specification to what 'mujoco.Renderer.update_scene' accepts.
+    '''
+    if not isinstance(camera, dict):
+        return camera
+    free_camera = mujoco.MjvCamera()
+    free_camera.type = mujoco.mjtCamera.mjCAMERA_FREE
+    mujoco.mjv_defaultFreeCamera(model, free_camera)
+    for attribute, value in camera.items():
+        setattr(free_camera, attribute, value)
+    return free_camera
+
+def render_frames(model_path: str, qpos: np.ndarray, cameras: List[Camera] = [-1], width: int = 640, height: int = 480) -> np.ndarray:
+    '''
+    Render joint positions to images, reusing the rendering context of this process (so it can be called from any worker process).
+
+    Args:
+        model_path (str):       The XML file or compiled (.mjb) model.
+        qpos (np.ndarray):      The (n_frames, nq) joint positions.
+        cameras (List[Camera]): The cameras to render from.
+        width (int):            The image width in pixels.
+        height (int):           The image height in pixels.
+
+    Returns:
+        np.ndarray: The (n_frames, n_cameras, height, width, 3) uint8 images.
+    '''
+    model, data, renderer = _get_renderer(model_path, width, height)
+    cameras = [_make_camera(model, camera) for camera in cameras]
+    frames = np.empty((len(qpos), len(cameras), height, width, 3), dtype=np.uint8)
+    for frame, positions in enumerate(qpos):
+        data.qpos[:] = positions
+        # Only the poses are needed for rendering (no dynamics)
+        mujoco.mj_kinematics(model, data)
+        mujoco.mj_camlight(model, data)
+        for view, camera in enumerate(cameras):
+            renderer.update_scene(data, camera=camera)
+            renderer.render(out=frames[frame, view])
+    return frames
+
+def write_video(frames: np.ndarray, output_path: str, fps: float):
+    '''
+    Write rendered frames to a video file (views next to each other). Needs 'imageio' with its ffmpeg plugin ('pip install imageio[ffmpeg]').
+
+    Args:
+        frames (np.ndarray):    The (n_frames, n_cameras, height, width, 3) images.
+        output_path (str):      The path to the video file, e.g. "clip.mp4".
+        fps (float):            The frame rate of the video.
+    '''
+    try:
+        import imageio.v2 as imageio
+    except ImportError as error:
+        raise ImportError("Writing videos needs imageio: pip install imageio[ffmpeg]") from error
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tiled = np.concatenate(list(np.moveaxis(frames, 1, 0)), axis=2) # (n_frames, height, n_cameras * width, 3)
+    imageio.mimwrite(output_path, tiled, fps=fps)
+
+def _worker_pid(_) -> int:
+    '''
+    Return the process id (a job that only starts a worker process).
+    '''
+    return os.getpid()
+
+def _render_job(job: Tuple[str, np.ndarray, List[Camera], int, int, str, float]) -> Tuple[np.ndarray, int, float]:
+    '''
+    Render one trajectory, and write it to a video if an output path is given. Defined on module level, so that it can be used in a process pool.
+
+    Returns:
+        Tuple[np.ndarray, int, float]: The frames (None if written to a video), the process id and the seconds spent.
+    '''
+    model_path, qpos, cameras, width, height, output_path, fps = job
+    start = time.perf_counter()
+    frames = render_frames(model_path, qpos, cameras, width, height)
+    if output_path is not None:
+        write_video(frames, output_path, fps)
+        frames = None
+    return frames, os.getpid(), time.perf_counter() - start
+
+@dataclass
+class Trajectory_Renderer:
+    # Neccesary inputs
+    model_path:     str = field() # The XML file or compiled (.mjb) model, loaded once per worker
+
+    # Optional inputs
+    width:          int             = 640
+    height:         int             = 480
+    cameras:        List[Camera]    = field(default_factory=lambda: [-1]) # Views rendered per frame, see 'Camera'
+    fps:            float           = 30.0      # Target frame rate: trajectory samples in between frames are skipped
+    gl_backend:     str             = "osmesa"  # MUJOCO_GL of the worker processes: "osmesa" (software, no GPU), "egl" (headless GPU) or "glfw" (needs a display)
+    n_workers:      int             = None      # Number of rendering processes, each keeping its contexts between trajectories (None = number of CPU cores)
+
+    # Public variables, not to be set by user
+    n_frames:       int     = field(init=False, default=0) # Frames (per camera) rendered so far
+    render_time:    float   = field(init=False, default=0.0) # Seconds spent rendering in the workers so far
+    wall_time:      float   = field(init=False, default=0.0)
+
+    # Internal variables
+    _executor:  ProcessPoolExecutor = field(init=False, default=None)
+
+    def __post_init__(self):
+        if self.n_workers is None:
+            self.n_workers = os.cpu_count()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        '''
+        Start the worker processes. They are spawned (not forked), so that mujoco is imported with the requested GL backend.
+        '''
+        if self._executor is None:
+            environment = {name: os.environ.get(name) for name in ["MUJOCO_GL", "PYOPENGL_PLATFORM"]}
+            os.environ["MUJOCO_GL"] = self.gl_backend
+            if self.gl_backend in ["osmesa", "egl"]:
+                os.environ["PYOPENGL_PLATFORM"] = self.gl_backend
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=mp.get_context("spawn"))
+                # Spawned workers are started on demand: start all of them now, while the environment variables are set
+                list(self._executor.map(_worker_pid, range(self.n_workers)))
+            except BrokenProcessPool as error:
+                self._executor = None
+                raise RuntimeError(f"The rendering workers could not start with MUJOCO_GL={self.gl_backend} (for 'osmesa' install e.g. libosmesa6-dev, see README).") from error
+            finally:
+                for name, value in environment.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+        return self._executor
+
+    def frame_indices(self, n_samples: int, timestep: float) -> np.ndarray:
+        '''
+        Select the trajectory samples to render for the target frame rate.
+
+        Args:
+            n_samples (int):    The number of samples of the trajectory.
+            timestep (float):   The time between two samples in seconds.
+
+        Returns:
+            np.ndarray: The indices of the samples to render.
+        '''
+        if n_samples == 0:
+            return np.zeros(0, dtype=int)
+        duration = (n_samples - 1) * timestep
+        frame_times = np.arange(0.0, duration + 0.5 * timestep, 1.0 / self.fps) if self.fps * timestep < 1 else np.arange(n_samples) * timestep
+        return np.unique(np.minimum(np.round(frame_times / timestep).astype(int), n_samples - 1))
+
+    def _run(self, trajectories: List[np.ndarray], timestep: float, output_paths: List[str]) -> List[np.ndarray]:
+        '''
+        Render trajectories across the workers, see 'render' and 'render_videos'.
+        '''
+        # Frames are sampled at the target rate, the video plays at the resulting rate
+        jobs = []
+        for trajectory, output_path in zip(trajectories, output_paths):
+            indices = self.frame_indices(len(trajectory), timestep)
+            fps = min(self.fps, 1.0 / timestep)
+            jobs.append((os.path.abspath(self.model_path), np.asarray(trajectory, dtype=np.float64)[indices], self.cameras, self.width, self.height, output_path, fps))
+
+        start = time.perf_counter()
+        results = list(self._get_executor().map(_render_job, jobs))
+        self.wall_time += time.perf_counter() - start
+        self.n_frames += sum(len(job[1]) for job in jobs)
+        self.render_time += sum(elapsed for _, _, elapsed in results)
+        return [frames for frames, _, _ in results]
+
+    def render(self, trajectories: Union[np.ndarray, List[np.ndarray]], timestep: float) -> List[np.ndarray]:
+        '''
+        Render recorded trajectories (e.g. the 'qpos' of 'Rollout.run') to frame arrays.
+
+        Args:
+            trajectories (Union[np.ndarray, List[np.ndarray]]): (n_trajectories, n_samples, nq) joint positions, or a list of (n_samples, nq) arrays.
+            timestep (float):                                   The time between two samples in seconds (e.g. the model timestep times the substeps).
+
+        Returns:
+            List[np.ndarray]: Per trajectory the (n_frames, n_cameras, height, width, 3) uint8 images.
+        '''
+        return self._run(list(trajectories), timestep, [None] * len(trajectories))
+
+    def render_videos(self, trajectories: Union[np.ndarray, List[np.ndarray]], timestep: float, output_paths: List[str]):
+        '''
+        Render recorded trajectories to video files. The workers encode the videos, so the frames never leave them.
+
+        Args:
+            trajectories (Union[np.ndarray, List[np.ndarray]]): (n_trajectories, n_samples, nq) joint positions, or a list of (n_samples, nq) arrays.
+            timestep (float):                                   The time between two samples in seconds.
+            output_paths (List[str]):                           The video file per trajectory (the cameras are placed next to each other).
+        '''
+        if len(output_paths) != len(trajectories):
+            raise ValueError(f"{len(trajectories)} trajectories, but {len(output_paths)} output paths.")
+        self._run(list(trajectories), timestep, list(output_paths))
+
+    def close(self):
+        '''
+        Shut down the worker processes (and their rendering contexts).
+        '''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def print_summary(self):
+        '''
+        Print the rendering throughput so far.
+        '''
+        print(colored("Rendering", "cyan") + f": {self.n_frames} frame(s) x {len(self.cameras)} camera(s) at {self.width}x{self.height} in {self.wall_time:.2f} s "
+              f"({self.n_frames / self.wall_time if self.wall_time > 0 else 0:.1f} frames/s, {self.gl_backend}, {self.n_workers} worker(s))")
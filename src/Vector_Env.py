@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import traceback
+import numpy as np
+import mujoco
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.connection import Connection
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from termcolor import colored
+from src.Rollout import load_compiled_model
+
+def _env_worker(connection: Connection, model_path: str, buffers: Dict[str, Tuple[SharedMemory, Tuple[int, ...]]], env_indices: List[int], n_substeps: int) -> None:
+    '''
+    Simulate a slice of the environments in a worker process. Commands arrive through 'connection', actions and observations
+    are exchanged through the shared buffers only. Defined on module level, so that it can be used as process target.
+
+    Args:
+        connection (Connection):                                The worker's end of the command pipe.
+        model_path (str):                                       The XML file or compiled (.mjb) model, loaded once.
+        buffers (Dict[str, Tuple[SharedMemory, Tuple[int]]]):   Buffer name -> shared memory block and array shape.
+        env_indices (List[int]):                                The environments this worker simulates.
+        n_substeps (int):                                       Physics steps per environment step.
+    '''
+    try:
+        arrays = {name: np.ndarray(shape, dtype=np.float64, buffer=shm.buf) for name, (shm, shape) in buffers.items()}
+        model = load_compiled_model(model_path)
+        datas = {env: mujoco.MjData(model) for env in env_indices}
+        nq, nv = model.nq, model.nv
+
+        def observe(env: int, data: mujoco.MjData):
+            arrays["observations"][env, :nq] = data.qpos
+            arrays["observations"][env, nq:nq + nv] = data.qvel
+            arrays["observations"][env, nq + nv:] = data.sensordata
+            arrays["time"][env] = data.time
+
+        connection.send(("ok", None))
+    except Exception:
+        connection.send(("error", traceback.format_exc()))
+        return
+
+    while True:
+        command = connection.recv()
+        if command == "close":
+            break
+        try:
+            start = time.perf_counter()
+            if command == "step":
+                for env, data in datas.items():
+                    data.ctrl[:] = arrays["actions"][env]
+                    mujoco.mj_step(model, data, n_substeps)
+                    observe(env, data)
+            elif command == "reset":
+                for env, data in datas.items():
+                    if arrays["reset_mask"][env]:
+                        mujoco.mj_resetData(model, data)
+                        data.qpos[:] = arrays["reset_qpos"][env]
+                        data.qvel[:] = arrays["reset_qvel"][env]
+                        mujoco.mj_forward(model, data)
+                        observe(env, data)
+            connection.send(("ok", time.perf_counter() - start))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+    connection.close()
+
+@dataclass
+class Vector_Env:
+    # Neccesary inputs
+    model_path:     str = field() # The XML file or compiled (.mjb) model, loaded once per worker
+    n_envs:         int = field()
+
+    # Optional inputs
+    n_workers:      int     = None  # Number of worker processes, each simulating a slice of the environments (None = number of CPU cores, at most 'n_envs')
+    n_substeps:     int     = 1     # Physics steps per environment step
+    copy:           bool    = True  # Return copies of the observations (otherwise views on the shared buffer, overwritten by the next step)
+
+    # Public variables, not to be set by user
+    model:          mujoco.MjModel  = field(init=False, default=None) # The model in this process (for shapes and defaults)
+    n_steps:        int             = field(init=False, default=0) # Environment steps (of all environments) so far
+    step_time:      float           = field(init=False, default=0.0) # Seconds spent in 'step' so far (waiting for the workers included)
+    worker_times:   List[float]     = field(init=False, default_factory=list) # Seconds each worker spent simulating so far
+
+    # Internal variables
+    _buffers:       Dict[str, Tuple[SharedMemory, Tuple[int, ...]]] = field(init=False, default_factory=dict)
+    _arrays:        Dict[str, np.ndarray]                           = field(init=False, default_factory=dict) # Views on the shared buffers
+    _processes:     List[mp.Process]                                = field(init=False, default_factory=list)
+    _connections:   List[Connection]                                = field(init=False, default_factory=list)
+    _pending:       str                                             = field(init=False, default=None) # Command the workers are busy with
+    _start:         float                                           = field(init=False, default=0.0)
+
+    def __post_init__(self):
+        self.model = load_compiled_model(self.model_path)
+        if self.n_workers is None:
+            self.n_workers = os.cpu_count()
+        self.n_workers = max(min(self.n_workers, self.n_envs), 1)
+
+        shapes = {
+            "actions": (self.n_envs, self.model.nu),
+            "observations": (self.n_envs, self.observation_size),
+            "time": (self.n_envs,),
+            "reset_mask": (self.n_envs,),
+            "reset_qpos": (self.n_envs, self.model.nq),
+            "reset_qvel": (self.n_envs, self.model.nv),
+        }
+        for name, shape in shapes.items():
+            shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(np.float64).itemsize, 1))
+            self._buffers[name] = (shm, shape)
+            self._arrays[name] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            self._arrays[name].fill(0)
+
+        try:
+            for env_indices in np.array_split(np.arange(self.n_envs), self.n_workers):
+                parent_connection, child_connection = mp.Pipe()
+                process = mp.Process(target=_env_worker, args=(child_connection, os.path.abspath(self.model_path), self._buffers, env_indices.tolist(), self.n_substeps), daemon=True)
+                process.start()
+                child_connection.close()
+                self._processes.append(process)
+                self._connections.append(parent_connection)
+            self.worker_times = [0.0] * self.n_workers
+            self._receive()
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def observation_size(self) -> int:
+        '''
+        The size of an observation: qpos, qvel and the sensor data of the model.
+        '''
+        return self.model.nq + self.model.nv + self.model.nsensordata
+
+    @property
+    def action_size(self) -> int:
+        '''
+        The size of an action: one control per actuator (see 'add_actuator').
+        '''
+        return self.model.nu
+
+    @property
+    def time(self) -> np.ndarray:
+        '''
+        The (n_envs,) simulation time of each environment since its last reset.
+        '''
+        return self._arrays["time"].copy()
+
+    def _send(self, command: str):
+        '''
+        Send a command to all workers.
+        '''
+        if self._pending is not None:
+            raise RuntimeError(f"The environments are still busy with '{self._pending}', call '{self._pending}_wait' first.")
+        for connection in self._connections:
+            connection.send(command)
+        self._pending = command
+        self._start = time.perf_counter()
+
+    def _receive(self):
+        '''
+        Wait for all workers to finish the pending command.
+        '''
+        errors = []
+        for worker, connection in enumerate(self._connections):
+            try:
+                status, value = connection.recv()
+            except EOFError:
+                status, value = "error", f"Worker {worker} exited unexpectedly."
+            if status == "error":
+                errors.append(value)
+            elif value is not None:
+                self.worker_times[worker] += value
+        self._pending = None
+        if errors:
+            raise RuntimeError("Vector environment worker failed:\n" + "\n".join(errors))
+
+    def _observations(self) -> np.ndarray:
+        '''
+        The observations of all environments, copied if 'copy'.
+        '''
+        return self._arrays["observations"].copy() if self.copy else self._arrays["observations"]
+
+    def reset_async(self, mask: np.ndarray = None, qpos: np.ndarray = None, qvel: np.ndarray = None):
+        '''
+        Start resetting environments, without waiting for them (see 'reset_wait').
+
+        Args:
+            mask (np.ndarray):  The (n_envs,) boolean mask of the environments to reset. Defaults to all.
+            qpos (np.ndarray):  The initial joint positions, (nq,) or (n_envs, nq). Defaults to the model's 'qpos0'.
+            qvel (np.ndarray):  The initial joint velocities, (nv,) or (n_envs, nv). Defaults to 0.
+        '''
+        self._arrays["reset_mask"][:] = True if mask is None else np.asarray(mask, dtype=bool)
+        self._arrays["reset_qpos"][:] = self.model.qpos0 if qpos is None else qpos
+        self._arrays["reset_qvel"][:] = 0.0 if qvel is None else qvel
+        self._send("reset")
+
+    def reset_wait(self) -> np.ndarray:
+        '''
+        Wait for 'reset_async' to finish.
+
+        Returns:
+            np.ndarray: The (n_envs, observation_size) observations.
+        '''
+        self._receive()
+        return self._observations()
+
+    def reset(self, mask: np.ndarray = None, qpos: np.ndarray = None, qvel: np.ndarray = None) -> np.ndarray:
+        '''
+        Reset environments (see 'reset_async') and wait for them.
+
+        Returns:
+            np.ndarray: The (n_envs, observation_size) observations.
+        '''
+        self.reset_async(mask, qpos, qvel)
+        return self.reset_wait()
+
+    def step_async(self, actions: np.ndarray):
+        '''
+        Start stepping all environments, without waiting for them (see 'step_wait').
+
+        Args:
+            actions (np.ndarray): The (n_envs, action_size) controls.
+        '''
+        self._arrays["actions"][:] = actions
+        self._send("step")
+
+    def step_wait(self) -> np.ndarray:
+        '''
+        Wait for 'step_async' to finish.
+
+        Returns:
+            np.ndarray: The (n_envs, observation_size) observations.
+        '''
+        self._receive()
+        self.n_steps += self.n_envs
+        self.step_time += time.perf_counter() - self._start
+        return self._observations()
+
+    def step(self, actions: np.ndarray) -> np.ndarray:
+        '''
+        Step all environments (see 'step_async') and wait for them.
+
+        Returns:
+            np.ndarray: The (n_envs, observation_size) observations.
+        '''
+        self.step_async(actions)
+        return self.step_wait()
+
+    @property
+    def steps_per_second(self) -> float:
+        '''
+        The environment steps per second (of all environments together) so far.
+        '''
+        return self.n_steps / self.step_time if self.step_time > 0 else 0.0
+
+    def close(self):
+        '''
+        Stop the worker processes and free the shared buffers.
+        '''
+        for connection in self._connections:
+            try:
+                connection.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._connections, self._processes = [], []
+        self._arrays = {}
+        for shm, _ in self._buffers.values():
+            shm.close()
+            shm.unlink()
+        self._buffers = {}
+
+    def print_summary(self):
+        '''
+        Print the throughput so far and how busy the workers were.
+        '''
+        print(colored("Vector environment", "cyan") + f": {self.n_envs} environment(s) on {self.n_workers} worker(s), {self.n_steps} steps in {self.step_time:.2f} s ({self.steps_per_second:.0f} env-steps/s)")
+        for worker, worker_time in enumerate(self.worker_times):
+            print(f"  Worker {worker}: {worker_time:.2f} s simulating ({100 * worker_time / self.step_time if self.step_time > 0 else 0:.0f}% busy)")
+
+def benchmark_vector_env(model_path: str, n_envs: List[int] = [1, 2, 4, 8, 16, 32], n_steps: int = 500, n_workers: int = None, n_substeps: int = 1) -> Dict[int, float]:
+    '''
+    Measure the environment steps per second of 'Vector_Env' for different numbers of environments (with random actions).
+
+    Args:
+        model_path (str):       The XML file or compiled (.mjb) model.
+        n_envs (List[int]):     The numbers of environments to measure.
+        n_steps (int):          The steps per measurement (after one warm-up step).
+        n_workers (int):        The number of worker processes (None = number of CPU cores).
+        n_substeps (int):       Physics steps per environment step.
+
+    Returns:
+        Dict[int, float]: Number of environments -> env-steps/s.
+    '''
+    results = {}
+    rng = np.random.default_rng(0)
+    print(colored("Vector environment benchmark", "cyan") + f": {os.path.basename(model_path)}, {n_steps} steps, {n_workers or os.cpu_count()} worker(s) max.")
+    print(f"  {'n_envs':>8} {'workers':>8} {'env-steps/s':>12} {'per env':>10}")
+    for n in n_envs:
+        env = Vector_Env(model_path=model_path, n_envs=n, n_workers=n_workers, n_substeps=n_substeps, copy=False)
+        try:
+            low, high = env.model.actuator_ctrlrange[:, 0], env.model.actuator_ctrlrange[:, 1]
+            actions = rng.uniform(low, high, (n_steps + 1, n, env.action_size))
+            env.reset()
+            env.step(actions[0]) # Warm-up
+            env.n_steps, env.step_time = 0, 0.0
+            for step in range(1, n_steps + 1):
+                env.step(actions[step])
+            results[n] = env.steps_per_second
+            print(f"  {n:>8} {env.n_workers:>8} {results[n]:>12.0f} {results[n] / n:>10.0f}")
+        finally:
+            env.close()
+    return results
+
+if __name__ == "__main__":
+    benchmark_vector_env(sys.argv[1] if len(sys.argv) > 1 else "output/DexterousDynamos.xml")
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import numpy as np
+import mujoco
+import mujoco.viewer
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from termcolor import colored
+from src.Model_Cache import Model_Cache
+
+@dataclass
+class Viewer_Service:
+    # Neccesary inputs
+    xml_paths:      List[str] = field() # The models shown, each in its own window of this process
+
+    # Optional inputs
+    model_cache:    Model_Cache = None  # Cache of compiled models (defaults to 'cache/models/'), so unchanged models are never compiled again
+    poll_interval:  float       = 0.5   # Seconds between checks of the XML files and their meshes
+    realtime:       bool        = True  # Step the physics in real time (otherwise the models are only shown)
+
+    # Public variables, not to be set by user
+    reloads:        List[Dict[str, float]] = field(init=False, default_factory=list) # Latency breakdown (seconds) of every reload
+
+    # Internal variables
+    _models:        Dict[str, Dict] = field(init=False, default_factory=dict) # XML path -> 'key', 'model', 'data', 'viewer', 'files' (path -> size, modification time)
+
+    def __post_init__(self):
+        if self.model_cache is None:
+            self.model_cache = Model_Cache()
+        for xml_path in self.xml_paths:
+            self.add(xml_path)
+
+    def add(self, xml_path: str):
+        '''
+        Load a model and open a viewer window for it.
+
+        Args:
+            xml_path (str): The path to the XML file.
+        '''
+        xml_path = os.path.abspath(xml_path)
+        model = self.model_cache.load(xml_path)
+        data = mujoco.MjData(model)
+        mujoco.mj_forward(model, data)
+        self._models[xml_path] = {"key": self.model_cache.key(xml_path), "model": model, "data": data, "files": self._file_stats(xml_path),
+                                  "viewer": mujoco.viewer.launch_passive(model, data), "failed_files": None}
+        print(colored("Viewer", "cyan") + f": showing {os.path.relpath(xml_path)} ({model.nbody - 1} bodies, {model.njnt} joints)")
+
+    def _file_stats(self, xml_path: str) -> Dict[str, Tuple[int, int]]:
+        '''
+        Get the size and modification time of an XML file and all files it refers to (missing files have None).
+        '''
+        stats = {}
+        try:
+            files = [xml_path] + self.model_cache.dependencies(xml_path)
+        except Exception:
+            files = [xml_path] # E.g. the XML file is being written, it is checked again at the next poll
+        for filepath in files:
+            try:
+                stat = os.stat(filepath)
+                stats[filepath] = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                stats[filepath] = None
+        return stats
+
+    @staticmethod
+    def transfer_state(old_model: mujoco.MjModel, old_data: mujoco.MjData, new_model: mujoco.MjModel, new_data: mujoco.MjData) -> int:
+        '''
+        Copy the joint positions and velocities (matched by joint name and type), the controls (matched by actuator name) and the time to a reloaded model.
+
+        Returns:
+            int: The number of joints whose state was kept.
+        '''
+        sizes = {mujoco.mjtJoint.mjJNT_FREE: (7, 6), mujoco.mjtJoint.mjJNT_BALL: (4, 3)} # Other joint types have one position and velocity
+        n_kept = 0
+        for new_id in range(new_model.njnt):
+            old_id = mujoco.mj_name2id(old_model, mujoco.mjtObj.mjOBJ_JOINT, mujoco.mj_id2name(new_model, mujoco.mjtObj.mjOBJ_JOINT, new_id))
+            if old_id < 0 or old_model.jnt_type[old_id] != new_model.jnt_type[new_id]:
+                continue
+            nq, nv = sizes.get(new_model.jnt_type[new_id], (1, 1))
+            new_data.qpos[new_model.jnt_qposadr[new_id]:new_model.jnt_qposadr[new_id] + nq] = old_data.qpos[old_model.jnt_qposadr[old_id]:old_model.jnt_qposadr[old_id] + nq]
+            new_data.qvel[new_model.jnt_dofadr[new_id]:new_model.jnt_dofadr[new_id] + nv] = old_data.qvel[old_model.jnt_dofadr[old_id]:old_model.jnt_dofadr[old_id] + nv]
+            n_kept += 1
+        for new_id in range(new_model.nu):
+            old_id = mujoco.mj_name2id(old_model, mujoco.mjtObj.mjOBJ_ACTUATOR, mujoco.mj_id2name(new_model, mujoco.mjtObj.mjOBJ_ACTUATOR, new_id))
+            if old_id >= 0:
+                new_data.ctrl[new_id] = old_data.ctrl[old_id]
+        new_data.time = old_data.time
+        mujoco.mj_forward(new_model, new_data)
+        return n_kept
+
+    def reload(self, xml_path: str) -> bool:
+        '''
+        Reload a model if its XML file or meshes changed in content (not only their modification time), keeping the joint state and the camera.
+
+        Args:
+            xml_path (str): The path to the XML file.
+
+        Returns:
+            bool: Whether the model was reloaded.
+        '''
+        entry = self._models[os.path.abspath(xml_path)]
+        files = self._file_stats(xml_path)
+        if files == entry["files"] or files == entry["failed_files"]:
+            return False
+
+        start = time.perf_counter()
+        try:
+            key = self.model_cache.key(xml_path)
+        except Exception as error:
+            print(colored("WARNING", "yellow") + f": {os.path.relpath(xml_path)} could not be read ({error}), keeping the current model")
+            entry["failed_files"] = files
+            return False
+        if key == entry["key"]:
+            entry["files"] = files # Touched or rewritten with the same content
+            return False
+        key_time = time.perf_counter()
+
+        n_hits = self.model_cache.n_hits
+        try:
+            model = self.model_cache.load(xml_path)
+        except Exception as error:
+            print(colored("WARNING", "yellow") + f": {os.path.relpath(xml_path)} could not be compiled ({error}), keeping the current model")
+            entry["failed_files"] = files
+            return False
+        load_time = time.perf_counter()
+
+        data = mujoco.MjData(model)
+        with entry["viewer"].lock():
+            n_kept = self.transfer_state(entry["model"], entry["data"], model, data)
+            camera = {name: np.copy(getattr(entry["viewer"].cam, name)) if name == "lookat" else getattr(entry["viewer"].cam, name) for name in ["type", "fixedcamid", "trackbodyid", "lookat", "distance", "azimuth", "elevation"]}
+        state_time = time.perf_counter()
+
+        # The passive viewer cannot swap models, so the window is reopened with the previous camera
+        entry["viewer"].close()
+        viewer = mujoco.viewer.launch_passive(model, data)
+        with viewer.lock():
+            for name, value in camera.items():
+                setattr(viewer.cam, name, value)
+        end = time.perf_counter()
+
+        entry.update({"key": key, "model": model, "data": data, "viewer": viewer, "files": files, "failed_files": None})
+        self.reloads.append({"check": key_time - start, "load": load_time - key_time, "state": state_time - load_time, "viewer": end - state_time, "total": end - start,
+                             "cache_hit": self.model_cache.n_hits > n_hits})
+        print(colored("Reloaded", "cyan") + f" {os.path.relpath(xml_path)} in {1000 * (end - start):.0f} ms ("
+              f"{'cache hit' if self.reloads[-1]['cache_hit'] else 'compiled'} {1000 * (load_time - key_time):.0f} ms, change check {1000 * (key_time - start):.0f} ms, "
+              f"viewer {1000 * (end - state_time):.0f} ms), state of {n_kept}/{model.njnt} joints kept")
+        return True
+
+    def run(self):
+        '''
+        Simulate and show all models until every window is closed, reloading models whose files changed.
+        '''
+        last_poll = time.perf_counter()
+        last_step = time.perf_counter()
+        while any(entry["viewer"].is_running() for entry in self._models.values()):
+            now = time.perf_counter()
+            for entry in self._models.values():
+                if not entry["viewer"].is_running():
+                    continue
+                if self.realtime:
+                    # Catch up with the wall clock (at most 0.1 s at once, so that slow models do not fall further behind)
+                    with entry["viewer"].lock():
+                        target = entry["data"].time + min(now - last_step, 0.1)
+                        while entry["data"].time < target:
+                            mujoco.mj_step(entry["model"], entry["data"])
+                entry["viewer"].sync()
+            last_step = now
+
+            if now - last_poll >= self.poll_interval:
+                for xml_path, entry in list(self._models.items()):
+                    if entry["viewer"].is_running():
+                        self.reload(xml_path)
+                last_poll = time.perf_counter()
+            time.sleep(0.005)
+
+        for entry in self._models.values():
+            entry["viewer"].close()
+        self.print_summary()
+
+    def print_summary(self):
+        '''
+        Print the number of reloads and their latency.
+        '''
+        if len(self.reloads) == 0:
+            print(colored("Viewer", "cyan") + ": no reloads")
+            return
+        totals = np.array([reload["total"] for reload in self.reloads])
+        n_hits = sum(reload["cache_hit"] for reload in self.reloads)
+        print(colored("Viewer", "cyan") + f": {len(self.reloads)} reload(s) ({n_hits} from the model cache), latency {1000 * np.median(totals):.0f} ms median, {1000 * totals.max():.0f} ms max")
+
+if __name__ == "__main__":
+    # E.g. python -m src.Viewer_Service output/*.xml
+    Viewer_Service(xml_paths=sys.argv[1:] if len(sys.argv) > 1 else ["output/DexterousDynamos.xml"]).run()
@@ -1,35 +1,49 @@
 import numpy as np
-from stl import mesh
 import trimesh
 import os
+import shutil
+import tempfile
+import hashlib
 import datetime
 import re
+from typing import Tuple, Dict
+from pyquaternion import Quaternion
+from src.STL_Mesh import STL_Mesh
 
-def reduce_mesh(input_file: str, output_file: str, reduction_factor: float, verbose: bool=False) -> None:
+try:
+    import fcntl
+except ImportError: # Not available on Windows (reflinks are not supported there)
+    fcntl = None
+
+FICLONE = 0x40049409 # Linux ioctl to clone a file (reflink) on copy-on-write file systems (Btrfs, XFS)
+TMP_PREFIX = ".tmp_" # Prefix of the temporary files that outputs are written to before they replace the output file (see 'create_tmp_file')
+
+def reduce_mesh(input_file: str, output_file: str, reduction_factor: float = None, verbose: bool=False, weld_tolerance: float=1e-8, face_count: int = None) -> None:
     '''
-    Reduce the size of an STL mesh file by a given factor.
+    Reduce the size of an STL mesh file by a given factor, or to a given number of faces.
 
     Args:
         input_file (str): The path to the input STL file.
         output_file (str): The path to the output STL file.
         reduction_factor (float): The factor by which to multiply the file size. Must be between 0 and 1.
         verbose (bool): Whether to print verbose output.
+        weld_tolerance (float): The distance below which vertices are merged (see 'weld_vertices').
+        face_count (int): The target number of faces. Used instead of 'reduction_factor' if given.
     '''
+    if (reduction_factor is None) == (face_count is None):
+        raise ValueError("Exactly one of 'reduction_factor' and 'face_count' must be given.")
+
     def convert_stl_to_trimesh(stl_mesh):
-        # Extract vertices and faces from the STL mesh
-        vertices = stl_mesh.vectors.reshape(-1, 3)  # Flatten the triangle vertices
-        # Deduplicate vertices
-        vertices, unique_indices = np.unique(vertices, axis=0, return_inverse=True)
-        # Create faces using unique indices
-        faces = unique_indices.reshape(-1, 3)
-        # Create a Trimesh object
-        return trimesh.Trimesh(vertices=vertices, faces=faces, process=True)
+        # Weld the triangle vertices (flattened) into an indexed mesh
+        vertices, faces = weld_vertices(stl_mesh.vectors.reshape(-1, 3), weld_tolerance)
+        # Vertices are already merged, so trimesh does not need to process the mesh again
+        return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
 
     if not os.path.isfile(input_file):
         raise FileNotFoundError(f"The file {input_file} does not exist.")
 
-    # Load the STL file
-    original_mesh = mesh.Mesh.from_file(input_file)
+    # Load the STL file (memory-mapped)
+    original_mesh = STL_Mesh(input_file)
     
     # Convert to trimesh object
     trimesh_mesh = convert_stl_to_trimesh(original_mesh)
@@ -55,10 +69,15 @@ def reduce_mesh(input_file: str, output_file: str, reduction_factor: float, verb
     
     # Calculate target reduction as a fraction
     if verbose:
-        print(f"Target reduction: {reduction_factor * 100:.2f}%")
+        if face_count is None:
+            print(f"Target reduction: {reduction_factor * 100:.2f}%")
+        else:
+            print(f"Target faces: {face_count}")
     
-    # Simplify the mesh
-    simplified_mesh = trimesh_mesh.simplify_quadric_decimation(reduction_factor)
+    # Simplify the mesh ('simplify_quadric_decimation' takes the fraction of faces to remove, the file size scales with the number of faces to keep)
+    if face_count is None:
+        face_count = max(4, int(len(trimesh_mesh.faces) * reduction_factor))
+    simplified_mesh = trimesh_mesh.simplify_quadric_decimation(face_count=face_count)
     
     # Validate simplified mesh
     if len(simplified_mesh.faces) == 0 or len(simplified_mesh.vertices) == 0:
@@ -67,12 +86,354 @@ def reduce_mesh(input_file: str, output_file: str, reduction_factor: float, verb
     if verbose:
         print("Faces after:", len(simplified_mesh.faces))
 
-    # Save the simplified mesh
-    simplified_mesh.export(output_file)
+    # Save the simplified mesh (atomically, so that an interrupted run never leaves a truncated file behind)
+    export_mesh_atomic(simplified_mesh, output_file)
     if verbose:
         print(f"Mesh reduced and saved to {output_file}")
         print(f"Output file size: {os.path.getsize(output_file)} bytes")
 
+def create_tmp_file(output_file: str) -> str:
+    '''
+    Create an empty temporary file next to an output file (and the folder of the output file), to be moved onto it with 'os.replace' once it is written.
+    It is hidden (see 'is_tmp_file'), so that files left behind by an interrupted run are never taken for meshes,
+    and has the permissions of a normally created file (not the owner-only permissions of 'tempfile.mkstemp').
+
+    Args:
+        output_file (str):  The path to the output file.
+
+    Returns:
+        str: The path to the temporary file.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(prefix=TMP_PREFIX, suffix=os.path.splitext(output_file)[1], dir=os.path.dirname(os.path.abspath(output_file)))
+    os.close(fd)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_file, 0o666 & ~umask)
+    return tmp_file
+
+def is_tmp_file(filename: str) -> bool:
+    '''
+    Check whether a file is a temporary file of an output (see 'create_tmp_file'), e.g. left behind by an interrupted run.
+    '''
+    return os.path.basename(filename).startswith(TMP_PREFIX)
+
+def link_or_copy_atomic(src: str, dst: str, link: bool = True) -> str:
+    '''
+    Place a file with the content of 'src' at 'dst' via a temporary file (see 'create_tmp_file'), so that 'dst' is never left half-written.
+    A hard link is used if allowed and possible (files linked this way must only ever be replaced, never modified in place),
+    otherwise a reflink (copy-on-write clone) if the file system supports it, otherwise a plain copy.
+
+    Args:
+        src (str):      The file with the content.
+        dst (str):      The file to create or replace.
+        link (bool):    Whether 'dst' may share its inode with 'src'.
+
+    Returns:
+        str: "linked", "cloned" or "copied".
+    '''
+    tmp_file = create_tmp_file(dst)
+    try:
+        os.remove(tmp_file)
+        result = None
+        if link:
+            try:
+                os.link(src, tmp_file)
+                result = "linked"
+            except OSError:
+                pass # E.g. a different file system
+        if result is None:
+            result = "cloned" if _clone_file(src, tmp_file) else "copied"
+            if result == "copied":
+                shutil.copyfile(src, tmp_file)
+        os.replace(tmp_file, dst)
+    except BaseException:
+        if os.path.lexists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return result
+
+def _clone_file(src: str, dst: str) -> bool:
+    '''
+    Try to reflink 'src' to the new file 'dst'.
+
+    Returns:
+        bool: Whether the clone was created (otherwise 'dst' does not exist).
+    '''
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def export_mesh_atomic(trimesh_mesh: trimesh.Trimesh, output_file: str) -> None:
+    '''
+    Export a trimesh object to an STL file via a temporary file, so that the output file is never left half-written.
+
+    Args:
+        trimesh_mesh (trimesh.Trimesh): The mesh to export.
+        output_file (str):              The path to the output STL file.
+    '''
+    tmp_file = create_tmp_file(output_file)
+    try:
+        trimesh_mesh.export(tmp_file)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def compute_convex_hull(input_file: str, output_file: str, max_vertices: int = 64, weld_tolerance: float = 1e-8) -> int:
+    '''
+    Compute the (vertex-limited) convex hull of an STL file and save it as STL file.
+
+    Args:
+        input_file (str):       The path to the input STL file.
+        output_file (str):      The path to the output STL file.
+        max_vertices (int):     The max. number of hull vertices (like Mujoco's 'maxhullvert'). None for the full hull.
+        weld_tolerance (float): The distance below which vertices are merged (see 'weld_vertices').
+
+    Returns:
+        int: The number of vertices of the hull.
+    '''
+    vertices, _ = weld_vertices(STL_Mesh(input_file).vectors.reshape(-1, 3), weld_tolerance)
+    qhull_options = "QbB Pp"
+    if max_vertices is not None:
+        if max_vertices < 5:
+            raise ValueError("'max_vertices' must be at least 5.")
+        qhull_options += f" TA{max_vertices - 4}" # Qhull stops after adding this many points to the initial simplex
+    hull = trimesh.convex.convex_hull(vertices.astype(np.float64), qhull_options=qhull_options)
+    export_mesh_atomic(hull, output_file)
+    return len(hull.vertices)
+
+def bounding_sphere(stl_path: str, scale: float = 0.001) -> Tuple[np.ndarray, float]:
+    '''
+    Calculate a bounding sphere of an STL mesh (centered at its axis-aligned bounding box).
+
+    Args:
+        stl_path (str): The path to the STL file.
+        scale (float):  The factor the vertices are multiplied with. Defaults to 0.001 (mm to m).
+
+    Returns:
+        Tuple[np.ndarray, float]: The center and the radius of the sphere.
+    '''
+    mesh = STL_Mesh(stl_path)
+    lower, upper = mesh.bounds()
+    center = (lower.astype(np.float64) + upper) / 2
+    radius = np.linalg.norm(mesh.vectors.reshape(-1, 3) - center, axis=1).max()
+    return center * scale, float(radius * scale)
+
+def fit_primitive(stl_path: str, scale: float = 0.001) -> Dict:
+    '''
+    Fit the best enclosing primitive (box, cylinder or capsule) to an STL mesh, in the frame of the mesh.
+
+    The primitive frame is given by the principal axes of the surface (z = axis of largest extent, for cylinders
+    and capsules). The fit error is the area-weighted RMS distance of the surface to the primitive's surface,
+    relative to the primitive's largest half-size.
+
+    Args:
+        stl_path (str): The path to the STL file.
+        scale (float):  The factor the vertices are multiplied with. Defaults to 0.001 (mm to m).
+
+    Returns:
+        Dict: The best primitive with the keys 'type', 'size' (Mujoco convention), 'pos', 'quat' (w, x, y, z) and 'error'.
+    '''
+    vectors = STL_Mesh(stl_path).vectors.astype(np.float64) * scale
+    areas = 0.5 * np.linalg.norm(np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0]), axis=1)
+    if areas.sum() == 0:
+        raise ValueError(f"The mesh {stl_path} has no surface area.")
+    centroids = vectors.mean(axis=1)
+
+    # Principal axes of the surface (eigenvalues ascending, so the largest spread is along z)
+    center = (centroids * areas[:, None]).sum(axis=0) / areas.sum()
+    covariance = ((centroids - center) * areas[:, None]).T @ (centroids - center) / areas.sum()
+    _, axes = np.linalg.eigh(covariance)
+    if np.linalg.det(axes) < 0:
+        axes[:, 0] *= -1
+
+    vertices = (vectors.reshape(-1, 3) - center) @ axes
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    middle = (lower + upper) / 2
+    half = (upper - lower) / 2
+    vertices -= middle
+    points = (centroids - center) @ axes - middle
+    radius = np.sqrt(np.max(vertices[:, 0] ** 2 + vertices[:, 1] ** 2))
+    radial = np.sqrt(points[:, 0] ** 2 + points[:, 1] ** 2)
+
+    def box_distance(q: np.ndarray) -> np.ndarray:
+        # Signed distance for the (already offset) coordinates q = |p| - half-sizes
+        return np.linalg.norm(np.maximum(q, 0), axis=1) + np.minimum(q.max(axis=1), 0)
+
+    primitives = []
+    distances = box_distance(np.abs(points) - half)
+    primitives.append({"type": "box", "size": half, "distances": distances, "scale": half.max()})
+
+    distances = box_distance(np.stack([radial - radius, np.abs(points[:, 2]) - half[2]], axis=1))
+    primitives.append({"type": "cylinder", "size": np.array([radius, half[2]]), "distances": distances, "scale": max(radius, half[2])})
+
+    # Shortest capsule (with the cylinder's radius) that still encloses all vertices
+    capsule_half = max(0.0, np.max(np.abs(vertices[:, 2]) - np.sqrt(np.maximum(radius ** 2 - vertices[:, 0] ** 2 - vertices[:, 1] ** 2, 0))))
+    closest = np.zeros_like(points)
+    closest[:, 2] = np.clip(points[:, 2], -capsule_half, capsule_half)
+    distances = np.linalg.norm(points - closest, axis=1) - radius
+    primitives.append({"type": "capsule", "size": np.array([radius, capsule_half]), "distances": distances, "scale": radius + capsule_half})
+
+    for primitive in primitives:
+        primitive["error"] = float(np.sqrt((areas * primitive.pop("distances") ** 2).sum() / areas.sum()) / primitive.pop("scale"))
+    best = min(primitives, key=lambda primitive: primitive["error"])
+
+    best["pos"] = center + axes @ middle
+    best["quat"] = Quaternion(matrix=axes).elements
+    return best
+
+def convert_stl_to_msh(input_file: str, output_file: str, scale: float = 0.001, weld_tolerance: float = 1e-8) -> None:
+    '''
+    Convert an STL file (triangle soup) to an indexed Mujoco binary mesh (.msh) with the scale already applied.
+
+    The .msh format consists of the int32 header (nvertex, nnormal, ntexcoord, nface), followed by the float32
+    vertices and the int32 faces. Normals and texture coordinates are not written (Mujoco computes the normals).
+
+    Args:
+        input_file (str):       The path to the input STL file.
+        output_file (str):      The path to the output .msh file.
+        scale (float):          The factor the vertices are multiplied with. Defaults to 0.001 (mm to m).
+        weld_tolerance (float): The distance (before scaling) below which vertices are merged (see 'weld_vertices').
+    '''
+    vertices, faces = weld_vertices(STL_Mesh(input_file).vectors.reshape(-1, 3), weld_tolerance)
+    vertices = (vertices.astype(np.float64) * scale).astype('<f4')
+    faces = faces.astype('<i4')
+
+    tmp_file = create_tmp_file(output_file)
+    try:
+        with open(tmp_file, 'wb') as file:
+            np.array([len(vertices), 0, 0, len(faces)], dtype='<i4').tofile(file)
+            vertices.tofile(file)
+            faces.tofile(file)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def weld_vertices(vertices: np.ndarray, tolerance: float = 1e-8) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Merge (nearly) coincident vertices of a triangle soup into an indexed mesh.
+
+    Vertices are quantized to integer keys on a grid with spacing 'tolerance'. If the keys fit into 63 bits, they are
+    packed into a single int64 per vertex, otherwise they are hashed into one. Either way a single 1D 'np.unique' replaces
+    the much slower row-wise 'np.unique(axis=0)'.
+
+    Args:
+        vertices (np.ndarray):  The (3n, 3) vertices of n triangles.
+        tolerance (float):      The grid spacing for merging vertices. 0 merges only exactly equal vertices.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (m, 3) unique vertices and the (k, 3) faces (k <= n, faces that collapsed are removed).
+    '''
+    vertices = np.ascontiguousarray(vertices).reshape(-1, 3)
+    if tolerance > 0:
+        keys = np.round(vertices / tolerance).astype(np.int64)
+    else:
+        # Exact comparison on the float bits (+ 0.0 turns -0.0 into 0.0)
+        exact = np.ascontiguousarray(vertices + vertices.dtype.type(0.0))
+        keys = exact.view(np.int32 if exact.dtype == np.float32 else np.int64).astype(np.int64)
+
+    keys -= keys.min(axis=0)
+    bits = [int(key_max).bit_length() for key_max in keys.max(axis=0)]
+    if sum(bits) <= 63:
+        hashes = (keys[:, 0] << (bits[1] + bits[2])) | (keys[:, 1] << bits[2]) | keys[:, 2]
+    else:
+        # Spatial hash (int64 multiplication wraps around), collisions are checked below
+        hashes = (keys[:, 0] * np.int64(73856093)) ^ (keys[:, 1] * np.int64(19349663)) ^ (keys[:, 2] * np.int64(83492791))
+    _, first_indices, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+
+    if not np.array_equal(keys[first_indices][inverse], keys):
+        # Hash collision: fall back to an exact lexicographic sort of the keys
+        order = np.lexsort(keys.T[::-1])
+        sorted_keys = keys[order]
+        is_first = np.ones(len(keys), dtype=bool)
+        is_first[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+        inverse = np.empty(len(keys), dtype=np.int64)
+        inverse[order] = np.cumsum(is_first) - 1
+        first_indices = order[is_first]
+
+    faces = inverse.reshape(-1, 3)
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+    return vertices[first_indices], faces
+
+def quaternion_multiply(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    '''
+    Batched Hamilton product of quaternions.
+
+    Args:
+        q1 (np.ndarray):    The (n, 4) left quaternions in the format [w, x, y, z].
+        q2 (np.ndarray):    The (n, 4) right quaternions in the format [w, x, y, z].
+
+    Returns:
+        np.ndarray: The (n, 4) products q1 * q2.
+    '''
+    w1, x1, y1, z1 = q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3]
+    w2, x2, y2, z2 = q2[..., 0], q2[..., 1], q2[..., 2], q2[..., 3]
+    return np.stack([
+        w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+    ], axis=-1)
+
+def quaternion_inverse(q: np.ndarray) -> np.ndarray:
+    '''
+    Batched inverse of quaternions (conjugate divided by the squared norm).
+
+    Args:
+        q (np.ndarray): The (n, 4) quaternions in the format [w, x, y, z].
+
+    Returns:
+        np.ndarray: The (n, 4) inverse quaternions.
+    '''
+    return q * np.array([1, -1, -1, -1]) / np.sum(q ** 2, axis=-1, keepdims=True)
+
+def quaternion_rotate(q: np.ndarray, v: np.ndarray) -> np.ndarray:
+    '''
+    Batched rotation of vectors by quaternions (normalised first, like 'Quaternion.rotate').
+
+    Args:
+        q (np.ndarray): The (n, 4) quaternions in the format [w, x, y, z].
+        v (np.ndarray): The (n, 3) vectors.
+
+    Returns:
+        np.ndarray: The (n, 3) rotated vectors.
+    '''
+    q = q / np.sqrt(np.sum(q ** 2, axis=-1, keepdims=True))
+    w, x, y, z = q[..., 0:1], q[..., 1:2], q[..., 2:3], q[..., 3:4]
+    vx, vy, vz = v[..., 0:1], v[..., 1:2], v[..., 2:3]
+    # v + 2w (u x v) + 2u x (u x v), with the cross products written out (np.cross is slow for small batches)
+    tx, ty, tz = 2 * (y * vz - z * vy), 2 * (z * vx - x * vz), 2 * (x * vy - y * vx)
+    return np.concatenate([vx + w * tx + y * tz - z * ty, vy + w * ty + z * tx - x * tz, vz + w * tz + x * ty - y * tx], axis=-1)
+
+def file_hash(filepath: str, chunk_size: int = 1 << 20) -> str:
+    '''
+    Calculate the SHA-256 hash of a file's content.
+
+    Args:
+        filepath (str):     The path to the file.
+        chunk_size (int):   The number of bytes read at once. Defaults to 1 MB.
+
+    Returns:
+        str: The hexadecimal SHA-256 hash of the file.
+    '''
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
 def bytes_to_mb(bytes: int) -> float:
     '''
     Convert bytes to megabytes.